@@ -6,6 +6,11 @@ class Dataset:
 
     @staticmethod
     def set_data(data):
+        # The streamed learning sets are already in columns
+        if "data" in data["train"]:
+            Dataset._instance = data
+            return
+
         Dataset._instance = {
             "train" : {
                 "data": {
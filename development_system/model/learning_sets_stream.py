@@ -0,0 +1,128 @@
+import json
+import zlib
+import numpy as np
+from marshmallow import Schema, fields, validate
+
+LEARNING_SETS = ["train", "validation", "test"]
+
+# Features of the streamed columns and the name they take in the Dataset
+FEATURES = {
+    "maximum_pressure_ts": "maximum_pressure_ts",
+    "minimum_pressure_ts": "minimum_pressure_ts",
+    "median_pressure_ts": "median_pressure_ts",
+    "mean_absolute_deviation_pressure_ts": "mean_absolute_deviation_pressure_ts",
+    "activity_and_small_scatter": "activity",
+    "environment_and_small_scatter": "environment"
+}
+
+READ_SIZE = 65536
+
+class HeaderSchema(Schema):
+    number_of_samples = fields.Dict(keys=fields.String(validate=validate.OneOf(LEARNING_SETS)),
+                                    values=fields.Int(validate=validate.Range(min=0)),
+                                    required=True)
+
+class ChunkSchema(Schema):
+    set = fields.String(required=True, validate=validate.OneOf(LEARNING_SETS))
+    # The columns are validated in bulk, not element by element
+    columns = fields.Dict(keys=fields.String(validate=validate.OneOf(list(FEATURES) + ["label"])),
+                          values=fields.List(fields.Raw()), required=True)
+
+# Learning sets sent by the Segregation System as NDJSON, optionally gzip-compressed.
+# The first line holds the number of samples of each set, every following line a chunk of
+# columns of one set. Chunks are decoded and validated as they arrive, and the result is in
+# the columnar form used by the Dataset.
+class LearningSetsStream:
+
+    def __init__(self):
+        self._header_schema = HeaderSchema()
+        self._chunk_schema = ChunkSchema()
+
+    def read(self, stream, compressed):
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) if compressed else None
+        header = None
+        chunks = {category: [] for category in LEARNING_SETS}
+        pending = b""
+
+        while True:
+            data = stream.read(READ_SIZE)
+            if not data:
+                break
+            if decompressor is not None:
+                try:
+                    data = decompressor.decompress(data)
+                except zlib.error as e:
+                    raise ValueError(f"invalid gzip stream: {e}")
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                header = self._read_line(line, header, chunks)
+
+        if decompressor is not None:
+            if not decompressor.eof:
+                raise ValueError("truncated gzip stream")
+            pending += decompressor.flush()
+        header = self._read_line(pending, header, chunks)
+
+        if header is None:
+            raise ValueError("missing header")
+        return self._build_dataset(header, chunks)
+
+    def _read_line(self, line, header, chunks):
+        if not line.strip():
+            return header
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"invalid JSON line: {e}")
+
+        if header is None:
+            errors = self._header_schema.validate(message)
+            if errors:
+                raise ValueError(f"invalid header: {errors}")
+            return message["number_of_samples"]
+
+        errors = self._chunk_schema.validate(message)
+        if errors:
+            raise ValueError(f"invalid chunk: {errors}")
+        chunks[message["set"]].append(self._read_chunk(message["columns"]))
+        return header
+
+    @staticmethod
+    def _read_chunk(columns):
+        missing = [name for name in list(FEATURES) + ["label"] if name not in columns]
+        if missing:
+            raise ValueError(f"missing columns: {missing}")
+
+        labels = columns["label"]
+        if not all(isinstance(label, str) for label in labels):
+            raise ValueError("labels must be strings")
+
+        chunk = {"labels": labels}
+        for name in FEATURES:
+            try:
+                values = np.asarray(columns[name], dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must contain numbers")
+            if values.ndim != 1 or len(values) != len(labels) or not np.isfinite(values).all():
+                raise ValueError(f"{name} must contain one finite number for each label")
+            chunk[name] = values
+        return chunk
+
+    @staticmethod
+    def _build_dataset(header, chunks):
+        dataset = {}
+        for category in LEARNING_SETS:
+            received = chunks[category]
+            samples = sum(len(chunk["labels"]) for chunk in received)
+            if samples != header.get(category, 0):
+                raise ValueError(f"{category} has {samples} samples, "
+                                 f"{header.get(category, 0)} expected")
+
+            data = {}
+            for name, key in FEATURES.items():
+                data[key] = np.concatenate([chunk[name] for chunk in received]) \
+                    if received else np.empty(0)
+            labels = [label for chunk in received for label in chunk["labels"]]
+            dataset[category] = {"data": data, "labels": labels}
+        return dataset
@@ -10,6 +10,7 @@ from datetime import datetime
 
 from config.constants import CLASSIFIER_DIRECTORY_PATH
 from model.msg_configuration import MessageConfiguration
+from model.learning_sets_stream import LearningSetsStream
 from marshmallow import Schema, fields
 
 log = logging.getLogger('werkzeug')
@@ -112,6 +113,19 @@ def start_app():
 
 @app.post('/senddata')
 def post_json():
+    # The learning sets can be streamed as NDJSON columns, decoded while they are received
+    if request.mimetype == 'application/x-ndjson':
+        compressed = request.headers.get('Content-Encoding', '') == 'gzip'
+        try:
+            received_dataset = LearningSetsStream().read(request.stream, compressed)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        print("[INFO] Received stream validated")
+        receive_thread = Thread(target=MessageManager.get_instance().send_to_main, args=(received_dataset,))
+        receive_thread.start()
+        return {}, 200
+
     if request.json is None:
         return {'error': 'No Payload Received'}, 500
 
@@ -0,0 +1,228 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+'''
+Module Name: IngestionBenchmark
+Description: Throughput and latency benchmark of the Ingestion System.
+Synthetic sessions of 1236 samples are fed in-process to the RawSessionsStore
+and to the ingestion loop (IngestionSystem.handle_record) following the ideal,
+real (records and samples dropped) and interleaved patterns.
+Every scenario runs in a fresh process, so that its peak RSS is not the one of
+the scenarios run before it.
+The results are emitted as JSON so that they can be compared across commits.
+Run it from the ingestion_system folder: python -m benchmark.ingestion_benchmark [-h]
+'''
+
+# The configuration reads the operative mode from the environment
+os.environ.setdefault('OPERATIVE_MODE', 'development')
+os.environ.setdefault('EVALUATION', '0')
+
+# pylint: disable=wrong-import-position
+from src.raw_sessions_store import RawSessionsStore, NUM_COLUMNS
+from src.ingestion_system import IngestionSystem
+
+PATTERNS = ['ideal', 'real', 'interleaved']
+TARGETS = ['store', 'loop']
+RECORD_DROP_PROBABILITY = 0.1
+SAMPLE_DROP_PROBABILITY = 0.1
+INTERLEAVED_WINDOW = 50
+
+
+class BenchmarkIngestionSystem(IngestionSystem):
+    """
+    Ingestion System whose outbound messages are counted instead of being sent
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.sent = {'preparation': 0, 'evaluation': 0}
+
+    def send(self, data: dict, dest_system: str) -> bool:
+        self.sent[dest_system] += 1
+        return True
+
+
+def generate_records(pattern: str, sessions: int, seed: int = 42) -> list:
+    """
+    Generates the records of synthetic sessions
+    :param pattern: ideal, real or interleaved
+    :param sessions: number of sessions to generate
+    :param seed: seed of the random generator
+    :return: list of records in the order they are received
+    """
+    rng = random.Random(seed)
+    generated = []
+    for i in range(sessions):
+        uuid = f'{pattern}-{i}'
+        time_series = [round(rng.uniform(0, 3.5), 3) for _ in range(NUM_COLUMNS)]
+        session = [
+            {'uuid': uuid, 'environment': rng.choice(['slippery', 'plain', 'slope', 'house'])},
+            {'uuid': uuid, 'calendar': rng.choice(['sport', 'shopping', 'cooking', 'gaming'])},
+            {'uuid': uuid, 'pressure_detected': rng.choice(['Regular', 'Anomalous'])},
+            {'uuid': uuid, 'time_series': time_series}
+        ]
+        if pattern == 'real':
+            if rng.random() < SAMPLE_DROP_PROBABILITY:
+                time_series[rng.randrange(3, NUM_COLUMNS - 3)] = None
+            if rng.random() < RECORD_DROP_PROBABILITY:
+                # As the Input System does, the value of one record is lost
+                record = rng.choice(session)
+                record[[key for key in record if key != 'uuid'][0]] = None
+        generated.append(session)
+
+    if pattern != 'interleaved':
+        return [record for session in generated for record in session]
+
+    # Records of INTERLEAVED_WINDOW consecutive sessions are mixed together
+    records = []
+    for start in range(0, sessions, INTERLEAVED_WINDOW):
+        window = [record for session in generated[start:start + INTERLEAVED_WINDOW] \
+                  for record in session]
+        rng.shuffle(window)
+        records += window
+    return records
+
+
+def percentiles(latencies: list) -> dict:
+    """
+    :param latencies: per-record latencies in seconds
+    :return: p50, p95 and p99 latencies in microseconds
+    """
+    values = np.array(latencies) * 1e6
+    return {f'p{p}_us': float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def database_bytes(db_path: str) -> int:
+    """
+    :return: size of the database and of its WAL and rollback journal files
+    """
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal', db_path + '-journal') \
+               if os.path.exists(path))
+
+
+def run_store(records: list, db_path: str) -> tuple:
+    """
+    Feeds the records to the RawSessionsStore as the ingestion loop did before
+    the in-memory assembler: store, completeness check, load and delete
+    :return: per-record latencies and number of sessions completed
+    """
+    store = RawSessionsStore(db_path=db_path)
+    latencies = []
+    completed = 0
+    for record in records:
+        start = time.perf_counter()
+        if store.store_record(record=record) and \
+                store.is_session_complete(uuid=record['uuid'], last_missing_sample=False, \
+                                          evaluation=False):
+            store.load_raw_session(uuid=record['uuid'])
+            store.delete_raw_session(uuid=record['uuid'])
+            completed += 1
+        latencies.append(time.perf_counter() - start)
+    store.close_connection()
+    return latencies, completed
+
+
+def run_loop(records: list, db_path: str) -> tuple:
+    """
+    Feeds the records to the ingestion loop, with the write-behind journal if configured
+    :return: per-record latencies and number of sessions sent to the Preparation System
+    """
+    system = BenchmarkIngestionSystem()
+    system.start_assembly(db_path=db_path)
+    latencies = []
+    for record in records:
+        start = time.perf_counter()
+        system.handle_record(record=record)
+        system.expire_sessions()
+        latencies.append(time.perf_counter() - start)
+    # Close the sessions still waiting for a missing record
+    system.expire_sessions(now=float('inf'))
+    if system.session_assembler.journal is not None:
+        system.session_assembler.journal.close()
+    return latencies, system.sent['preparation']
+
+
+def run_benchmark(pattern: str, target: str, sessions: int) -> dict:
+    """
+    Runs a pattern against a target
+    :return: dictionary containing the measures
+    """
+    records = generate_records(pattern, sessions)
+    runner = run_store if target == 'store' else run_loop
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'benchmark.db')
+        start = time.perf_counter()
+        latencies, completed = runner(records, db_path)
+        elapsed = time.perf_counter() - start
+        db_size = database_bytes(db_path)
+
+    result = {
+        'pattern': pattern,
+        'target': target,
+        'sessions': sessions,
+        'records': len(records),
+        'sessions_completed': completed,
+        'sessions_per_second': completed / elapsed,
+        'records_per_second': len(records) / elapsed,
+        'sqlite_file_bytes': db_size,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    result.update(percentiles(latencies))
+    return result
+
+
+def run_isolated(pattern: str, target: str, sessions: int) -> dict:
+    """
+    Runs a scenario in the current process with the prints and logs of the system disabled
+    :return: dictionary containing the measures
+    """
+    # The system prints and logs for every record, keep it out of the measures
+    logging.disable(logging.CRITICAL)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_benchmark(pattern, target, sessions)
+
+
+def main() -> None:
+    """
+    Runs the benchmark suite and emits the results as JSON
+    """
+    parser = argparse.ArgumentParser(description='Ingestion System benchmark')
+    parser.add_argument('--sessions', type=int, default=200, help='sessions per pattern')
+    parser.add_argument('--patterns', nargs='+', choices=PATTERNS, default=PATTERNS)
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=TARGETS)
+    parser.add_argument('--output', help='file where the JSON results are written')
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for pattern in args.patterns:
+        for target in args.targets:
+            # A new process for each scenario: ru_maxrss is the peak of the whole process
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(run_isolated, pattern, target, \
+                                               args.sessions).result())
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import sys
+import json
+import time
+import random
+from src.raw_sessions_store import NUM_COLUMNS
+from src.session_assembler import SessionAssembler
+from src.session_tracker import SessionTracker
+
+'''
+Module Name: InterleavedSessionsBenchmark
+Description: Feeds the records of many interleaved sessions to the SessionAssembler
+and the SessionTracker, as IngestionSystem.run does, and checks that every session
+is closed correctly. The previous single cursor (last_uuid_received) logic is run
+on the same records for comparison.
+Run it from the ingestion_system folder: python -m benchmark.interleaved_sessions_benchmark [sessions]
+'''
+
+DEFAULT_SESSIONS = 1000
+SESSION_TIMEOUT = 1.0
+SESSION_START_STEP = 0.002
+RECORD_SPREAD = 0.5
+DROP_PROBABILITY = 0.1
+
+
+def generate_records(sessions: int, seed: int = 42) -> tuple:
+    """
+    Generates the records of interleaved sessions, some of them lose one record
+    :param sessions: number of sessions to generate
+    :param seed: seed of the random generator
+    :return: records as (timestamp, record) pairs sorted by timestamp,
+    and expected outcome ('complete', 'missing_sample' or 'discarded') of every session
+    """
+    rng = random.Random(seed)
+    records = []
+    expected = {}
+    for i in range(sessions):
+        uuid = f'interleaved-{i}'
+        session = [
+            {'uuid': uuid, 'environment': 'plain'},
+            {'uuid': uuid, 'calendar': 'sport'},
+            {'uuid': uuid, 'pressure_detected': 'Regular'},
+            {'uuid': uuid, 'time_series': [round(rng.uniform(0, 3.5), 3) \
+                                           for _ in range(NUM_COLUMNS)]}
+        ]
+        expected[uuid] = 'complete'
+        if rng.random() < DROP_PROBABILITY:
+            dropped = rng.randrange(len(session))
+            session.pop(dropped)
+            # Without the time series the session is still closed by its deadline
+            expected[uuid] = 'missing_sample' if dropped == 3 else 'discarded'
+        start = i * SESSION_START_STEP
+        records += [(start + rng.uniform(0, RECORD_SPREAD), record) for record in session]
+    records.sort(key=lambda item: item[0])
+    return records, expected
+
+
+def run_tracker(records: list) -> tuple:
+    """
+    Closes the sessions with the SessionAssembler and the SessionTracker
+    :param records: records generated by generate_records
+    :return: outcome of every session and elapsed seconds
+    """
+    assembler = SessionAssembler(operative_mode='development')
+    tracker = SessionTracker(session_timeout=SESSION_TIMEOUT)
+    outcome = {}
+    start = time.perf_counter()
+    for now, record in records:
+        uuid = record['uuid']
+        assembler.add_record(record=record)
+        if assembler.is_session_complete(uuid=uuid, last_missing_sample=False, evaluation=False):
+            tracker.remove(uuid)
+            raw_session = assembler.pop_raw_session(uuid=uuid)
+            outcome[uuid] = 'complete' if len(raw_session['time_series']) == NUM_COLUMNS \
+                else 'corrupted'
+        else:
+            tracker.touch(uuid, now=now)
+        for expired in tracker.pop_expired(now=now):
+            if assembler.is_session_complete(uuid=expired, last_missing_sample=True, \
+                                             evaluation=False):
+                assembler.pop_raw_session(uuid=expired)
+                outcome[expired] = 'missing_sample'
+            else:
+                assembler.delete_raw_session(uuid=expired)
+                outcome[expired] = 'discarded'
+    # Drain the sessions still waiting for their deadline
+    for expired in tracker.pop_expired(now=float('inf')):
+        if assembler.is_session_complete(uuid=expired, last_missing_sample=True, evaluation=False):
+            outcome[expired] = 'missing_sample'
+        else:
+            outcome[expired] = 'discarded'
+    return outcome, time.perf_counter() - start
+
+
+def run_cursor(records: list) -> tuple:
+    """
+    Closes the sessions with the previous last_uuid_received cursor logic
+    :param records: records generated by generate_records
+    :return: outcome of every session and elapsed seconds
+    """
+    assembler = SessionAssembler(operative_mode='development')
+    outcome = {}
+    last_uuid_received = None
+    start = time.perf_counter()
+    for _, record in records:
+        uuid = record['uuid']
+        if uuid in outcome:
+            # The session has already been closed, the record is a leftover
+            outcome[uuid] = 'corrupted'
+        assembler.add_record(record=record)
+        if last_uuid_received is None:
+            last_uuid_received = uuid
+            continue
+        if last_uuid_received == uuid:
+            if assembler.is_session_complete(uuid=uuid, last_missing_sample=False, \
+                                             evaluation=False):
+                assembler.pop_raw_session(uuid=uuid)
+                outcome[uuid] = 'complete'
+                last_uuid_received = None
+            continue
+        previous = last_uuid_received
+        last_uuid_received = uuid
+        if assembler.is_session_complete(uuid=previous, last_missing_sample=True, \
+                                         evaluation=False):
+            assembler.pop_raw_session(uuid=previous)
+            outcome[previous] = 'missing_sample'
+            last_uuid_received = None
+        else:
+            assembler.delete_raw_session(uuid=previous)
+            outcome[previous] = 'discarded'
+    return outcome, time.perf_counter() - start
+
+
+def score(name: str, outcome: dict, expected: dict, elapsed: float, records: int) -> dict:
+    """
+    Compares the outcome of a run with the expected one
+    :return: dictionary containing the measures
+    """
+    correct = sum(1 for uuid, result in expected.items() if outcome.get(uuid) == result)
+    return {
+        'logic': name,
+        'sessions': len(expected),
+        'sessions_correct': correct,
+        'sessions_wrong': len(expected) - correct,
+        'records_per_second': records / elapsed,
+        'sessions_per_second': len(expected) / elapsed
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark and prints the results
+    """
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SESSIONS
+    records, expected = generate_records(sessions)
+    results = []
+    for name, run in (('cursor', run_cursor), ('tracker', run_tracker)):
+        outcome, elapsed = run(records)
+        results.append(score(name, outcome, expected, elapsed, len(records)))
+
+    for result in results:
+        print(f"[+] {result['logic']:>7}: {result['sessions_correct']}/{result['sessions']} "
+              f"sessions closed correctly, {result['records_per_second']:.1f} records/s, "
+              f"{result['sessions_per_second']:.1f} sessions/s")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+from src.raw_sessions_store import RawSessionsStore, RECORD_TYPE, NUM_COLUMNS
+
+'''
+Module Name: RawSessionsStoreBenchmark
+Description: Compares the row write and load throughput of the packed BLOB
+layout of the RawSessionsStore against the previous wide table layout
+(one time_series_N TEXT column per sample).
+Run it from the ingestion_system folder: python -m benchmark.raw_sessions_store_benchmark [sessions]
+'''
+
+DEFAULT_SESSIONS = 500
+
+
+class WideTableStore:
+    """
+    Previous layout of the Raw Sessions Store, kept only as a baseline for the benchmark
+    """
+    def __init__(self, db_path: str) -> None:
+        """
+        Creates the wide raw_session table
+        :param db_path: path of the sqlite3 database
+        """
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        series_columns = ''.join(f'{RECORD_TYPE[3]}_{i} TEXT, ' for i in range(1, NUM_COLUMNS + 1))
+        self.conn.execute('CREATE TABLE raw_session (uuid TEXT NOT NULL, calendar TEXT, ' \
+                          'pressure_detected TEXT, environment TEXT, ' + series_columns + \
+                          'UNIQUE(uuid), PRIMARY KEY (uuid))')
+        self.conn.commit()
+        series_names = ','.join(f'{RECORD_TYPE[3]}_{i}' for i in range(1, NUM_COLUMNS + 1))
+        self.insert_query = 'INSERT INTO raw_session (uuid, calendar, pressure_detected, ' \
+                            'environment, ' + series_names + ') VALUES (' \
+                            + ','.join(['?'] * (NUM_COLUMNS + 4)) + ')'
+        self.update_series_query = 'UPDATE raw_session SET ' + \
+            ', '.join(f'{RECORD_TYPE[3]}_{i} = ?' for i in range(1, NUM_COLUMNS + 1)) + \
+            ' WHERE uuid = ?'
+
+    def store_record(self, record: dict, record_type: str) -> None:
+        """
+        Stores a record as the previous RawSessionsStore.store_record did (validation excluded)
+        :param record: record to store
+        :param record_type: type of the record
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(1) FROM raw_session WHERE uuid = ?', (record['uuid'], ))
+        exists = cursor.fetchone()[0] != 0
+        if exists and record_type == RECORD_TYPE[3]:
+            cursor.execute(self.update_series_query, record[record_type] + [record['uuid']])
+        elif exists:
+            cursor.execute('UPDATE raw_session SET ' + record_type + ' = ? WHERE uuid = ?', \
+                           (record[record_type], record['uuid']))
+        else:
+            parameters = {'uuid': record['uuid'], 'calendar': None, 'pressure_detected': None,
+                          'environment': None, 'time_series': [None] * NUM_COLUMNS}
+            parameters[record_type] = record[record_type]
+            values = list(parameters.values())
+            cursor.execute(self.insert_query, tuple(values[0:-1] + values[-1]))
+        self.conn.commit()
+
+    def load_raw_session(self, uuid: str) -> dict:
+        """
+        Loads a Raw Session as the previous RawSessionsStore.load_raw_session did
+        :param uuid: string that identifies the Raw Session
+        :return: dictionary representing the loaded Raw Session
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM raw_session WHERE uuid = ?', (uuid, ))
+        result = cursor.fetchone()
+        return {
+            'uuid': result[0],
+            'calendar': result[1],
+            'pressure_detected': result[2] if result[2] is not None else 'None',
+            'environment': result[3],
+            'time_series': [json.loads(ts) for ts in result[4:] if ts is not None]
+        }
+
+
+def generate_sessions(sessions: int, seed: int = 42) -> list:
+    """
+    Generates synthetic sessions as lists of records
+    :param sessions: number of sessions to generate
+    :param seed: seed of the random generator
+    :return: list of sessions, each one is a list of (record_type, record) pairs
+    """
+    rng = random.Random(seed)
+    generated = []
+    for i in range(sessions):
+        uuid = f'benchmark-{i}'
+        time_series = [round(rng.uniform(0, 3.5), 3) for _ in range(NUM_COLUMNS)]
+        generated.append([
+            ('environment', {'uuid': uuid, 'environment': rng.choice(['plain', 'slope', 'house'])}),
+            ('calendar', {'uuid': uuid, 'calendar': rng.choice(['sport', 'gaming', 'cooking'])}),
+            ('pressure_detected', {'uuid': uuid, 'pressure_detected': 'Regular'}),
+            ('time_series', {'uuid': uuid, 'time_series': time_series})
+        ])
+    return generated
+
+
+def run_layout(name: str, write, load, sessions: list, db_path: str) -> dict:
+    """
+    Measures the write and load throughput of a layout
+    :param name: name of the layout
+    :param write: function storing a record given its type
+    :param load: function loading a Raw Session given its uuid
+    :param sessions: sessions generated by generate_sessions
+    :param db_path: path of the database used by the layout
+    :return: dictionary containing the measures
+    """
+    records = [record for session in sessions for record in session]
+    start = time.perf_counter()
+    for record_type, record in records:
+        write(record=record, record_type=record_type)
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for session in sessions:
+        load(session[0][1]['uuid'])
+    load_time = time.perf_counter() - start
+
+    db_size = sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') \
+                  if os.path.exists(path))
+    return {
+        'layout': name,
+        'records_written_per_second': len(records) / write_time,
+        'sessions_loaded_per_second': len(sessions) / load_time,
+        'db_bytes': db_size
+    }
+
+
+def main() -> None:
+    """
+    Runs the benchmark and prints the results
+    """
+    sessions = generate_sessions(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SESSIONS)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wide_path = os.path.join(tmp_dir, 'wide.db')
+        wide = WideTableStore(wide_path)
+        results.append(run_layout('wide', wide.store_record, wide.load_raw_session, \
+                                  sessions, wide_path))
+        wide.conn.close()
+
+        blob_path = os.path.join(tmp_dir, 'blob.db')
+        blob = RawSessionsStore(db_path=blob_path)
+
+        def write_blob(record: dict, record_type: str) -> None:
+            if record_type == RECORD_TYPE[3]:
+                blob.store_time_series(uuid=record['uuid'], time_series=record[record_type])
+            else:
+                blob.upsert_header(record=record, column_to_set=record_type)
+
+        results.append(run_layout('blob', write_blob, blob.load_raw_session, \
+                                  sessions, blob_path))
+        blob.close_connection()
+
+    for result in results:
+        print(f"[+] {result['layout']:>5}: "
+              f"{result['records_written_per_second']:10.1f} records/s written, "
+              f"{result['sessions_loaded_per_second']:10.1f} sessions/s loaded, "
+              f"{result['db_bytes']} bytes on disk")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import sys
+import json
+import time
+import random
+from src.raw_sessions_store import NUM_COLUMNS
+from src.time_series_codec import TimeSeriesCodec
+
+'''
+Module Name: WireFormatBenchmark
+Description: Compares the JSON list of samples with the base64 float32 encoding
+of the time series sent from the Ingestion System to the Preparation System:
+payload size, serialization cost on the ingestion side and parsing cost
+(including the sample type check) on the preparation side.
+Run it from the ingestion_system folder: python -m benchmark.wire_format_benchmark [sessions]
+'''
+
+DEFAULT_SESSIONS = 500
+MISSING_PROBABILITY = 0.01
+# Types of the samples of a valid time series, as checked by the Preparation System
+SAMPLE_TYPES = {int, float, type(None)}
+
+
+def generate_raw_sessions(sessions: int, decimals: int, seed: int = 42) -> list:
+    """
+    Generates raw sessions with some missing samples
+    :param sessions: number of raw sessions to generate
+    :param decimals: decimals of the samples, None for full precision
+    :param seed: seed of the random generator
+    :return: list of raw sessions
+    """
+    rng = random.Random(seed)
+    raw_sessions = []
+    for i in range(sessions):
+        time_series = []
+        for _ in range(NUM_COLUMNS):
+            sample = rng.uniform(0, 3.5)
+            if decimals is not None:
+                sample = round(sample, decimals)
+            time_series.append(None if rng.random() < MISSING_PROBABILITY else sample)
+        raw_sessions.append({'uuid': f'wire-{i}', 'calendar': 'sport', 'environment': 'plain',
+                             'pressure_detected': 'Regular', 'time_series': time_series})
+    return raw_sessions
+
+
+def serialize(raw_sessions: list, encode: bool) -> tuple:
+    """
+    Serializes the raw sessions as the Ingestion System sends them
+    :param raw_sessions: list of raw sessions
+    :param encode: True to encode the time series
+    :return: list of payloads and seconds spent
+    """
+    start = time.perf_counter()
+    payloads = []
+    for raw_session in raw_sessions:
+        if encode:
+            raw_session = dict(raw_session, time_series=TimeSeriesCodec.encode(raw_session['time_series']))
+        payloads.append(json.dumps(raw_session).encode('utf-8'))
+    return payloads, time.perf_counter() - start
+
+
+def parse(payloads: list, encoded: bool) -> tuple:
+    """
+    Parses the payloads as the Preparation System does, up to the sample type check
+    :param payloads: list of payloads
+    :param encoded: True if the time series are encoded
+    :return: list of raw sessions and seconds spent
+    """
+    start = time.perf_counter()
+    raw_sessions = []
+    for payload in payloads:
+        raw_session = json.loads(payload)
+        if encoded:
+            raw_session['time_series'] = TimeSeriesCodec.decode(raw_session['time_series'])
+        if not set(map(type, raw_session['time_series'])) <= SAMPLE_TYPES:
+            raise ValueError('Invalid time series')
+        raw_sessions.append(raw_session)
+    return raw_sessions, time.perf_counter() - start
+
+
+def max_error(expected: list, received: list) -> float:
+    """
+    :param expected: raw sessions sent
+    :param received: raw sessions parsed
+    :return: maximum absolute difference between the samples, inf if a missing sample is lost
+    """
+    error = 0.0
+    for sent, parsed in zip(expected, received):
+        for a, b in zip(sent['time_series'], parsed['time_series']):
+            if (a is None) != (b is None):
+                return float('inf')
+            if a is not None:
+                error = max(error, abs(a - b))
+    return error
+
+
+def run(raw_sessions: list, name: str) -> dict:
+    """
+    Measures both wire formats on the same raw sessions
+    :param raw_sessions: list of raw sessions
+    :param name: name of the data set
+    :return: dictionary with the results
+    """
+    result = {'data': name, 'sessions': len(raw_sessions)}
+    for wire_format, encoded in (('json', False), ('base64_float32', True)):
+        payloads, serialize_time = serialize(raw_sessions, encoded)
+        parsed, parse_time = parse(payloads, encoded)
+        result[wire_format] = {
+            'bytes_per_session': sum(len(payload) for payload in payloads) / len(payloads),
+            'serialize_us_per_session': serialize_time / len(payloads) * 1e6,
+            'parse_us_per_session': parse_time / len(payloads) * 1e6,
+            'max_abs_error': max_error(raw_sessions, parsed)
+        }
+    json_result = result['json']
+    encoded_result = result['base64_float32']
+    result['size_ratio'] = encoded_result['bytes_per_session'] / json_result['bytes_per_session']
+    result['serialize_speedup'] = \
+        json_result['serialize_us_per_session'] / encoded_result['serialize_us_per_session']
+    result['parse_speedup'] = \
+        json_result['parse_us_per_session'] / encoded_result['parse_us_per_session']
+    return result
+
+
+def main() -> None:
+    """
+    Runs the benchmark and prints the results
+    """
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SESSIONS
+    results = [run(generate_raw_sessions(sessions, 3), '3_decimals'),
+               run(generate_raw_sessions(sessions, None), 'full_precision')]
+    for result in results:
+        print(f"[+] {result['data']}: payload x{result['size_ratio']:.2f}, "
+              f"serialization x{result['serialize_speedup']:.1f} faster, "
+              f"parsing x{result['parse_speedup']:.1f} faster, "
+              f"max error {result['base64_float32']['max_abs_error']:.2e}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,9 @@ import time
 from threading import Thread
 from jsonschema import ValidationError
 from src.raw_session_integrity import RawSessionIntegrity
-from src.raw_sessions_store import RawSessionsStore
+from src.raw_sessions_journal import RawSessionsJournal
+from src.session_assembler import SessionAssembler
+from src.session_tracker import SessionTracker
 from src.ingestion_system_configuration import IngestionSystemConfiguration
 from src.json_io import JsonIO
 
@@ -31,7 +33,9 @@ class IngestionSystem:
         except ValidationError:
             logging.error('Error during the Ingestion System initialization phase')
             sys.exit(1)
-        self.last_uuid_received = None
+        self.session_assembler = None
+        self.session_tracker = None
+        self.raw_session_integrity = None
         self.evaluation = bool(int(os.getenv('EVALUATION')))
         self.evaluation_phase = bool(int(os.getenv('EVALUATION')))
         self.sessions_to_evaluation = 0
@@ -45,107 +49,153 @@ class IngestionSystem:
         """
         print(f'[+] The configuration is valid, {self.operative_mode} mode')
 
-        # Create an instance of RawSessionsStore
-        raw_sessions_store = RawSessionsStore()
-        # Create an instance of RawSessionIntegrity
-        raw_session_integrity = RawSessionIntegrity()
+        self.start_assembly()
         # Run REST server
         listener = Thread(target=JsonIO.get_instance().listen, args=('0.0.0.0', 4000), daemon=True)
         listener.start()
         #while JsonIO.get_instance().receive() is False:
         #    time.sleep(3)
         while True:
-            # Wait for a new record
-            received_record = JsonIO.get_instance().receive()
-            if isinstance(received_record, bool):
-                continue
-            print('received record: {}'.format(received_record))
-
-            last_missing_sample = False
-            if raw_sessions_store.store_record(record=received_record):
-                if self.last_uuid_received is not None:
-                    if self.last_uuid_received == received_record['uuid']:
-                        # Check on the current session
-                        session_complete = raw_sessions_store. \
-                        is_session_complete(uuid=received_record['uuid'], \
-                                            last_missing_sample=False, \
-                                            evaluation=self.evaluation)
-                        uuid = received_record['uuid']
-                    else:
-                        # Check on the previous session because of a missing sample
-                        print(f'Raw Session {self.last_uuid_received} missing sample detected')
-                        session_complete = raw_sessions_store. \
-                                            is_session_complete(uuid=self.last_uuid_received, \
-                                                                last_missing_sample=True, \
-                                                                evaluation=self.evaluation)
-                        uuid = self.last_uuid_received
-                        self.last_uuid_received = received_record['uuid']
-                        last_missing_sample = True
-
-                    if session_complete:
-                        # If the session is complete there is no need for the next record to test"
-                        self.last_uuid_received = None
-                        print(f'Raw Session {uuid} complete')
-
-                        # Load Raw Session from the Data Store
-                        raw_session = raw_sessions_store.load_raw_session(uuid=uuid)
-
-                        if raw_session['uuid'] is None:
-                            print(f'Raw Session {self.last_uuid_received} failed to be loaded')
-                            continue
-
-                        # Delete Raw Session from the Data Store
-                        raw_sessions_store.delete_raw_session(uuid=uuid)
-
-                        # Check Raw Session integrity
-                        good_session = raw_session_integrity. \
-                        mark_missing_samples(time_series=raw_session['time_series'])
-
-                        if good_session:
-                            # Send Raw Session to the Preparation System
-                            sent_to_preparation = JsonIO.get_instance(). \
-                                                send(data=raw_session, \
-                                                dest_system="preparation")
-
-                            if sent_to_preparation:
-                                print(f'Raw Session {uuid} sent to the Preparation System')
-
-                            if self.evaluation:
-                                # Send Raw Session to the Evaluation System
-                                label = {'uuid': raw_session['uuid'], \
-                                        'label': raw_session['pressure_detected']}
-                                sent_to_evaluation = JsonIO.get_instance(). \
-                                                        send( data=label, \
-                                                            dest_system="evaluation")
-                                if sent_to_evaluation:
-                                    print(f'Label {raw_session["pressure_detected"]} sent to the evaluation System')
-                                    self.sessions_to_evaluation += 1
-                                    print(f'Labels to sent to the evaluation System: {self.sessions_to_evaluation}')
-                                    if self.sessions_to_evaluation == self.configuration.evaluation_window:
-                                        self.sessions_to_evaluation = 0
-                                        self.evaluation = False
-                                        print('Evaluation phase ended')
-                            else:
-                                if self.operative_mode == 'production':
-                                    self.sessions_to_produce += 1
-                                    print(f'Sessions executed: {self.sessions_to_produce}')
-
-                                    if self.sessions_to_produce == self.configuration.production_window and self.evaluation_phase:
-                                        self.evaluation = True
-                                        self.sessions_to_produce = 0
-                                        logging.info('Entering in evaluation phase')
-                                        print('Entering in evaluation phase')
-                        else:
-                            logging.error('Raw Session %s discarded, threshold not satisfied', \
-                                         uuid)
-                    else:
-                        if last_missing_sample:
-                            logging.error('Raw Session %s not complete [no recovery possible]', \
-                                          uuid)
-                            # Session not complete (meaning that some required record is missing)
-                            # The system will not receive any other record
-                            # related to this session (lost) so it must be delete from the store
-                            raw_sessions_store.delete_raw_session(uuid=uuid)
-                            self.last_uuid_received = None
-                else:
-                    self.last_uuid_received = received_record['uuid']
+            # Wait for a new record, at most until the next session deadline
+            received_record = JsonIO.get_instance(). \
+                receive(timeout=self.session_tracker.time_to_next_deadline())
+            if isinstance(received_record, list):
+                # Batch of records received on the /records endpoint
+                for record in received_record:
+                    self.handle_record(record=record)
+            elif received_record is not None and not isinstance(received_record, bool):
+                self.handle_record(record=received_record)
+            self.expire_sessions()
+
+    def start_assembly(self, db_path: str = None) -> None:
+        """
+        Creates the components that assemble the Raw Sessions and restores
+        the sessions left in the journal by a previous run
+        :param db_path: path of the journal database, the configured db_name is used if not set
+        """
+        # Create an instance of SessionAssembler, the Raw Sessions Store
+        # is only written behind it as a journal for crash recovery
+        journal = None
+        recovered_sessions = []
+        if self.configuration.write_behind_journal:
+            resume = self.configuration.recovery
+            if resume:
+                # Rebuild the sessions that were being assembled before the restart
+                recovered_sessions = RawSessionsJournal. \
+                    recover(horizon=self.configuration.recovery_horizon, db_path=db_path)
+            journal = RawSessionsJournal(db_path=db_path, resume=resume)
+            JsonIO.get_instance().add_metrics('raw_sessions_journal', journal.get_commit_statistics)
+        self.session_assembler = SessionAssembler(operative_mode=self.operative_mode, \
+                                                  journal=journal)
+        # Create an instance of SessionTracker for the inactivity deadlines of the sessions
+        self.session_tracker = SessionTracker(session_timeout=self.configuration.session_timeout)
+        # Create an instance of RawSessionIntegrity
+        self.raw_session_integrity = RawSessionIntegrity()
+        for session in recovered_sessions:
+            self.session_assembler.restore_session(session)
+            if self.session_assembler.is_session_complete(uuid=session['uuid'], \
+                                                          last_missing_sample=False, \
+                                                          evaluation=self.evaluation):
+                self.process_raw_session(uuid=session['uuid'])
+            else:
+                self.session_tracker.touch(session['uuid'])
+
+    def handle_record(self, record: dict) -> None:
+        """
+        Adds a record to its Raw Session and processes the session if it is complete
+        :param record: received record
+        """
+        if not self.session_assembler.add_record(record=record):
+            return
+
+        uuid = record['uuid']
+        if self.session_assembler.is_session_complete(uuid=uuid, last_missing_sample=False, \
+                                                      evaluation=self.evaluation):
+            # If the session is complete there is no need to wait for other records
+            self.session_tracker.remove(uuid)
+            print(f'Raw Session {uuid} complete')
+            self.process_raw_session(uuid=uuid)
+        else:
+            self.session_tracker.touch(uuid)
+
+    def expire_sessions(self, now: float = None) -> None:
+        """
+        Closes the sessions that did not receive any record before their deadline
+        :param now: current monotonic time, time.monotonic() if not set
+        """
+        for uuid in self.session_tracker.pop_expired(now=now):
+            # No more records related to this session will be received
+            print(f'Raw Session {uuid} missing sample detected')
+            if self.session_assembler.is_session_complete(uuid=uuid, last_missing_sample=True, \
+                                                          evaluation=self.evaluation):
+                print(f'Raw Session {uuid} complete')
+                self.process_raw_session(uuid=uuid)
+            else:
+                logging.error('Raw Session %s not complete [no recovery possible]', uuid)
+                # Session not complete (meaning that some required record is missing)
+                # The system will not receive any other record
+                # related to this session (lost) so it must be delete from the assembler
+                self.session_assembler.delete_raw_session(uuid=uuid)
+
+    def process_raw_session(self, uuid: str) -> None:
+        """
+        Checks the integrity of a complete Raw Session and sends it
+        to the Preparation System (and its label to the Evaluation System)
+        :param uuid: string that identifies the Raw Session
+        """
+        # Remove the Raw Session from the assembler
+        raw_session = self.session_assembler.pop_raw_session(uuid=uuid)
+
+        if not raw_session:
+            print(f'Raw Session {uuid} failed to be loaded')
+            return
+
+        # Check Raw Session integrity
+        integrity = self.raw_session_integrity. \
+            check_integrity(time_series=raw_session['time_series'])
+
+        if integrity['missing_samples'] > self.configuration.missing_samples_threshold:
+            logging.error('Raw Session %s discarded, threshold not satisfied', uuid)
+            return
+        # The positions of the missing samples travel with the Raw Session as a report,
+        # the Preparation System still scans the whole series for the samples to correct
+        raw_session['missing_samples'] = integrity['missing_positions']
+
+        # Send Raw Session to the Preparation System
+        sent_to_preparation = self.send(data=raw_session, dest_system="preparation")
+        if sent_to_preparation:
+            print(f'Raw Session {uuid} sent to the Preparation System')
+
+        if self.evaluation:
+            # Send Raw Session to the Evaluation System
+            label = {'uuid': raw_session['uuid'], \
+                    'label': raw_session['pressure_detected']}
+            sent_to_evaluation = self.send(data=label, dest_system="evaluation")
+            if sent_to_evaluation:
+                print(f'Label {raw_session["pressure_detected"]} sent to the evaluation System')
+                self.sessions_to_evaluation += 1
+                print(f'Labels to sent to the evaluation System: {self.sessions_to_evaluation}')
+                if self.sessions_to_evaluation == self.configuration.evaluation_window:
+                    self.sessions_to_evaluation = 0
+                    self.evaluation = False
+                    print('Evaluation phase ended')
+        else:
+            if self.operative_mode == 'production':
+                self.sessions_to_produce += 1
+                print(f'Sessions executed: {self.sessions_to_produce}')
+
+                if self.sessions_to_produce == self.configuration.production_window \
+                        and self.evaluation_phase:
+                    self.evaluation = True
+                    self.sessions_to_produce = 0
+                    logging.info('Entering in evaluation phase')
+                    print('Entering in evaluation phase')
+
+    def send(self, data: dict, dest_system: str) -> bool:
+        """
+        Sends data to other systems
+        :param data: dictionary containing the data to send
+        :param dest_system: destination system
+        :return: True if the data is accepted for sending. False otherwise.
+        """
+        return JsonIO.get_instance().send(data=data, dest_system=dest_system)
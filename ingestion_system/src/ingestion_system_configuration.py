@@ -31,6 +31,20 @@ class IngestionSystemConfiguration:
 
             # Add JSON attributes to current object
             self.db_name = json_conf['db_name']
+            self.write_behind_journal = bool(json_conf['write_behind_journal'])
+            self.session_timeout = float(json_conf['session_timeout'])
+            self.group_commit_operations = int(json_conf['group_commit_operations'])
+            self.group_commit_interval_ms = int(json_conf['group_commit_interval_ms'])
+            self.recovery = bool(json_conf['recovery'])
+            self.recovery_horizon = float(json_conf['recovery_horizon'])
+            self.outbound_queue_size = int(json_conf['outbound_queue_size'])
+            self.outbound_max_retries = int(json_conf['outbound_max_retries'])
+            self.outbound_backoff_ms = int(json_conf['outbound_backoff_ms'])
+            self.spill_dir = json_conf['spill_dir']
+            self.intake_queue_size = int(json_conf['intake_queue_size'])
+            self.intake_high_water_mark = int(json_conf['intake_high_water_mark'])
+            self.intake_retry_after = int(json_conf['intake_retry_after'])
+            self.time_series_encoding = json_conf['time_series_encoding']
             self.input_system_ip = json_conf['input_system_ip']
             self.input_system_port = json_conf['input_system_port']
             self.preparation_system_ip = json_conf['preparation_system_ip']
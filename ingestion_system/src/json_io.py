@@ -1,14 +1,16 @@
 from datetime import datetime
 import sys
+import json
 import logging
 from typing import Any
-from threading import Thread
-from concurrent.futures import ThreadPoolExecutor
+import time
+from threading import Thread, Lock
 import queue
 from flask import Flask, request
-from requests import post, exceptions
 from jsonschema import ValidationError
 from src.ingestion_system_configuration import IngestionSystemConfiguration
+from src.outbound_dispatcher import OutboundDispatcher
+from src.time_series_codec import TimeSeriesCodec, ENCODING, ENCODING_HEADER
 
 CONFIG_PATH = './data/ingestion_system_config.json'
 CONFIG_SCHEMA_PATH = './data/ingestion_system_config_schema.json'
@@ -24,12 +26,37 @@ class JsonIO:
         Initializes the JsonIO object
         """
         self.app = Flask(__name__)
-        self.received_records_queue = queue.Queue()
-        self.thread_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="record_processor")
         try:
             self.configuration = IngestionSystemConfiguration(CONFIG_PATH, CONFIG_SCHEMA_PATH)
         except ValidationError:
             sys.exit(1)
+        # Bounded intake queue: the records are refused above the high-water mark
+        self.received_records_queue = queue.Queue(maxsize=self.configuration.intake_queue_size)
+        self.high_water_mark = self.configuration.intake_high_water_mark
+        self.intake_lock = Lock()
+        self.intake_metrics = {
+            'enqueued': 0,
+            'rejected': 0,
+            'enqueue_latency_us_total': 0.0,
+            'enqueue_latency_us_max': 0.0
+        }
+        self.metrics = {'intake': self.get_intake_metrics}
+        self.dispatcher = OutboundDispatcher(queue_size=self.configuration.outbound_queue_size, \
+                                             max_retries=self.configuration.outbound_max_retries, \
+                                             backoff_ms=self.configuration.outbound_backoff_ms, \
+                                             spill_dir=self.configuration.spill_dir)
+        self.encode_time_series = self.configuration.time_series_encoding == ENCODING
+        # The raw sessions are encoded when they are posted, a Preparation System
+        # that cannot decode them makes the dispatcher fall back to JSON
+        self.dispatcher.add_destination('preparation', \
+            f'http://{self.configuration.preparation_system_ip}:{self.configuration.preparation_system_port}/json', \
+            headers={ENCODING_HEADER: ENCODING} if self.encode_time_series else None, \
+            encoder=self.encode_raw_session if self.encode_time_series else None)
+        self.dispatcher.add_destination('evaluation', \
+            f'http://{self.configuration.evaluation_system_ip}:{self.configuration.evaluation_system_port}/expertLabels')
+        self.dispatcher.add_destination('log', \
+            f'http://{self.configuration.input_system_ip}:{self.configuration.input_system_port}/log', \
+            durable=False)
 
     @staticmethod
     def get_instance() -> Any:
@@ -48,54 +75,116 @@ class JsonIO:
 
     def put_received_record(self, received_record: dict) -> bool:
         """
-        Receives a record and enqueues it in a thread-safe queue
+        Receives a record and enqueues it in a thread-safe queue without waiting.
+        The record is refused if the queue has reached the high-water mark.
         :param received_record: record sent from a data source
         (calendar, labels, settings, pressure time series)
         :return: True if the record is entered correctly. False if the insertion fails.
         """
+        start = time.perf_counter()
         try:
-            self.received_records_queue.put(received_record, timeout=None)
-            # with open(os.path.join(os.path.abspath('..'), 'data', 'queue_size.txt'), 'w') as f:
-            #    f.write(f'{self.received_records_queue.qsize()}')
+            if self.received_records_queue.qsize() >= self.high_water_mark:
+                raise queue.Full
+            self.received_records_queue.put_nowait(received_record)
         except queue.Full:
-            logging.error('Full queue exception')
+            with self.intake_lock:
+                self.intake_metrics['rejected'] += 1
             return False
+        latency = (time.perf_counter() - start) * 1e6
+        with self.intake_lock:
+            self.intake_metrics['enqueued'] += 1
+            self.intake_metrics['enqueue_latency_us_total'] += latency
+            self.intake_metrics['enqueue_latency_us_max'] = \
+                max(self.intake_metrics['enqueue_latency_us_max'], latency)
         return True
 
+    def get_intake_metrics(self) -> dict:
+        """
+        :return: dictionary with the depth of the intake queue, the enqueued and rejected
+        items and the enqueue latency
+        """
+        with self.intake_lock:
+            metrics = dict(self.intake_metrics)
+        enqueued = metrics.pop('enqueue_latency_us_total')
+        metrics['enqueue_latency_us_avg'] = enqueued / metrics['enqueued'] \
+            if metrics['enqueued'] > 0 else 0.0
+        metrics['queue_depth'] = self.received_records_queue.qsize()
+        metrics['queue_size'] = self.received_records_queue.maxsize
+        metrics['high_water_mark'] = self.high_water_mark
+        return metrics
+
+    def add_metrics(self, name: str, provider) -> None:
+        """
+        Adds a group of metrics exported by the metrics endpoint
+        :param name: name of the group of metrics
+        :param provider: function that returns the dictionary of the metrics
+        """
+        self.metrics[name] = provider
+
+    def get_metrics(self) -> dict:
+        """
+        :return: dictionary with every group of metrics
+        """
+        return {name: provider() for name, provider in self.metrics.items()}
+
+    def put_received_records(self, received_records: list) -> bool:
+        """
+        Receives a batch of records and enqueues it as a single item in the thread-safe queue
+        :param received_records: list of records sent from a data source
+        :return: True if the batch is entered correctly. False if the insertion fails.
+        """
+        return self.put_received_record(received_records)
+
+    @staticmethod
+    def parse_records(body: bytes, mimetype: str) -> list:
+        """
+        Parses the body of a batch request, either a JSON array of records
+        or a newline-delimited JSON stream (one record per line)
+        :param body: body of the request
+        :param mimetype: mimetype of the request
+        :return: list of records, None if the body is malformed
+        """
+        try:
+            if mimetype in ('application/x-ndjson', 'application/jsonl'):
+                return [json.loads(line) for line in body.splitlines() if line.strip()]
+            records = json.loads(body)
+        except ValueError:
+            return None
+        return records if isinstance(records, list) else None
+
     def send_to_main(self):
         self.received_records_queue.put(True, block=True)
 
-    def receive(self) -> Any:
+    def receive(self, timeout: float = None) -> Any:
         """
         Extracts a record from the queue containing all the received records
-        :return: record
+        :param timeout: seconds to wait for a record, it waits forever if not set
+        :return: record, None if no record is received before the timeout
         """
-        return self.received_records_queue.get(block=True)
+        try:
+            return self.received_records_queue.get(block=True, timeout=timeout)
+        except queue.Empty:
+            return None
 
     def send(self, data: dict, dest_system: str) -> bool:
         """
-        Sends data to other systems
+        Sends data to other systems. The data is handed to the outbound dispatcher,
+        so the call never waits for the network.
         :param data: dictionary containing the data to send
         :dest_system: destination system
-        :return: True if the 'send' is successful. False otherwise.
+        :return: True if the data is accepted for sending. False otherwise.
         """
-        try:
-            if dest_system == "preparation":
-                connection_string = f'http://{self.configuration.preparation_system_ip}:{self.configuration.preparation_system_port}/json'
-                self.send_log(data['uuid'])
-            else:
-                connection_string = f'http://{self.configuration.evaluation_system_ip}:{self.configuration.evaluation_system_port}/expertLabels'
-            response = post(url=connection_string, json=data, timeout=3)
-        except exceptions.RequestException:
-            logging.error('%s unreachable', dest_system)
-            sys.exit(1)
+        if dest_system == "preparation":
+            self.send_log(data['uuid'])
+        return self.dispatcher.dispatch(dest_system, data)
 
-        if response.status_code != 200:
-            error_message = response.json()['error']
-            logging.error('Error: %s', error_message)
-            return False
-
-        return True
+    @staticmethod
+    def encode_raw_session(raw_session: dict) -> dict:
+        """
+        :param raw_session: raw session to send to the Preparation System
+        :return: raw session with the encoded time series
+        """
+        return dict(raw_session, time_series=TimeSeriesCodec.encode(raw_session['time_series']))
 
     def send_log(self, uuid:str) -> None:
         data = {
@@ -103,16 +192,8 @@ class JsonIO:
             'system_source': 'ingestion',
             'timestamp': datetime.now().isoformat()
         }
-        connection_string = f'http://{self.configuration.input_system_ip}:{self.configuration.input_system_port}/log'
-        print(f'[INFO] Send log: {data} to {connection_string}')
-        try:
-            response = post(url=connection_string, json=data, timeout=3)
-            if response.status_code != 200:
-                error_message = response.json()['error']
-                print(f'[ERROR] error: {error_message}')
-        except Exception as e:
-            print(f'[ERROR] log unreachable for {uuid} caused error: {e}')
-
+        if not self.dispatcher.dispatch('log', data):
+            print(f'[ERROR] log not sent for {uuid}')
 
     def listen(self, ip: str, port: int) -> None:
         """
@@ -140,10 +221,44 @@ def post_json():
         return {'error': 'No record received'}, 500
 
     received_record = request.json
-    JsonIO.get_instance().thread_pool.submit(JsonIO.get_instance().put_received_record, received_record)
+    if not JsonIO.get_instance().put_received_record(received_record):
+        return too_many_requests()
 
     return {}, 200
 
+@app.post('/records')
+def post_records():
+    """
+    Flask view function that handles a batch of records sent from the data sources,
+    as a JSON array or as newline-delimited JSON. The batch is enqueued as a single item.
+    """
+    received_records = JsonIO.parse_records(request.get_data(), request.mimetype)
+    if received_records is None:
+        return {'error': 'Malformed batch of records'}, 400
+    if len(received_records) == 0:
+        return {'error': 'No record received'}, 500
+
+    if not JsonIO.get_instance().put_received_records(received_records):
+        return too_many_requests()
+
+    return {}, 200
+
+def too_many_requests():
+    """
+    Builds the response sent when the intake queue is above the high-water mark
+    :return: 429 response with the Retry-After header
+    """
+    retry_after = JsonIO.get_instance().configuration.intake_retry_after
+    return {'error': 'Intake queue full'}, 429, {'Retry-After': str(retry_after)}
+
+@app.get('/metrics')
+def get_metrics():
+    """
+    Flask view function that exports the intake queue metrics
+    and the metrics registered by the other components
+    """
+    return JsonIO.get_instance().get_metrics(), 200
+
 @app.get('/start')
 def start_system():
     """
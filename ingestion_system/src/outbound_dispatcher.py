@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import queue
+import logging
+from threading import Thread, Lock
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
+
+'''
+Module Name: OutboundDispatcher
+Description: This class sends the outbound messages of the system in background.
+'''
+
+SPILL_REPLAY_INTERVAL = 5
+
+
+class OutboundDispatcher:
+    """
+    Class that sends the outbound messages without blocking the caller.
+    Every destination has a keep-alive connection pool, a bounded send queue
+    and a sender thread, so the destinations are served in parallel.
+    Failed sends are retried with exponential backoff, then spilled to disk
+    and replayed once the destination is reachable again.
+    """
+    def __init__(self, queue_size: int, max_retries: int, backoff_ms: int, spill_dir: str) -> None:
+        """
+        Initializes the dispatcher
+        :param queue_size: maximum number of messages waiting for every destination
+        :param max_retries: number of retries before a message is spilled to disk
+        :param backoff_ms: delay before the first retry, doubled at every retry
+        :param spill_dir: directory where the messages not delivered are spilled
+        """
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff = backoff_ms / 1000
+        self.spill_dir = spill_dir
+        self.destinations = {}
+
+    def add_destination(self, name: str, url: str, durable: bool = True, headers: dict = None,
+                        encoder=None) -> None:
+        """
+        Registers a destination and starts its sender thread
+        :param name: name of the destination
+        :param url: url where the messages are posted
+        :param durable: True to retry and spill the messages not delivered,
+        False to drop them after the first failure (e.g. logs)
+        :param headers: headers added to every message sent to the destination,
+        with an encoder they are only added to the encoded messages
+        :param encoder: optional function that encodes a message before it is posted.
+        If the destination answers 415 the encoder is dropped and the messages are posted as they are.
+        """
+        session = Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        if headers is not None and encoder is None:
+            session.headers.update(headers)
+        destination = {
+            'name': name,
+            'url': url,
+            'durable': durable,
+            'session': session,
+            'encoder': encoder,
+            'encoder_headers': headers,
+            'queue': queue.Queue(maxsize=self.queue_size),
+            'spill_path': os.path.join(self.spill_dir, name + '.ndjson'),
+            'spill_lock': Lock()
+        }
+        self.destinations[name] = destination
+        Thread(target=self.run, args=(destination, ), name='outbound_' + name, daemon=True).start()
+
+    def dispatch(self, name: str, data: dict) -> bool:
+        """
+        Enqueues a message for a destination without waiting for it to be sent.
+        If the queue is full the message is spilled to disk.
+        :param name: name of the destination
+        :param data: dictionary containing the data to send
+        :return: True if the message is accepted. False otherwise.
+        """
+        destination = self.destinations[name]
+        try:
+            destination['queue'].put_nowait(data)
+        except queue.Full:
+            logging.error('%s send queue full', name)
+            return destination['durable'] and self.spill(destination, data)
+        return True
+
+    def post(self, destination: dict, data: dict) -> bool:
+        """
+        Posts a message, retrying with exponential backoff if the destination
+        is unreachable or fails
+        :param destination: destination of the message
+        :param data: dictionary containing the data to send
+        :return: True if the message is delivered or refused by the destination.
+        False if the destination is unreachable or overloaded.
+        """
+        retries = self.max_retries if destination['durable'] else 0
+        delay = self.backoff
+        retry_after = 0
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                time.sleep(max(delay, retry_after))
+                delay *= 2
+            try:
+                response = self.send_message(destination, data)
+            except exceptions.RequestException:
+                logging.error('%s unreachable', destination['name'])
+                continue
+            if response.status_code < 500 and response.status_code != 429:
+                if response.status_code != 200:
+                    # The message is refused, sending it again would not help
+                    logging.error('%s error %s: %s', destination['name'], \
+                                  response.status_code, response.text)
+                return True
+            # Overloaded or unavailable destination, it may say when to retry
+            retry_after = self.get_retry_after(response)
+            logging.error('%s error %s', destination['name'], response.status_code)
+        return False
+
+    @staticmethod
+    def send_message(destination: dict, data: dict):
+        """
+        Posts a message once, encoded if the destination has an encoder.
+        A destination that cannot decode the encoded message (415) gets it again as it is,
+        and so do its next messages.
+        :param destination: destination of the message
+        :param data: dictionary containing the data to send
+        :return: response of the destination
+        """
+        encoder = destination['encoder']
+        if encoder is None:
+            return destination['session'].post(url=destination['url'], json=data, timeout=3)
+        response = destination['session'].post(url=destination['url'], json=encoder(data), \
+                                               headers=destination['encoder_headers'], timeout=3)
+        if response.status_code != 415:
+            return response
+        logging.error('%s cannot decode the encoded messages, they are sent as JSON', \
+                      destination['name'])
+        destination['encoder'] = None
+        return destination['session'].post(url=destination['url'], json=data, timeout=3)
+
+    @staticmethod
+    def get_retry_after(response) -> float:
+        """
+        :param response: response of the destination
+        :return: seconds to wait before retrying set by the Retry-After header, 0 if not set
+        """
+        try:
+            return float(response.headers.get('Retry-After', 0))
+        except ValueError:
+            return 0
+
+    def spill(self, destination: dict, data: dict) -> bool:
+        """
+        Appends a message not delivered to the spill file of the destination
+        :param destination: destination of the message
+        :param data: dictionary containing the data to send
+        :return: True if the message is spilled. False otherwise.
+        """
+        try:
+            with destination['spill_lock']:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(destination['spill_path'], 'a', encoding='UTF-8') as f:
+                    f.write(json.dumps(data) + '\n')
+        except OSError as e:
+            logging.error('%s message lost, spill failed %s', destination['name'], e)
+            return False
+        return True
+
+    def replay(self, destination: dict) -> bool:
+        """
+        Sends again the messages spilled to disk for a destination, oldest first.
+        The spill file is renamed while it is replayed and deleted only once every message
+        is delivered. If the destination is still unreachable the messages not delivered
+        stay in the replay file, which is resumed at the next replay
+        :param destination: destination of the messages
+        :return: True if no spilled message is left. False otherwise.
+        """
+        replay_path = destination['spill_path'] + '.replaying'
+        while True:
+            with destination['spill_lock']:
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(destination['spill_path']):
+                        return True
+                    os.replace(destination['spill_path'], replay_path)
+
+            with open(replay_path, 'r', encoding='UTF-8') as f:
+                spilled = [json.loads(line) for line in f if line.strip()]
+            print(f"[+] Replaying {len(spilled)} messages spilled for {destination['name']}")
+            for position, data in enumerate(spilled):
+                if not self.post(destination, data):
+                    if position > 0:
+                        # Only the messages not delivered are kept
+                        self.rewrite(replay_path, spilled[position:])
+                    return False
+            os.remove(replay_path)
+
+    @staticmethod
+    def rewrite(path: str, messages: list) -> None:
+        """
+        Replaces the content of a spill file with the given messages
+        :param path: path of the spill file
+        :param messages: list of the messages to keep, in order
+        """
+        try:
+            with open(path + '.tmp', 'w', encoding='UTF-8') as f:
+                f.writelines(json.dumps(data) + '\n' for data in messages)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            # The file is unchanged, its messages already delivered will be sent again
+            logging.error('%s rewrite failed %s', path, e)
+
+    def run(self, destination: dict) -> None:
+        """
+        Sender thread of a destination. The spilled messages are older than the queued ones,
+        so they are sent first and a new message never overtakes them
+        :param destination: destination served by the thread
+        """
+        # Messages spilled by a previous run
+        self.replay(destination)
+        while True:
+            try:
+                data = destination['queue'].get(block=True, timeout=SPILL_REPLAY_INTERVAL)
+            except queue.Empty:
+                self.replay(destination)
+                continue
+            if not self.replay(destination):
+                # Still unreachable, the message is queued on disk behind the spilled ones
+                if destination['durable']:
+                    self.spill(destination, data)
+                continue
+            if not self.post(destination, data) and destination['durable']:
+                self.spill(destination, data)
@@ -1,4 +1,5 @@
 import sys
+import numpy as np
 from jsonschema import ValidationError
 from src.ingestion_system_configuration import IngestionSystemConfiguration
 
@@ -22,6 +23,27 @@ class RawSessionIntegrity:
         except ValidationError:
             sys.exit(1)
 
+    @staticmethod
+    def check_integrity(time_series: list) -> dict:
+        """
+        Finds the missing samples of a pressure time series in a single vectorized pass.
+        :param time_series: list of pressure samples, None marks a missing sample
+        :return: dictionary with the number of missing samples, the longest gap,
+        the gaps as [start, length] pairs and the positions of the missing samples
+        """
+        # None values are converted to NaN
+        samples = np.array(time_series, dtype=np.float64)
+        mask = np.isnan(samples)
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        lengths = np.flatnonzero(edges == -1) - starts
+        return {
+            'missing_samples': int(mask.sum()),
+            'longest_gap': int(lengths.max()) if lengths.size > 0 else 0,
+            'gaps': np.column_stack((starts, lengths)).tolist(),
+            'missing_positions': np.flatnonzero(mask).tolist()
+        }
+
     def mark_missing_samples(self, time_series: list) -> bool:
         """
         Detects and marks the missing pressure time series in a Raw Session.
@@ -30,8 +52,5 @@ class RawSessionIntegrity:
         :return: True if the number of missing samples detected meets the requirements. 
         False otherwise.
         """
-        missing_samples = 0
-        for value in time_series:
-            if value is None:
-                missing_samples += 1
-        return missing_samples <= self.configuration.missing_samples_threshold
+        report = self.check_integrity(time_series)
+        return report['missing_samples'] <= self.configuration.missing_samples_threshold
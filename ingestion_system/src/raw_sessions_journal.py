@@ -0,0 +1,117 @@
+import queue
+import logging
+from threading import Thread
+from src.raw_sessions_store import RawSessionsStore
+
+# Shortest wait of the writer thread for a new operation, in seconds
+MIN_GROUP_COMMIT_INTERVAL = 0.001
+
+'''
+Module Name: RawSessionsJournal
+Description: This class writes the received records behind the SessionAssembler.
+'''
+
+class RawSessionsJournal:
+    """
+    Asynchronous write-behind journal of the Raw Sessions being assembled.
+    The records are written to the RawSessionsStore by a background thread,
+    so the ingestion loop never waits for the database. The journal is only
+    needed to recover the sessions after a crash.
+    """
+    def __init__(self, db_path: str = None, resume: bool = False) -> None:
+        """
+        Initializes the journal and starts its writer thread
+        :param db_path: path of the sqlite3 database, the configured db_name is used if not set
+        :param resume: True to keep the sessions already in the journal
+        """
+        self.db_path = db_path
+        self.resume = resume
+        self.active = True
+        self.operations = queue.Queue()
+        self.store = None
+        self.writer = Thread(target=self.run, name='raw_sessions_journal', daemon=True)
+        self.writer.start()
+
+    @staticmethod
+    def recover(horizon: float, db_path: str = None) -> list:
+        """
+        Reopens the journal left by a previous run, deletes the sessions older than
+        the horizon and loads the remaining ones.
+        It has to be called before the journal writer thread is started.
+        :param horizon: seconds after the last update of a session before it expires
+        :param db_path: path of the sqlite3 database, the configured db_name is used if not set
+        :return: list of the recovered sessions (see RawSessionsStore.load_in_flight_sessions)
+        """
+        store = RawSessionsStore(db_path=db_path, resume=True)
+        expired = store.expire_raw_sessions(horizon=horizon)
+        sessions = store.load_in_flight_sessions()
+        store.close_connection()
+        print(f'[+] Raw Sessions journal recovered: {len(sessions)} sessions restored, '
+              f'{expired} expired')
+        return sessions
+
+    def append_record(self, record: dict, record_type: str) -> None:
+        """
+        Enqueues a validated record to be written in the store
+        :param record: dictionary representing the record
+        :param record_type: type of the record
+        """
+        if self.active:
+            self.operations.put(('record', record, record_type))
+
+    def remove_session(self, uuid: str) -> None:
+        """
+        Enqueues the deletion of a Raw Session from the store
+        :param uuid: string that identifies the Raw Session
+        """
+        if self.active:
+            self.operations.put(('delete', uuid, None))
+
+    def get_commit_statistics(self) -> dict:
+        """
+        :return: dictionary with the writes, the commits and the commits saved by the group commit
+        """
+        if self.store is None:
+            return {'writes': 0, 'commits': 0, 'commits_saved': 0}
+        return self.store.get_commit_statistics()
+
+    def close(self) -> None:
+        """
+        Writes the pending operations and stops the writer thread
+        """
+        self.operations.put(None)
+        self.writer.join()
+
+    def run(self) -> None:
+        """
+        Writer thread: applies the enqueued operations to the RawSessionsStore.
+        The store is created here since a sqlite3 connection belongs to the thread that opens it.
+        """
+        try:
+            store = RawSessionsStore(db_path=self.db_path, resume=self.resume)
+        except SystemExit:
+            self.active = False
+            logging.error('Raw Sessions journal disabled, the store cannot be opened')
+            return
+        self.store = store
+        # The timeout never drops to zero, it would turn the wait into a busy loop
+        interval = max(store.group_commit_interval, MIN_GROUP_COMMIT_INTERVAL)
+
+        while True:
+            try:
+                # Commit the pending writes when no operation arrives within the group commit interval
+                operation = self.operations.get(block=True, timeout=interval)
+            except queue.Empty:
+                store.flush()
+                continue
+            if operation is None:
+                break
+            action, payload, record_type = operation
+            if action == 'record':
+                store.write_record(record=payload, record_type=record_type)
+            else:
+                store.delete_raw_session(uuid=payload)
+        store.close_connection()
+        statistics = self.get_commit_statistics()
+        print(f"[+] Raw Sessions journal closed: {statistics['writes']} writes, "
+              f"{statistics['commits']} commits, {statistics['commits_saved']} commits saved")
@@ -1,33 +1,55 @@
 import os
 import sys
+import time
+import math
 import sqlite3
 import json
 import logging
+import numpy as np
 from jsonschema import validate, ValidationError
 from src.ingestion_system_configuration import IngestionSystemConfiguration
 
 RECORD_TYPE = ['calendar', 'pressure_detected', 'environment', 'time_series']
 NUM_COLUMNS = 1236
+# Samples are packed as little-endian float32, a NaN marks a missing sample
+SAMPLE_DTYPE = np.dtype('<f4')
 CONFIG_PATH = './data/ingestion_system_config.json'
 CONFIG_SCHEMA_PATH = './data/ingestion_system_config_schema.json'
 
 class RawSessionsStore:
     """
     This class is responsible for handling the database operations.
+    A Raw Session is kept as a small header row (calendar, label and environment)
+    in the raw_session table plus one packed float32 BLOB in the raw_session_series table.
     """
-    def __init__(self) -> None:
+    def __init__(self, db_path: str = None, resume: bool = False) -> None:
         """
         Initializes the Raw Sessions Store
+        :param db_path: path of the sqlite3 database, the configured db_name is used if not set
+        :param resume: True to reopen the existing database instead of deleting it
         """
         self.conn = None
         self.configuration = IngestionSystemConfiguration(CONFIG_PATH, CONFIG_SCHEMA_PATH)
-
-        db_path = os.path.join(os.path.abspath('..'), self.configuration.db_name)
+        # Group commit: the writes are batched in one transaction committed
+        # every group_commit_operations writes or group_commit_interval_ms milliseconds
+        self.group_commit_operations = self.configuration.group_commit_operations
+        self.group_commit_interval = self.configuration.group_commit_interval_ms / 1000
+        self.pending_writes = 0
+        self.writes = 0
+        self.commits = 0
+        self.last_commit = time.monotonic()
+
+        if db_path is None:
+            db_path = os.path.join(os.path.abspath('..'), self.configuration.db_name)
+        self.db_path = db_path
         if os.path.exists(db_path):
-            print('[+] sqlite3 previous database deleted')
-            os.remove(db_path)
+            if resume:
+                print('[+] sqlite3 previous database reopened')
+            else:
+                print('[+] sqlite3 previous database deleted')
+                os.remove(db_path)
 
-        if self.open_connection() and self.create_table():
+        if self.open_connection() and self.migrate_wide_table() and self.create_table():
             print('[+] sqlite3 connection established and raw_session table initialized')
             # Enable WAL mode for better concurrency
             self.conn.execute("PRAGMA journal_mode=WAL")
@@ -44,7 +66,7 @@ class RawSessionsStore:
         :return: True if the connection is successful. False if the connection fails.
         """
         try:
-            self.conn = sqlite3.connect(os.path.join(os.path.abspath('..'), self.configuration.db_name))
+            self.conn = sqlite3.connect(self.db_path)
             return True
         except sqlite3.Error as e:
             logging.error('sqlite3 open connection error %s', e)
@@ -53,15 +75,55 @@ class RawSessionsStore:
 
     def close_connection(self) -> None:
         """
-        Closes the connection to the database
+        Commits the pending writes and closes the connection to the database
         :return: True if the disconnection is successful. False otherwise.
         """
+        self.flush()
         try:
             self.conn.close()
         except sqlite3.Error as e:
             logging.error('sqlite3 close connection error %s', e)
             sys.exit(1)
 
+    def end_write(self) -> None:
+        """
+        Accounts a write in the current transaction and commits it
+        if the group commit thresholds are reached
+        """
+        self.pending_writes += 1
+        self.writes += 1
+        if self.pending_writes >= self.group_commit_operations or \
+                time.monotonic() - self.last_commit >= self.group_commit_interval:
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        Commits the pending writes
+        :return: True if the commit is successful. False otherwise.
+        """
+        try:
+            if self.pending_writes > 0:
+                self.conn.commit()
+                self.commits += 1
+                self.pending_writes = 0
+        except sqlite3.Error as e:
+            logging.error('sqlite3 "flush" error %s', e)
+            return False
+        finally:
+            self.last_commit = time.monotonic()
+
+        return True
+
+    def get_commit_statistics(self) -> dict:
+        """
+        :return: dictionary with the writes, the commits and the commits saved by the group commit
+        """
+        return {
+            'writes': self.writes,
+            'commits': self.commits,
+            'commits_saved': self.writes - self.commits - self.pending_writes
+        }
+
     def check_connection(self) -> None:
         """
         Checks if the connection with the database is established.
@@ -73,24 +135,26 @@ class RawSessionsStore:
 
     def create_table(self) -> bool:
         """
-        Creates the table used to synchronize records and join them in order to build a Raw Session
+        Creates the tables used to synchronize records and join them in order to build a Raw Session
         :return: True if the creation is successful. False otherwise.
         """
         self.check_connection()
 
         try:
-            series_columns = str()
-            for i in range(1, NUM_COLUMNS + 1):
-                series_columns += RECORD_TYPE[3] + '_' + str(i) + ' TEXT, '
-
-            query = 'CREATE TABLE IF NOT EXISTS raw_session ( \
-                uuid TEXT NOT NULL, \
+            cursor = self.conn.cursor()
+            cursor.execute('CREATE TABLE IF NOT EXISTS raw_session ( \
+                uuid TEXT NOT NULL PRIMARY KEY, \
                 ' + RECORD_TYPE[0] + ' TEXT, \
                 ' + RECORD_TYPE[1] + ' TEXT, \
                 ' + RECORD_TYPE[2] + ' TEXT, \
-                ' + series_columns + \
-                    'UNIQUE(uuid), PRIMARY KEY (uuid))'
-            self.conn.cursor().execute(query)
+                last_update REAL) WITHOUT ROWID')
+            cursor.execute('CREATE TABLE IF NOT EXISTS raw_session_series ( \
+                uuid TEXT NOT NULL PRIMARY KEY, \
+                ' + RECORD_TYPE[3] + ' BLOB NOT NULL)')
+            # Header tables written before the recovery mode lack the last update time
+            cursor.execute('PRAGMA table_info(raw_session)')
+            if 'last_update' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE raw_session ADD COLUMN last_update REAL')
             self.conn.commit()
         except sqlite3.Error as e:
             logging.error('sqlite3 "create_tables" error %s', e)
@@ -98,6 +162,68 @@ class RawSessionsStore:
 
         return True
 
+    def migrate_wide_table(self) -> bool:
+        """
+        Converts a raw_session table written with the previous layout
+        (one time_series_N TEXT column per sample) into the header and BLOB tables.
+        Nothing is done if the database does not contain the previous layout.
+        :return: True if the migration is successful or not needed. False otherwise.
+        """
+        self.check_connection()
+
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('PRAGMA table_info(raw_session)')
+            columns = [column[1] for column in cursor.fetchall()]
+            if RECORD_TYPE[3] + '_1' not in columns:
+                return True
+
+            print('[+] sqlite3 wide raw_session table found, migrating it')
+            cursor.execute('ALTER TABLE raw_session RENAME TO raw_session_wide')
+            if not self.create_table():
+                return False
+
+            migrated = 0
+            cursor.execute('SELECT * FROM raw_session_wide')
+            for row in cursor.fetchall():
+                self.conn.execute('INSERT INTO raw_session VALUES (?,?,?,?,?)', \
+                                  tuple(row[0:4]) + (time.time(), ))
+                samples = [None if value is None else json.loads(value) for value in row[4:]]
+                if any(value is not None for value in samples):
+                    self.conn.execute('INSERT INTO raw_session_series VALUES (?,?)', \
+                                      (row[0], self.pack_time_series(samples)))
+                migrated += 1
+            cursor.execute('DROP TABLE raw_session_wide')
+            self.conn.commit()
+            print(f'[+] sqlite3 {migrated} Raw Sessions migrated')
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            logging.error('sqlite3 "migrate_wide_table" error %s', e)
+            return False
+
+        return True
+
+    @staticmethod
+    def pack_time_series(time_series: list) -> bytes:
+        """
+        Packs a pressure time series into a float32 BLOB of at most NUM_COLUMNS samples.
+        Missing samples (None) are stored as NaN. The BLOB keeps the length of the
+        received series, so a session restored after a crash is not padded with missing samples.
+        :param time_series: list of samples (numbers or None)
+        :return: packed time series
+        """
+        # None values are converted to NaN
+        return np.array(time_series[:NUM_COLUMNS], dtype=np.float64).astype(SAMPLE_DTYPE).tobytes()
+
+    @staticmethod
+    def unpack_time_series(blob: bytes) -> np.ndarray:
+        """
+        Unpacks a float32 BLOB into an array of samples
+        :param blob: packed time series
+        :return: array of samples, NaN marks a missing sample
+        """
+        return np.frombuffer(blob, dtype=SAMPLE_DTYPE)
+
     def get_record_type(self, record: dict) -> str:
         """
         Identifies the record type. The possible ones are calendar, pressure_detected, 
@@ -145,7 +271,6 @@ class RawSessionsStore:
         try:
             cursor = self.conn.cursor()
             cursor.execute('SELECT COUNT(1) FROM raw_session WHERE uuid = ?', (uuid, ))
-            self.conn.commit()
 
             result = cursor.fetchone()
             if result[0] == 0:
@@ -173,91 +298,56 @@ class RawSessionsStore:
             logging.error('Record schema not valid (record discarded)')
             return False
 
-        # Check if the record received belongs to a session whose synchronization is taking place
-        if self.raw_session_exists(record['uuid']):
-            # Update the Raw Session row
-            column_name = record_type
-            query_result = self.update_raw_session(record=record, column_to_set=column_name)
-        else:
-            # Insert a new Raw Session row with only one column containing the record received
-            query_parameters = self.generate_insert_parameters(record=record, \
-                                                               record_type=record_type)
-            query_result = self.insert_raw_session(parameters=query_parameters)
+        return self.write_record(record=record, record_type=record_type)
 
-        return query_result
-
-    def generate_insert_parameters(self, record: dict, record_type: str) -> tuple:
+    def write_record(self, record: dict, record_type: str) -> bool:
         """
-        Generates parameters for the insertion of a new Raw Session
+        Writes an already validated record into the database
+        :param record: dictionary representing the record to store
+        :param record_type: type of the record
+        :return: True if the write is successful. False if it fails.
         """
-        parameters = {
-            'uuid': record['uuid'],
-            'calendar': None,
-            'pressure_detected': None,
-            'environment': None,
-            'time_series': [None] * NUM_COLUMNS
-        }
+        if record_type == RECORD_TYPE[3]:
+            return self.store_time_series(uuid=record['uuid'], time_series=record[record_type])
+        return self.upsert_header(record=record, column_to_set=record_type)
 
-        parameters[record_type] = record[record_type]
-        values = list(parameters.values())
-        query_parameters = values[0:-1] + values[-1]
-        return tuple(query_parameters)
-
-    def insert_raw_session(self, parameters: tuple) -> bool:
+    def upsert_header(self, record: dict, column_to_set: str) -> bool:
         """
-        Inserts a Raw Session in the database upon receiving a record belonging to a new session
-        :param parameters: query parameters in order to set the right column
-        :return: True if the insert is successful. False otherwise.
+        Inserts the header row of a Raw Session or updates one of its columns
+        if the session is already in the database
+        :param record: dictionary representing the received record to store
+        :param column_to_set: column to set (calendar, pressure_detected or environment)
+        :return: True if the upsert is successful. False otherwise.
         """
         try:
-            series_columns = str()
-            for i in range(1, NUM_COLUMNS + 1):
-                series_columns += RECORD_TYPE[3] + '_' + str(i)
-                if i == NUM_COLUMNS:
-                    series_columns += ")"
-                else:
-                    series_columns += ','
-            series_columns += 'VALUES (?,?,?,?,'
-            for i in range(1, NUM_COLUMNS + 1):
-                series_columns += '?'
-                if i == NUM_COLUMNS:
-                    series_columns += ")"
-                else:
-                    series_columns += ','
-
-            query = 'INSERT INTO raw_session (uuid, calendar, pressure_detected, environment, ' \
-                    + series_columns
-
-            cursor = self.conn.cursor()
-            cursor.execute(query, parameters)
-            self.conn.commit()
+            query = 'INSERT INTO raw_session (uuid, ' + column_to_set + ', last_update) ' \
+                    + 'VALUES (?, ?, ?) ON CONFLICT(uuid) DO UPDATE SET ' + column_to_set \
+                    + ' = excluded.' + column_to_set + ', last_update = excluded.last_update'
+            self.conn.execute(query, (record['uuid'], record[column_to_set], time.time()))
+            self.end_write()
         except sqlite3.Error as e:
-            logging.error('sqlite3 "insert_raw_session" error %s', e)
+            logging.error('sqlite3 "upsert_header" error %s', e)
             return False
 
         return True
 
-    def update_raw_session(self, record: dict, column_to_set: str) -> bool:
+    def store_time_series(self, uuid: str, time_series: list) -> bool:
         """
-        Updates a Raw Session in the database upon receiving a record
-        belonging to a session already in the database
-        :param record: dictionary representing the received record to store
-        :param column_to_set: column to update
-        :return: True if the update is successful. False otherwise.
+        Stores the pressure time series of a Raw Session as a packed BLOB,
+        creating the header row if it is the first record of the session
+        :param uuid: string that identifies the Raw Session
+        :param time_series: list of samples (numbers or None)
+        :return: True if the store is successful. False otherwise.
         """
         try:
-            cursor = self.conn.cursor()
-            if column_to_set == 'time_series':
-                columns = ', '.join([f'time_series_{i} = ?' for i in range(1, NUM_COLUMNS + 1)])
-                query = f'UPDATE raw_session SET {columns} WHERE uuid = ?'
-                params = record[column_to_set] + [record['uuid']]
-                cursor.execute(query, params)
-            else:
-                query = 'UPDATE raw_session SET ' + column_to_set + ' = ? WHERE uuid = ?'
-                cursor.execute(query, (record[column_to_set], record['uuid']))
-            self.conn.commit()
+            self.conn.execute('INSERT INTO raw_session (uuid, last_update) VALUES (?, ?) ' \
+                              'ON CONFLICT(uuid) DO UPDATE SET last_update = excluded.last_update', \
+                              (uuid, time.time()))
+            self.conn.execute('INSERT OR REPLACE INTO raw_session_series VALUES (?, ?)', \
+                              (uuid, self.pack_time_series(time_series)))
+            self.end_write()
         except sqlite3.Error as e:
-            logging.error('sqlite3 "update_raw_session" error %s', e)
+            logging.error('sqlite3 "store_time_series" error %s', e)
             return False
 
         return True
@@ -271,10 +361,10 @@ class RawSessionsStore:
         self.check_connection()
 
         try:
-            query = 'DELETE FROM raw_session WHERE uuid = ?'
             cursor = self.conn.cursor()
-            cursor.execute(query, (uuid, ))
-            self.conn.commit()
+            cursor.execute('DELETE FROM raw_session WHERE uuid = ?', (uuid, ))
+            cursor.execute('DELETE FROM raw_session_series WHERE uuid = ?', (uuid, ))
+            self.end_write()
         except sqlite3.Error as e:
             logging.error('sqlite3 "delete_raw_session" error %s', e)
             return False
@@ -290,10 +380,11 @@ class RawSessionsStore:
         self.check_connection()
 
         try:
-            query = 'SELECT * FROM raw_session WHERE uuid = ?'
+            query = 'SELECT h.uuid, h.calendar, h.pressure_detected, h.environment, ' \
+                    + 's.time_series FROM raw_session h LEFT JOIN raw_session_series s ' \
+                    + 'ON s.uuid = h.uuid WHERE h.uuid = ?'
             cursor = self.conn.cursor()
             cursor.execute(query, (uuid, ))
-            self.conn.commit()
 
             result = cursor.fetchone()
             if result is None:
@@ -311,16 +402,69 @@ class RawSessionsStore:
             # Handling missing label
             if result[2] is not None:
                 raw_session['pressure_detected'] = result[2]
-            for ts in result[4:]:
-                if ts is not None:
-                    ts_json = json.loads(ts)
-                    #ts_data = list(ts_json.values())
-                    raw_session['time_series'].append(ts_json)
+            if result[4] is not None:
+                # Missing samples are not part of the loaded series
+                samples = self.unpack_time_series(result[4])
+                raw_session['time_series'] = samples[~np.isnan(samples)].tolist()
             return raw_session
         except sqlite3.Error as e:
             logging.error('sqlite3 "load_raw_session" error %s', e)
             return {}
 
+    def expire_raw_sessions(self, horizon: float) -> int:
+        """
+        Deletes the Raw Sessions that did not receive any record within the horizon
+        :param horizon: seconds after the last update of a session before it expires
+        :return: number of Raw Sessions deleted
+        """
+        self.check_connection()
+
+        try:
+            limit = time.time() - horizon
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM raw_session_series WHERE uuid IN (SELECT uuid FROM ' \
+                           'raw_session WHERE last_update IS NULL OR last_update < ?)', (limit, ))
+            cursor.execute('DELETE FROM raw_session WHERE last_update IS NULL OR last_update < ?', \
+                           (limit, ))
+            expired = cursor.rowcount
+            self.end_write()
+            self.flush()
+        except sqlite3.Error as e:
+            logging.error('sqlite3 "expire_raw_sessions" error %s', e)
+            return 0
+
+        return expired
+
+    def load_in_flight_sessions(self) -> list:
+        """
+        Loads all the Raw Sessions still being assembled, used to rebuild the
+        in-memory index after a restart
+        :return: list of dictionaries with the records received for every session,
+        the time series has the received length and its missing samples are set to None
+        """
+        self.check_connection()
+
+        try:
+            query = 'SELECT h.uuid, h.calendar, h.pressure_detected, h.environment, ' \
+                    + 's.time_series FROM raw_session h LEFT JOIN raw_session_series s ' \
+                    + 'ON s.uuid = h.uuid ORDER BY h.last_update'
+            cursor = self.conn.cursor()
+            cursor.execute(query)
+
+            sessions = []
+            for row in cursor:
+                session = dict(zip(['uuid'] + RECORD_TYPE[0:3], row[0:4]))
+                session[RECORD_TYPE[3]] = None
+                if row[4] is not None:
+                    samples = self.unpack_time_series(row[4]).astype(np.float64)
+                    session[RECORD_TYPE[3]] = [None if math.isnan(value) else value \
+                                               for value in samples.tolist()]
+                sessions.append(session)
+            return sessions
+        except sqlite3.Error as e:
+            logging.error('sqlite3 "load_in_flight_sessions" error %s', e)
+            return []
+
     def is_session_complete(self, uuid: str, last_missing_sample: bool, evaluation: bool) -> bool:
         """
         Checks if the synchronization and building of the Raw Session 
@@ -333,34 +477,22 @@ class RawSessionsStore:
         self.check_connection()
         operative_mode = self.configuration.operative_mode
         try:
-            if last_missing_sample:
-                # Since last_missing_samples is True it means that
-                # there will be no more records related to this session
-                # So the task to check if the session is good or not is
-                # shifted to the RawSessionIntegrity class
-                # Here the only important thing is to check if the required fields are not missing
-                query = 'SELECT COUNT(1) FROM raw_session WHERE uuid = ? ' \
-                        + 'AND calendar IS NOT NULL AND environment IS NOT NULL ' \
-                        + ('AND pressure_detected IS NOT NULL' if (operative_mode == 'development' \
-                                                                    or evaluation) else '')
-            else:
+            query = 'SELECT COUNT(1) FROM raw_session h WHERE h.uuid = ? ' \
+                    + 'AND h.calendar IS NOT NULL AND h.environment IS NOT NULL ' \
+                    + ('AND h.pressure_detected IS NOT NULL ' if (operative_mode == 'development' \
+                                                                 or evaluation) else '')
+            if not last_missing_sample:
                 # The session is still in the synchronization/building phase,
-                # So it is necessary to check all the possible fields
-                # (except for the labels during the production mode)
-                # If all the records are not null, the session can be labeled as 'fully complete'
-                series_columns = str()
-                for i in range(1, 100): # TODO perché 100?
-                    series_columns += ' AND ' + RECORD_TYPE[3] + '_' + str(i) + ' IS NOT NULL '
-
-                query = 'SELECT COUNT(1) FROM raw_session WHERE uuid = ? ' \
-                        + 'AND calendar IS NOT NULL AND environment IS NOT NULL ' \
-                        + ('AND pressure_detected IS NOT NULL' if (operative_mode == 'development' \
-                                                                     or evaluation) else ' ') \
-                        + series_columns
+                # So the time series has to be received as well
+                # (the label is not required during the production mode)
+                # If all the records are present, the session can be labeled as 'fully complete'.
+                # Otherwise, since last_missing_samples is True, there will be no more records
+                # related to this session and the task to check if the session is good or not
+                # is shifted to the RawSessionIntegrity class
+                query += 'AND EXISTS (SELECT 1 FROM raw_session_series s WHERE s.uuid = h.uuid)'
 
             cursor = self.conn.cursor()
             cursor.execute(query, (uuid, ))
-            self.conn.commit()
 
             result = cursor.fetchone()
             if result[0] == 0:
@@ -0,0 +1,194 @@
+import os
+import json
+import logging
+from jsonschema import validators
+from src.raw_sessions_store import RECORD_TYPE, NUM_COLUMNS
+
+'''
+Module Name: SessionAssembler
+Description: This class builds the Raw Sessions in memory from the received records.
+'''
+
+# Bit set in the session mask when a record of the given type has been received
+RECORD_BIT = {record_type: 1 << i for i, record_type in enumerate(RECORD_TYPE)}
+SCHEMA_DIR = 'data'
+
+
+class SessionAssembler:
+    """
+    Class that keeps the partially built Raw Sessions in memory, keyed by uuid.
+    The completeness of a session is decided from a bitmask of the record types
+    already received, the optional journal is only written for crash recovery.
+    """
+    def __init__(self, operative_mode: str, journal=None) -> None:
+        """
+        Initializes the assembler
+        :param operative_mode: operative mode of the system (development or production)
+        :param journal: optional RawSessionsJournal where the records are written behind
+        """
+        self.operative_mode = operative_mode
+        self.journal = journal
+        self.sessions = {}
+        self.validators = {}
+        for record_type in RECORD_TYPE:
+            with open(os.path.join(SCHEMA_DIR, record_type + '_schema.json'), 'r', \
+                      encoding='UTF-8') as f:
+                schema = json.load(f)
+            if record_type == RECORD_TYPE[3]:
+                # The samples are checked by is_valid_time_series,
+                # validating them one by one through the schema is too slow
+                schema['properties'][record_type].pop('items', None)
+            self.validators[record_type] = validators.validator_for(schema)(schema)
+
+    @staticmethod
+    def get_record_type(record: dict) -> str:
+        """
+        Identifies the record type. The possible ones are calendar, pressure_detected,
+        environment and time_series.
+        :param record: record to identify
+        :return: type of the record
+        """
+        keys = list(record.keys())[0:2]
+
+        for record_type in RECORD_TYPE:
+            if record_type in keys:
+                return record_type
+        return 'None'
+
+    @staticmethod
+    def is_valid_time_series(time_series: list) -> bool:
+        """
+        Checks that every sample of a time series is a number or None
+        :param time_series: list of samples
+        :return: True if the time series is valid. False otherwise.
+        """
+        return all(value is None or (type(value) in (int, float)) for value in time_series)
+
+    def validate_record(self, record: dict, record_type: str) -> bool:
+        """
+        Validates a received record given its pre-defined schema
+        :param record: dictionary that represents the received record
+        :param record_type: type of the record to validate
+        :return: True if the validation is successful. False if the validation fails.
+        """
+        if not isinstance(record, dict) or record_type not in self.validators:
+            logging.error('Record type not recognized')
+            return False
+        if not self.validators[record_type].is_valid(record):
+            logging.error('Record schema validation failed')
+            return False
+        if record_type == RECORD_TYPE[3] and \
+                not self.is_valid_time_series(record[record_type]):
+            logging.error('Record schema validation failed')
+            return False
+        return True
+
+    def add_record(self, record: dict) -> bool:
+        """
+        Adds the received record to the Raw Session it belongs to
+        after its type identification and validation.
+        :param record: dictionary representing the received record
+        :return: True if the record is added. False if it is discarded.
+        """
+        record_type = self.get_record_type(record) if isinstance(record, dict) else 'None'
+        if not self.validate_record(record, record_type):
+            logging.error('Record schema not valid (record discarded)')
+            return False
+
+        uuid = record['uuid']
+        session = self.sessions.get(uuid)
+        if session is None:
+            session = {'mask': 0, 'calendar': None, 'pressure_detected': None,
+                       'environment': None, 'time_series': None}
+            self.sessions[uuid] = session
+        session[record_type] = record[record_type]
+        session['mask'] |= RECORD_BIT[record_type]
+
+        if self.journal is not None:
+            self.journal.append_record(record=record, record_type=record_type)
+        return True
+
+    def restore_session(self, session: dict) -> None:
+        """
+        Restores a Raw Session loaded from the journal after a restart.
+        The session is not written again in the journal.
+        :param session: dictionary with the uuid and the records received for the session,
+        None for the records not received
+        """
+        restored = {'mask': 0}
+        for record_type in RECORD_TYPE:
+            restored[record_type] = session.get(record_type)
+            if restored[record_type] is not None:
+                restored['mask'] |= RECORD_BIT[record_type]
+        self.sessions[session['uuid']] = restored
+
+    def session_exists(self, uuid: str) -> bool:
+        """
+        Checks if a Raw Session is being assembled
+        :param uuid: string representing the Raw Session to check
+        :return: True if the Raw Session exists. False otherwise
+        """
+        return uuid in self.sessions
+
+    def required_mask(self, last_missing_sample: bool, evaluation: bool) -> int:
+        """
+        Computes the mask of the records required to consider a session complete
+        :param last_missing_sample: True if no more records of the session will be received
+        :param evaluation: boolean that says if the label has to be a required field or not
+        :return: mask of the required record types
+        """
+        mask = RECORD_BIT['calendar'] | RECORD_BIT['environment']
+        if self.operative_mode == 'development' or evaluation:
+            mask |= RECORD_BIT['pressure_detected']
+        if not last_missing_sample:
+            # The session is still in the synchronization/building phase,
+            # so the time series is required as well. Otherwise the task to check
+            # if the session is good or not is shifted to the RawSessionIntegrity class
+            mask |= RECORD_BIT['time_series']
+        return mask
+
+    def is_session_complete(self, uuid: str, last_missing_sample: bool, evaluation: bool) -> bool:
+        """
+        Checks if the synchronization and building of the Raw Session
+        has been completed meaning there are no more records related to the session.
+        :param uuid: string that identifies the session to check
+        :param last_missing_sample: True if no more records of the session will be received
+        :param evaluation: boolean that says if the label has to be a required field or not
+        :return: True if the session is completed. False otherwise.
+        """
+        session = self.sessions.get(uuid)
+        if session is None:
+            return False
+        required = self.required_mask(last_missing_sample, evaluation)
+        return session['mask'] & required == required
+
+    def pop_raw_session(self, uuid: str) -> dict:
+        """
+        Removes a Raw Session from the assembler and returns it
+        :param uuid: string that identifies the Raw Session
+        :return: dictionary representing the Raw Session, empty if the session does not exist
+        """
+        session = self.sessions.pop(uuid, None)
+        if self.journal is not None:
+            self.journal.remove_session(uuid=uuid)
+        if session is None:
+            return {}
+
+        time_series = session['time_series'] or []
+        return {
+            'uuid': uuid,
+            'calendar': session['calendar'],
+            'pressure_detected': session['pressure_detected'] or 'None',
+            'environment': session['environment'],
+            # Missing samples are kept as None, they are marked by the RawSessionIntegrity
+            'time_series': time_series[:NUM_COLUMNS]
+        }
+
+    def delete_raw_session(self, uuid: str) -> None:
+        """
+        Discards a Raw Session
+        :param uuid: string that identifies the Raw Session to discard
+        """
+        self.sessions.pop(uuid, None)
+        if self.journal is not None:
+            self.journal.remove_session(uuid=uuid)
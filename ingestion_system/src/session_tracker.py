@@ -0,0 +1,81 @@
+import time
+import heapq
+
+'''
+Module Name: SessionTracker
+Description: This class keeps the inactivity deadlines of the sessions being assembled.
+'''
+
+class SessionTracker:
+    """
+    Class that tracks the inactivity deadline of every session being assembled,
+    so that many sessions can be interleaved. The deadlines are kept in a heap:
+    refreshing a deadline pushes a new entry and the outdated ones are skipped
+    when they reach the top of the heap.
+    """
+    def __init__(self, session_timeout: float) -> None:
+        """
+        Initializes the tracker
+        :param session_timeout: seconds of inactivity after which a session is expired
+        """
+        self.session_timeout = session_timeout
+        self.deadlines = {}
+        self.heap = []
+
+    def __len__(self) -> int:
+        """
+        :return: number of sessions tracked
+        """
+        return len(self.deadlines)
+
+    def touch(self, uuid: str, now: float = None) -> None:
+        """
+        Moves the deadline of a session forward upon receiving one of its records
+        :param uuid: string that identifies the session
+        :param now: current monotonic time, time.monotonic() if not set
+        """
+        if now is None:
+            now = time.monotonic()
+        deadline = now + self.session_timeout
+        self.deadlines[uuid] = deadline
+        heapq.heappush(self.heap, (deadline, uuid))
+        # Drop the outdated entries when they are the majority of the heap
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, u) for u, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, uuid: str) -> None:
+        """
+        Stops tracking a session
+        :param uuid: string that identifies the session
+        """
+        self.deadlines.pop(uuid, None)
+
+    def pop_expired(self, now: float = None) -> list:
+        """
+        Removes the sessions whose deadline is expired
+        :param now: current monotonic time, time.monotonic() if not set
+        :return: list of the uuids of the expired sessions, oldest first
+        """
+        if now is None:
+            now = time.monotonic()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, uuid = heapq.heappop(self.heap)
+            if self.deadlines.get(uuid) == deadline:
+                del self.deadlines[uuid]
+                expired.append(uuid)
+        return expired
+
+    def time_to_next_deadline(self, now: float = None) -> float:
+        """
+        :param now: current monotonic time, time.monotonic() if not set
+        :return: seconds until the next deadline, None if no session is tracked
+        """
+        if now is None:
+            now = time.monotonic()
+        while self.heap and self.deadlines.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - now)
@@ -70,26 +70,26 @@ class Dataset:
         print("SAMPLE : " , sample)
         try:
             msg_manager = MessageManager.get_instance()
-            req_body = {
-                        "uuid": sample["uuid"],
-                        "environment" : sample["environment"]
-                    }
-            msg_manager.send_data(req_body)
-            req_body = {
-                        "uuid": sample["uuid"],
-                        "calendar" : sample["activity"]
-                    }
-            msg_manager.send_data(req_body)
-            req_body = {
-                        "uuid": sample["uuid"],
-                        "pressure_detected" : sample["label"]
-                    }
-            msg_manager.send_data(req_body)
-            req_body = {
-                        "uuid": sample["uuid"],
-                        "time_series" : sample["ts"]
-                    }
-            msg_manager.send_data(req_body)
+            # The whole session travels in a single request
+            req_body = [
+                {
+                    "uuid": sample["uuid"],
+                    "environment" : sample["environment"]
+                },
+                {
+                    "uuid": sample["uuid"],
+                    "calendar" : sample["activity"]
+                },
+                {
+                    "uuid": sample["uuid"],
+                    "pressure_detected" : sample["label"]
+                },
+                {
+                    "uuid": sample["uuid"],
+                    "time_series" : sample["ts"]
+                }
+            ]
+            msg_manager.send_batch(req_body)
         except Exception as e:
             raise e
 
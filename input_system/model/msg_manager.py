@@ -1,4 +1,5 @@
 import os
+import time
 import queue
 import logging
 from threading import Thread
@@ -14,6 +15,13 @@ log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 load_dotenv()
 
+# Delay between two sends when the ingestion system asks to slow down (seconds)
+MIN_SEND_DELAY = 0.01
+MAX_SEND_DELAY = 2.0
+# A request refused for overload is retried at most this many times and for this long (seconds)
+MAX_BACKPRESSURE_RETRIES = 10
+MAX_BACKPRESSURE_WAIT = 30.0
+
 class LabelSchema(Schema):
     uuid = fields.String(required=True)
     label = fields.String(required=True)
@@ -26,6 +34,7 @@ class MessageManager:
         self._app = Flask(__name__)
         self._queue = queue.Queue()
         self.database = RecordTimestampManager()
+        self._send_delay = 0.0
 
     @staticmethod
     def get_instance():
@@ -52,16 +61,54 @@ class MessageManager:
     def send_log(self, data):
         self.database.add_timestamp(data['uuid'], data['system_source'], data['timestamp'])
 
+    def post_with_backpressure(self, url, json):
+        # Honours the 429 responses of the ingestion system: the request is retried
+        # after Retry-After seconds and the send rate is slowed down until requests are accepted.
+        # After MAX_BACKPRESSURE_RETRIES retries or MAX_BACKPRESSURE_WAIT seconds the last
+        # 429 response is returned, so the caller reports the failure
+        deadline = time.monotonic() + MAX_BACKPRESSURE_WAIT
+        for attempt in range(MAX_BACKPRESSURE_RETRIES + 1):
+            if self._send_delay > 0:
+                time.sleep(self._send_delay)
+            res = requests.post(url, json=json, timeout=3)
+            if res.status_code != 429:
+                self._send_delay = self._send_delay / 2 if self._send_delay > MIN_SEND_DELAY else 0.0
+                return res
+            self._send_delay = min(MAX_SEND_DELAY, max(MIN_SEND_DELAY, self._send_delay * 2))
+            try:
+                retry_after = float(res.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0
+            remaining = deadline - time.monotonic()
+            if attempt == MAX_BACKPRESSURE_RETRIES or retry_after > remaining:
+                break
+            print("[WARNING] Ingestion system busy, retry in " , retry_after, "s")
+            time.sleep(retry_after)
+        print("[ERROR] Ingestion system still busy, request dropped after" , attempt + 1, "attempts")
+        return res
+
     def send_data(self, json):
         #uri = "http://" + self._configuration.host_dest_ip + ":" + str(self._configuration.host_dest_port) + "/record"
         ingestion_url = "http://" + self._configuration.host_dest_ip + ":" + str(self._configuration.host_dest_port) + "/record"
         try:
-            res = requests.post(ingestion_url, json=json, timeout=3)
+            res = self.post_with_backpressure(ingestion_url, json)
             if res.status_code != 200:
                 raise Exception("[ERROR] Not received 200")
             self.database.add_timestamp(json['uuid'], 'input_system')
         except Exception as e:
             raise e
+
+    def send_batch(self, records):
+        # Sends a whole batch of records (e.g. a session) in a single request
+        ingestion_url = "http://" + self._configuration.host_dest_ip + ":" + str(self._configuration.host_dest_port) + "/records"
+        try:
+            res = self.post_with_backpressure(ingestion_url, records)
+            if res.status_code != 200:
+                raise Exception("[ERROR] Not received 200")
+            for uuid in dict.fromkeys(record['uuid'] for record in records):
+                self.database.add_timestamp(uuid, 'input_system')
+        except Exception as e:
+            raise e
 app = MessageManager.get_instance().get_app()
 
 @app.get('/start')
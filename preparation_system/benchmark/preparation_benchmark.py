@@ -0,0 +1,326 @@
+import io
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import importlib
+import contextlib
+import tracemalloc
+import numpy as np
+
+'''
+Module Name: PreparationBenchmark
+Description: Throughput benchmark of the preparation of raw sessions.
+Synthetic raw sessions of 1236 samples, with configurable missing-sample and
+outlier rates, are run in-process through the cleaning and the feature extraction
+of every implementation. Sessions/s, µs per stage and peak memory allocated per session
+are reported as JSON, with the difference of the features from the reference implementation.
+An implementation is a class with a name and a prepare method (see PreparationImplementation),
+more can be plugged in with --plugin module:Class.
+Run it from the preparation_system folder: python -m benchmark.preparation_benchmark [-h]
+'''
+
+# The configuration reads the operative mode from the environment
+os.environ.setdefault('OPERATIVE_MODE', 'development')
+
+# pylint: disable=wrong-import-position
+from src.session_cleaning import SessionCleaning
+from src.features_extractor import FeaturesExtractor
+from benchmark.session_cleaning_benchmark import ScalarSessionCleaning
+
+NUM_SAMPLES = 1236
+STAGES = ('missing_samples', 'outliers', 'features')
+
+
+class PreparationImplementation:
+    """
+    Base class of the implementations compared by the benchmark
+    """
+    name = None
+
+    def __init__(self, batch_size: int) -> None:
+        """
+        :param batch_size: number of raw sessions given to every call of prepare
+        """
+        self.batch_size = batch_size
+        self.cleaner = SessionCleaning()
+        self.extractor = FeaturesExtractor()
+
+    def prepare(self, raw_sessions: list, timings: dict) -> list:
+        """
+        Cleans the time series of the raw sessions and extracts their features.
+        :param raw_sessions: list of raw sessions, they can be modified
+        :param timings: nanoseconds spent in every stage, to be increased
+        :return: list with the maximum, minimum, median and mean absolute deviation
+        of every raw session, None if it is discarded
+        """
+        raise NotImplementedError
+
+
+class ScalarPreparation(PreparationImplementation):
+    """
+    Previous scalar path: Python loops on the lists and one NumPy call per feature
+    """
+    name = 'scalar'
+
+    def __init__(self, batch_size: int) -> None:
+        super().__init__(batch_size)
+        self.scalar_cleaner = ScalarSessionCleaning(self.cleaner.min_value, self.cleaner.max_value)
+
+    def prepare(self, raw_sessions: list, timings: dict) -> list:
+        features = []
+        for raw_session in raw_sessions:
+            time_series = raw_session['time_series']
+            start = time.perf_counter_ns()
+            recoverable = self.scalar_cleaner.correct_missing_samples(time_series) and \
+                None not in time_series
+            timings['missing_samples'] += time.perf_counter_ns() - start
+            if not recoverable:
+                features.append(None)
+                continue
+            start = time.perf_counter_ns()
+            self.scalar_cleaner.correct_outliers(time_series)
+            timings['outliers'] += time.perf_counter_ns() - start
+            start = time.perf_counter_ns()
+            mean_value = np.mean(time_series)
+            features.append((max(time_series), min(time_series), float(np.median(time_series)),
+                             float(np.mean(np.abs(np.array(time_series) - mean_value)))))
+            timings['features'] += time.perf_counter_ns() - start
+        return features
+
+
+class SessionPreparation(PreparationImplementation):
+    """
+    Vectorized path, one raw session at a time
+    """
+    name = 'session'
+
+    def prepare(self, raw_sessions: list, timings: dict) -> list:
+        features = []
+        for raw_session in raw_sessions:
+            start = time.perf_counter_ns()
+            # None values are converted to NaN
+            matrix = np.array(raw_session['time_series'], dtype=np.float64).reshape(1, -1)
+            recoverable = self.cleaner.correct_batch_missing_samples(matrix)[0][0]
+            timings['missing_samples'] += time.perf_counter_ns() - start
+            if not recoverable:
+                features.append(None)
+                continue
+            start = time.perf_counter_ns()
+            self.cleaner.correct_batch_outliers(matrix)
+            timings['outliers'] += time.perf_counter_ns() - start
+            start = time.perf_counter_ns()
+            features.append(tuple(self.extractor.compute_series_features(matrix)[0].tolist()))
+            timings['features'] += time.perf_counter_ns() - start
+        return features
+
+
+class BatchPreparation(PreparationImplementation):
+    """
+    Vectorized path on micro-batches, as PreparationSystem.prepare_batch
+    """
+    name = 'batch'
+
+    def prepare(self, raw_sessions: list, timings: dict) -> list:
+        start = time.perf_counter_ns()
+        # None values are converted to NaN
+        matrix = np.array([raw_session['time_series'] for raw_session in raw_sessions], \
+                          dtype=np.float64)
+        recoverable = self.cleaner.correct_batch_missing_samples(matrix)[0]
+        timings['missing_samples'] += time.perf_counter_ns() - start
+        start = time.perf_counter_ns()
+        self.cleaner.correct_batch_outliers(matrix)
+        timings['outliers'] += time.perf_counter_ns() - start
+        start = time.perf_counter_ns()
+        kept = np.flatnonzero(recoverable)
+        series_features = self.extractor.compute_series_features(matrix[kept]).tolist()
+        timings['features'] += time.perf_counter_ns() - start
+        features = [None] * len(raw_sessions)
+        for position, values in zip(kept.tolist(), series_features):
+            features[position] = tuple(values)
+        return features
+
+
+IMPLEMENTATIONS = {implementation.name: implementation
+                   for implementation in (ScalarPreparation, SessionPreparation, BatchPreparation)}
+
+
+def load_plugin(path: str) -> type:
+    """
+    Loads an implementation from another module
+    :param path: module and class name, as module:Class
+    :return: class of the implementation
+    """
+    module_name, class_name = path.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def generate_raw_sessions(sessions: int, missing_rate: float, outlier_rate: float,
+                          seed: int = 42) -> list:
+    """
+    Generates raw sessions whose pressure drifts around a level of the session.
+    Missing samples come alone or in short bursts, outliers fall outside [min_value, max_value].
+    :param sessions: number of raw sessions to generate
+    :param missing_rate: probability of a sample to be missing
+    :param outlier_rate: probability of a sample to be an outlier
+    :param seed: seed of the random generator
+    :return: list of raw sessions
+    """
+    rng = np.random.default_rng(seed)
+    raw_sessions = []
+    for i in range(sessions):
+        level = rng.uniform(0.5, 2.5)
+        drift = np.cumsum(rng.normal(0, 0.02, NUM_SAMPLES))
+        samples = np.round(np.clip(level + drift + rng.normal(0, 0.1, NUM_SAMPLES), 0, 3.5), 3)
+        outliers = rng.random(NUM_SAMPLES) < outlier_rate
+        samples[outliers] = np.where(rng.random(np.count_nonzero(outliers)) < 0.5,
+                                     rng.uniform(3.6, 6.0, np.count_nonzero(outliers)),
+                                     rng.uniform(-2.0, -0.1, np.count_nonzero(outliers)))
+        time_series = samples.tolist()
+        # Half of the missing samples start a burst of up to three
+        for position in np.flatnonzero(rng.random(NUM_SAMPLES) < missing_rate).tolist():
+            length = int(rng.integers(1, 4)) if rng.random() < 0.5 else 1
+            for burst in range(position, min(position + length, NUM_SAMPLES)):
+                time_series[burst] = None
+        raw_sessions.append({'uuid': f'benchmark-{i}', 'calendar': 'sport',
+                             'environment': 'plain', 'pressure_detected': 'Regular',
+                             'time_series': time_series})
+    return raw_sessions
+
+
+def batches(raw_sessions: list, batch_size: int) -> list:
+    """
+    :return: the raw sessions split in batches of batch_size
+    """
+    return [raw_sessions[i:i + batch_size] for i in range(0, len(raw_sessions), batch_size)]
+
+
+def measure_allocations(implementation: PreparationImplementation, raw_sessions: list) -> float:
+    """
+    Measures the memory allocated while preparing the raw sessions, with tracemalloc
+    (NumPy buffers included). The allocations freed inside a batch cannot be counted,
+    so the peak of the memory allocated by every batch is measured.
+    :return: peak of the memory allocated by a batch, divided by its raw sessions, in bytes
+    """
+    total = 0
+    tracemalloc.start()
+    for batch in batches(copy.deepcopy(raw_sessions), implementation.batch_size):
+        timings = dict.fromkeys(STAGES, 0)
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        implementation.prepare(batch, timings)
+        total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return total / len(raw_sessions)
+
+
+def compare(features: list, reference: list) -> dict:
+    """
+    :return: number of raw sessions discarded differently and maximum
+    difference of the features from the reference implementation
+    """
+    mismatches = 0
+    max_difference = 0.0
+    for values, expected in zip(features, reference):
+        if (values is None) != (expected is None):
+            mismatches += 1
+        elif values is not None:
+            max_difference = max(max_difference, max(abs(a - b) for a, b in zip(values, expected)))
+    return {'discard_mismatches': mismatches, 'max_feature_difference': max_difference}
+
+
+def run_benchmark(implementation: PreparationImplementation, raw_sessions: list,
+                  repeat: int) -> tuple:
+    """
+    Runs an implementation on the raw sessions
+    :return: results and features of the last run
+    """
+    timings = dict.fromkeys(STAGES, 0)
+    elapsed = 0
+    features = []
+    for _ in range(repeat):
+        # Every run cleans fresh copies, the copy is not measured
+        run_batches = batches(copy.deepcopy(raw_sessions), implementation.batch_size)
+        features = []
+        start = time.perf_counter_ns()
+        for batch in run_batches:
+            features += implementation.prepare(batch, timings)
+        elapsed += time.perf_counter_ns() - start
+    sessions = len(raw_sessions) * repeat
+    result = {
+        'implementation': implementation.name,
+        'batch_size': implementation.batch_size,
+        'sessions_per_second': sessions / (elapsed / 1e9),
+        'us_per_session': elapsed / sessions / 1000,
+        'stage_us_per_session': {stage: timings[stage] / sessions / 1000 for stage in STAGES},
+        'peak_allocated_bytes_per_session': measure_allocations(implementation, raw_sessions),
+        'discarded_sessions': sum(values is None for values in features)
+    }
+    return result, features
+
+
+def main() -> None:
+    """
+    Runs the benchmark and emits the results as JSON
+    """
+    parser = argparse.ArgumentParser(description='Preparation System benchmark')
+    parser.add_argument('--sessions', type=int, default=500, help='raw sessions to prepare')
+    parser.add_argument('--missing-rate', type=float, default=0.002,
+                        help='probability of a sample to be missing')
+    parser.add_argument('--outlier-rate', type=float, default=0.01,
+                        help='probability of a sample to be an outlier')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='raw sessions given to every call of prepare')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every implementation')
+    parser.add_argument('--implementations', nargs='+', choices=list(IMPLEMENTATIONS),
+                        default=list(IMPLEMENTATIONS))
+    parser.add_argument('--plugin', action='append', default=[],
+                        help='other implementation to compare, as module:Class')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='file where the JSON results are written')
+    args = parser.parse_args()
+
+    raw_sessions = generate_raw_sessions(args.sessions, args.missing_rate,
+                                         args.outlier_rate, args.seed)
+    classes = [IMPLEMENTATIONS[name] for name in args.implementations] + \
+        [load_plugin(path) for path in args.plugin]
+
+    results = []
+    reference = None
+    # The system prints and logs for every session, keep it out of the measures
+    logging.disable(logging.CRITICAL)
+    for implementation_class in classes:
+        with contextlib.redirect_stdout(io.StringIO()):
+            implementation = implementation_class(args.batch_size)
+            result, features = run_benchmark(implementation, raw_sessions, args.repeat)
+        if reference is None:
+            reference = (implementation.name, features)
+        result['reference'] = reference[0]
+        result.update(compare(features, reference[1]))
+        results.append(result)
+    logging.disable(logging.NOTSET)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'sessions': args.sessions,
+        'missing_rate': args.missing_rate,
+        'outlier_rate': args.outlier_rate,
+        'seed': args.seed,
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=2)
+    for result in results:
+        print(f"[+] {result['implementation']:>8}: {result['sessions_per_second']:.0f} sessions/s, "
+              f"{result['us_per_session']:.1f} us/session, "
+              f"{result['peak_allocated_bytes_per_session'] / 1024:.1f} KiB peak/session", file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import copy
+import random
+import numpy as np
+from src.session_cleaning import SessionCleaning
+
+'''
+Module Name: SessionCleaningBenchmark
+Description: Compares the per-session cost of the vectorized SessionCleaning
+with the previous scalar implementation and checks that both produce the same series.
+Run it from the preparation_system folder: python -m benchmark.session_cleaning_benchmark [sessions]
+'''
+
+NUM_SAMPLES = 1236
+DEFAULT_SESSIONS = 2000
+
+
+class ScalarSessionCleaning:
+    """
+    Previous scalar implementation of SessionCleaning, kept only as a baseline
+    """
+    def __init__(self, min_value: float, max_value: float) -> None:
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def correct_missing_samples(self, time_series: list) -> bool:
+        for i, value in enumerate(time_series):
+            if value is None:
+                if 3 <= i <= 1232:
+                    self.interpolate_list(time_series, i)
+                else:
+                    return False
+        return True
+
+    @staticmethod
+    def interpolate_list(time_series, missing_value) -> None:
+        lists_to_use = [missing_value - 1, missing_value + 1, missing_value - 2, \
+                        missing_value + 2, missing_value - 3, missing_value + 3]
+        value = 0
+        list_number = 0
+        for i in lists_to_use:
+            if time_series[i]:
+                value += time_series[i]
+                list_number += 1
+        if list_number != 0:
+            time_series[missing_value] = value / list_number
+
+    def correct_outliers(self, time_series: list) -> None:
+        for i, value in enumerate(time_series):
+            if value > self.max_value:
+                time_series[i] = self.max_value
+            elif value < self.min_value:
+                time_series[i] = self.min_value
+
+
+def generate_series(sessions: int, seed: int = 42) -> list:
+    """
+    Generates pressure time series with isolated and clustered missing samples,
+    zero samples and outliers (most series have no missing sample)
+    :param sessions: number of series to generate
+    :param seed: seed of the random generator
+    :return: list of time series
+    """
+    rng = random.Random(seed)
+    generated = []
+    for _ in range(sessions):
+        series = [round(rng.uniform(-0.5, 4.0), 3) for _ in range(NUM_SAMPLES)]
+        for _ in range(rng.randint(0, 3)):
+            series[rng.randrange(3, NUM_SAMPLES - 3)] = 0
+        for _ in range(rng.choice([0, 0, 0, 1, 2])):
+            start = rng.randrange(3, NUM_SAMPLES - 6)
+            for position in range(start, start + rng.randint(1, 3)):
+                series[position] = None
+        generated.append(series)
+    return generated
+
+
+def clean_all_scalar(cleaner: ScalarSessionCleaning, series: list) -> tuple:
+    """
+    Cleans a copy of every series with correct_missing_samples and correct_outliers
+    :return: cleaned series (None if unrecoverable) and seconds per session
+    """
+    series = copy.deepcopy(series)
+    start = time.perf_counter()
+    for i, time_series in enumerate(series):
+        if cleaner.correct_missing_samples(time_series):
+            cleaner.correct_outliers(time_series)
+        else:
+            series[i] = None
+    return series, (time.perf_counter() - start) / len(series)
+
+
+def clean_all_vectorized(cleaner: SessionCleaning, series: list) -> tuple:
+    """
+    Cleans every series on its own with the vectorized SessionCleaning
+    :return: cleaned series (None if unrecoverable) and seconds per session
+    """
+    cleaned = []
+    start = time.perf_counter()
+    for time_series in series:
+        # None values are converted to NaN
+        matrix = np.array(time_series, dtype=np.float64).reshape(1, -1)
+        if cleaner.correct_batch_missing_samples(matrix)[0][0]:
+            cleaner.correct_batch_outliers(matrix)
+            cleaned.append(matrix[0].tolist())
+        else:
+            cleaned.append(None)
+    return cleaned, (time.perf_counter() - start) / len(series)
+
+
+def clean_all_batch(cleaner: SessionCleaning, series: list) -> tuple:
+    """
+    Cleans all the series at once with the vectorized SessionCleaning
+    :return: cleaned series (None if unrecoverable) and seconds per session
+    """
+    start = time.perf_counter()
+    # None values are converted to NaN
+    matrix = np.array(series, dtype=np.float64)
+    recoverable = cleaner.correct_batch_missing_samples(matrix)[0]
+    cleaner.correct_batch_outliers(matrix)
+    cleaned = [row if is_recoverable else None
+               for row, is_recoverable in zip(matrix.tolist(), recoverable.tolist())]
+    return cleaned, (time.perf_counter() - start) / len(series)
+
+
+def main() -> None:
+    """
+    Runs the benchmark and prints the results
+    """
+    series = generate_series(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SESSIONS)
+    vectorized = SessionCleaning()
+    scalar = ScalarSessionCleaning(vectorized.min_value, vectorized.max_value)
+
+    scalar_series, scalar_cost = clean_all_scalar(scalar, series)
+    vectorized_series, vectorized_cost = clean_all_vectorized(vectorized, series)
+    batch_series, batch_cost = clean_all_batch(vectorized, series)
+    results = {
+        'sessions': len(series),
+        'scalar_us_per_session': scalar_cost * 1e6,
+        'vectorized_us_per_session': vectorized_cost * 1e6,
+        'batch_us_per_session': batch_cost * 1e6,
+        'speedup': scalar_cost / batch_cost,
+        'identical_results': scalar_series == vectorized_series == batch_series
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import sys
+import hashlib
+from threading import Lock
+from collections import OrderedDict
+import numpy as np
+
+'''
+Module Name: FeatureCache
+Description: This class caches the features of the pressure time series
+of the raw sessions already prepared.
+'''
+class FeatureCache:
+    """
+    LRU cache of the series features of the raw sessions, keyed by the uuid
+    and a hash of the time series, so that a raw session received again
+    skips cleaning and feature extraction. The memory used by the entries is capped.
+    """
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Initializes an empty cache.
+        :param max_bytes: Maximum memory used by the entries of the cache, 0 disables it.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def make_key(uuid: str, samples: np.ndarray) -> tuple:
+        """
+        :param uuid: uuid of the raw session
+        :param samples: array of the samples of the time series, NaN marks a missing sample
+        :return: key of the raw session in the cache
+        """
+        return uuid, hashlib.blake2b(samples.tobytes(), digest_size=16).digest()
+
+    @staticmethod
+    def entry_size(key: tuple, value: tuple) -> int:
+        """
+        :param key: key of the entry
+        :param value: value of the entry
+        :return: approximate memory used by the entry
+        """
+        return sys.getsizeof(key) + sum(sys.getsizeof(item) for item in key) + \
+            sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+
+    def get(self, key: tuple) -> tuple:
+        """
+        Looks up the series features of a raw session, marking them as the most recently used.
+        :param key: key of the raw session
+        :return: the series features, an empty tuple if the raw session was discarded,
+        None if the raw session is not in the cache.
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: tuple) -> None:
+        """
+        Stores the series features of a raw session, evicting the least
+        recently used entries beyond the memory cap.
+        :param key: key of the raw session
+        :param value: the series features, an empty tuple if the raw session was discarded
+        :return: None
+        """
+        size = self.entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.used_bytes -= self.entry_size(key, previous)
+            self.entries[key] = value
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                evicted_key, evicted_value = self.entries.popitem(last=False)
+                self.used_bytes -= self.entry_size(evicted_key, evicted_value)
+                self.evictions += 1
+
+    def get_statistics(self) -> dict:
+        """
+        :return: dictionary with the hits, misses and evictions of the cache,
+        the number of entries and the memory they use
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'used_bytes': self.used_bytes,
+                'max_bytes': self.max_bytes
+            }
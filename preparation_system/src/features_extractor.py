@@ -1,5 +1,6 @@
 import random
 import sys
+import logging
 import numpy as np
 from jsonschema import ValidationError
 from src.preparation_system_configuration import PreparationSystemConfiguration
@@ -7,9 +8,139 @@ from src.preparation_system_configuration import PreparationSystemConfiguration
 CONFIG_PATH = './data/preparation_system_config.json'
 CONFIG_SCHEMA_PATH = './data/preparation_system_config_schema.json'
 
+# Series features that can be declared in the configuration, by name
+SERIES_FEATURES = {}
+
+
+def series_feature(name: str):
+    """
+    Registers a series feature, computed by the decorated function from the SeriesStatistics
+    of a batch of time series. It must not scan the time series again, but read the
+    statistics already computed (e.g. the mean) or add a shared one to SeriesStatistics.
+    :param name: Name of the feature in the prepared session.
+    :return: decorator
+    """
+    def register(function):
+        SERIES_FEATURES[name] = function
+        return function
+    return register
+
+
+class SeriesStatistics:
+    """
+    Statistics of a batch of time series shared by the series features.
+    Every statistic is computed at most once, when a feature needs it, and none of them
+    sorts the time series: the extremes are reductions along the rows and the median
+    only partitions the samples around the middle positions.
+    """
+    def __init__(self, samples: np.ndarray, partitioned: np.ndarray,
+                 deviations: np.ndarray) -> None:
+        """
+        :param samples: 2-D array of the time series, one per row.
+        :param partitioned: Preallocated 2-D array of the same shape, used for the median.
+        :param deviations: Preallocated 2-D array of the same shape, used for the deviations.
+        """
+        self.samples = samples
+        self.partitioned = partitioned
+        self.deviations = deviations
+        self.maximum_value = None
+        self.minimum_value = None
+        self.median_value = None
+        self.mean_value = None
+        self.absolute_deviations = None
+
+    def maximum(self) -> np.ndarray:
+        """
+        :return: maximum of each time series
+        """
+        if self.maximum_value is None:
+            self.maximum_value = self.samples.max(axis=1)
+        return self.maximum_value
+
+    def minimum(self) -> np.ndarray:
+        """
+        :return: minimum of each time series
+        """
+        if self.minimum_value is None:
+            self.minimum_value = self.samples.min(axis=1)
+        return self.minimum_value
+
+    def median(self) -> np.ndarray:
+        """
+        :return: median of each time series
+        """
+        if self.median_value is None:
+            # A single partition around the upper middle sample, for an even length the lower
+            # middle sample is the largest one on its left
+            middle = self.samples.shape[1] // 2
+            self.partitioned[...] = self.samples
+            self.partitioned.partition(middle, axis=1)
+            upper = self.partitioned[:, middle]
+            if self.samples.shape[1] % 2 == 0:
+                self.median_value = (self.partitioned[:, :middle].max(axis=1) + upper) / 2
+            else:
+                self.median_value = upper.copy()
+        return self.median_value
+
+    def mean(self) -> np.ndarray:
+        """
+        :return: mean of each time series
+        """
+        if self.mean_value is None:
+            self.mean_value = self.samples.mean(axis=1)
+        return self.mean_value
+
+    def absolute_deviation(self) -> np.ndarray:
+        """
+        :return: absolute deviation of every sample from the mean of its time series
+        """
+        if self.absolute_deviations is None:
+            np.subtract(self.samples, self.mean()[:, None], out=self.deviations)
+            self.absolute_deviations = np.abs(self.deviations, out=self.deviations)
+        return self.absolute_deviations
+
+
+@series_feature('maximum_pressure_ts')
+def maximum_pressure(statistics: SeriesStatistics) -> np.ndarray:
+    """
+    :param statistics: SeriesStatistics of a batch of time series.
+    :return: Maximum of each time series
+    """
+    return statistics.maximum()
+
+
+@series_feature('minimum_pressure_ts')
+def minimum_pressure(statistics: SeriesStatistics) -> np.ndarray:
+    """
+    :param statistics: SeriesStatistics of a batch of time series.
+    :return: Minimum of each time series
+    """
+    return statistics.minimum()
+
+
+@series_feature('median_pressure_ts')
+def median_pressure(statistics: SeriesStatistics) -> np.ndarray:
+    """
+    :param statistics: SeriesStatistics of a batch of time series.
+    :return: Median of each time series
+    """
+    return statistics.median()
+
+
+@series_feature('mean_absolute_deviation_pressure_ts')
+def mean_absolute_deviation_pressure(statistics: SeriesStatistics) -> np.ndarray:
+    """
+    :param statistics: SeriesStatistics of a batch of time series.
+    :return: Mean absolute deviation of each time series
+    """
+    return statistics.absolute_deviation().mean(axis=1)
+
+
 class FeaturesExtractor:
     """
     Class that extracts features and prepares the session to be sent.
+    It is meant to be built once, the series features declared
+    in the configuration are computed over preallocated arrays.
     """
     def __init__(self) -> None:
         """
@@ -19,37 +150,65 @@ class FeaturesExtractor:
             self.configuration = PreparationSystemConfiguration(CONFIG_PATH, CONFIG_SCHEMA_PATH)
         except ValidationError:
             sys.exit(1)
+        unknown_features = [name for name in self.configuration.series_features
+                            if name not in SERIES_FEATURES]
+        if unknown_features:
+            logging.error('Series features not registered: %s', unknown_features)
+            sys.exit(1)
+        self.series_features = [(name, SERIES_FEATURES[name])
+                                for name in self.configuration.series_features]
+        self.partition_buffer = None
+        self.deviation_buffer = None
 
-    def extract_features(self, raw_session: dict, prepared_session: dict):
+    def compute_series_features(self, matrix: np.ndarray) -> np.ndarray:
         """
-        Extracts the relevant features from the session data.
-        :param raw_session: Raw session data.
-        :param prepared_session: Dictionary to store the prepared session to send.
-        :return: None
+        Computes the series features declared in the configuration for a batch of
+        pressure time series. Every feature is read from the shared SeriesStatistics,
+        whose working arrays are preallocated and reused across batches.
+        :param matrix: 2-D array of the cleaned pressure time series, one per row.
+        :return: 2-D array with the series features of each time series, one per row,
+        in the order of the configuration.
         """
-        max_pressure, min_pressure, median_pressure, \
-            mean_absolute_deviation, env_and_scatter, act_and_scatter = \
-            self.extract_shoes_sensors_features(raw_session, self.configuration.features)
-        self.prepare_session(raw_session, prepared_session, max_pressure, min_pressure, \
-                        median_pressure, mean_absolute_deviation, env_and_scatter, act_and_scatter)
+        rows, length = matrix.shape
+        if self.partition_buffer is None or self.partition_buffer.shape[0] < rows or \
+                self.partition_buffer.shape[1] != length:
+            self.partition_buffer = np.empty((rows, length))
+            self.deviation_buffer = np.empty((rows, length))
+        statistics = SeriesStatistics(matrix, self.partition_buffer[:rows],
+                                      self.deviation_buffer[:rows])
 
-    def extract_shoes_sensors_features(self, raw_session: list, features: dict):
+        series_features = np.empty((rows, len(self.series_features)))
+        for column, (_, feature) in enumerate(self.series_features):
+            series_features[:, column] = feature(statistics)
+        return series_features
+
+    def prepare_batch_sessions(self, raw_sessions: list, series_features: np.ndarray) -> list:
         """
-        Extracts the relevant features from the preussure time series data of the raw session data.
-        :param time_series: List of pressure time series.
-        :param features: Dictionary of features to extract from the pressure time series.
-        :return: Lists of extracted features.
+        Prepares a batch of sessions given the features of their pressure time series.
+        :param raw_sessions: List of raw sessions.
+        :param series_features: 2-D array returned by compute_series_features,
+        one row per raw session.
+        :return: List of prepared sessions, in the same order of the raw sessions.
         """
+        prepared_sessions = []
+        for raw_session, values in zip(raw_sessions, series_features.tolist()):
+            env_and_scatter, act_and_scatter = \
+                self.extract_scatter_features(raw_session, self.configuration.features)
+            prepared_session = {}
+            self.prepare_session(raw_session, prepared_session, \
+                                 dict(zip(self.configuration.series_features, values)), \
+                                 env_and_scatter, act_and_scatter)
+            prepared_sessions.append(prepared_session)
+        return prepared_sessions
 
-        max_pressure = max(raw_session['time_series'])
-
-        min_pressure = min(raw_session['time_series'])
-
-        median_pressure = np.median(raw_session['time_series'])
-
-        mean_value = np.mean(raw_session['time_series'])
-        mean_absolute_deviation = np.mean(np.abs(np.array(raw_session['time_series']) - mean_value))
-
+    @staticmethod
+    def extract_scatter_features(raw_session: dict, features: dict):
+        """
+        Extracts the environment and activity features adding a small random scatter.
+        :param raw_session: Raw session data.
+        :param features: Dictionary of the values of environments and activities.
+        :return: environment and small scatter, activity and small scatter
+        """
         operation_env = random.randint(0, 1)
         scattering_env = random.uniform(0, 0.5)
         operation_act = random.randint(0, 1)
@@ -70,21 +229,16 @@ class FeaturesExtractor:
         else:
             activity_and_small_scatter = features['calendar'][raw_session['calendar']] - \
                 scattering_act
-        return max_pressure, min_pressure, median_pressure, \
-            mean_absolute_deviation, environment_and_small_scatter, activity_and_small_scatter
+        return environment_and_small_scatter, activity_and_small_scatter
 
     @staticmethod
-    def prepare_session(raw_session: dict, prepared_session: dict, max_pressure: int,
-                        min_pressure: int, median_pressure: int, mean_absolute_deviation: int,
+    def prepare_session(raw_session: dict, prepared_session: dict, series_features: dict,
                         env_and_scatter: int, act_and_scatter: int):
         """
         Prepares the session (development mode).
         :param raw_session: Raw session data.
         :param prepared_session: Dictionary to store the prepared session to be sent.
-        :param max_pressure: Max pressure detected.
-        :param min_pressure: Min pressure detected.
-        :param median_pressure: Median pressure detected.
-        :param mean_absolute_deviation: MAD of the detected time series.
+        :param series_features: Features of the pressure time series, by name.
         :param env_and_scatter: environment and small scatter
         :param act_and_scatter: activity and small scatter
         :return: None
@@ -93,11 +247,7 @@ class FeaturesExtractor:
         prepared_session['calendar'] = raw_session['calendar']
         prepared_session['environment'] = raw_session['environment']
         prepared_session['label'] = raw_session['pressure_detected']
-        prepared_session['features'] = {}
-        prepared_session['features']['maximum_pressure_ts'] = max_pressure
-        prepared_session['features']['minimum_pressure_ts'] = min_pressure
-        prepared_session['features']['median_pressure_ts'] = median_pressure
-        prepared_session['features']['mean_absolute_deviation_pressure_ts'] = mean_absolute_deviation
+        prepared_session['features'] = dict(series_features)
         prepared_session['features']['environment_and_small_scatter'] = env_and_scatter
         prepared_session['features']['activity_and_small_scatter'] = act_and_scatter
 
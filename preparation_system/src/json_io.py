@@ -1,17 +1,91 @@
 import sys
+import time
 import queue
 import logging
 from typing import Any
-from threading import Thread
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request
-from requests import post, exceptions
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 from jsonschema import ValidationError
 from src.preparation_system_configuration import PreparationSystemConfiguration
-from datetime import datetime
+from src.session_forwarder import SessionForwarder
+from src.time_series_codec import TimeSeriesCodec, ENCODING, ENCODING_HEADER
 
 CONFIG_PATH = './data/preparation_system_config.json'
 CONFIG_SCHEMA_PATH = './data/preparation_system_config_schema.json'
 
+class IntakeRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that closes the keep-alive connections idle for longer than
+    the keep-alive timeout of the server, so that idle clients do not hold the threads of the pool.
+    """
+    def setup(self) -> None:
+        """
+        Sets the timeout of the socket of the connection.
+        """
+        self.timeout = self.server.keep_alive_timeout
+        super().setup()
+
+    def log_error(self, format: str, *args) -> None:
+        """
+        Closing an idle connection is not an error, the other errors are logged.
+        """
+        if format.startswith('Request timed out'):
+            return
+        super().log_error(format, *args)
+
+
+class IntakeServer(BaseWSGIServer):
+    """
+    WSGI server that handles the connections on a fixed pool of threads
+    instead of starting a thread for every connection.
+    At most max_pending connections wait for a thread, the other ones are closed.
+    """
+    # Connections are handled concurrently, so keep-alive is enabled as in the threaded server
+    multithread = True
+
+    def __init__(self, host: str, port: int, app: Flask, workers: int, max_pending: int, \
+                 keep_alive_timeout: int) -> None:
+        """
+        :param host: IP address to listen on.
+        :param port: Port to listen on.
+        :param app: Flask application.
+        :param workers: Number of threads handling the connections.
+        :param max_pending: Maximum number of connections waiting for a thread.
+        :param keep_alive_timeout: Seconds after which an idle connection is closed.
+        """
+        super().__init__(host, port, app, handler=IntakeRequestHandler)
+        self.keep_alive_timeout = keep_alive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='intake')
+        # Connections served or waiting for a thread
+        self.slots = BoundedSemaphore(workers + max_pending)
+        self.refused_connections = 0
+
+    def process_request(self, request, client_address) -> None:
+        """
+        Hands a new connection over to the pool of threads,
+        or closes it if too many connections are already waiting.
+        """
+        if not self.slots.acquire(blocking=False):
+            self.refused_connections += 1
+            self.shutdown_request(request)
+            return
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address) -> None:
+        """
+        Serves a connection on a thread of the pool.
+        """
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
 class JsonIO:
     """
     JsonIO is a class that provides functionality for sending and receiving JSON payloads.
@@ -29,7 +103,23 @@ class JsonIO:
         except ValidationError:
             sys.exit(1)
         self.app = Flask(__name__)
-        self.received_json_queue = queue.Queue()
+        self.received_json_queue = queue.Queue(maxsize=self.configuration.intake_queue_size)
+        self.high_water_mark = self.configuration.intake_high_water_mark
+        self.intake_lock = Lock()
+        self.intake_metrics = {
+            'enqueued': 0,
+            'rejected_overload': 0,
+            'max_queue_depth': 0
+        }
+        self.metrics = {'intake': self.get_intake_metrics}
+        self.forwarder = SessionForwarder(queue_size=self.configuration.forward_queue_size, \
+                                          batch_size=self.configuration.forward_batch_size, \
+                                          backoff_ms=self.configuration.forward_backoff_ms, \
+            log_url=f'http://{self.configuration.input_system_ip}:{self.configuration.input_system_port}/log')
+        self.forwarder.add_destination('production', \
+            f'http://{self.configuration.production_system_ip}:{self.configuration.production_system_port}/preparedsession')
+        self.forwarder.add_destination('segregation', \
+            f'http://{self.configuration.segregation_system_ip}:{self.configuration.segregation_system_port}/preparedsessions')
 
     @staticmethod
     def get_instance() -> Any:
@@ -53,7 +143,12 @@ class JsonIO:
         :param port: Port to listen on.
         :return: None
         """
-        self.app.run(host=ip, port=port, debug=False)
+        print(f'[+] Listening on {ip}:{port} with {self.configuration.intake_workers} intake workers')
+        server = IntakeServer(ip, port, self.app, self.configuration.intake_workers, \
+                              self.configuration.intake_max_pending, \
+                              self.configuration.intake_keep_alive_timeout)
+        self.add_metrics('connections', lambda: {'refused': server.refused_connections})
+        server.serve_forever()
 
     def receive(self) -> Any:
         """
@@ -63,21 +158,95 @@ class JsonIO:
         """
         return self.received_json_queue.get(block=True)
 
+    def receive_batch(self, max_size: int, timeout: float, wait: float = None) -> list:
+        """
+        Retrieves a batch of raw sessions from the received JSON queue.
+        It blocks until the first raw session is received, then waits
+        for other ones until the batch is full or the timeout expires.
+        :param max_size: Maximum number of raw sessions of the batch.
+        :param timeout: Maximum seconds to wait after the first raw session.
+        :param wait: Maximum seconds to wait for the first raw session, no limit if not set.
+        :return: List of raw sessions, empty if none is received within wait.
+        """
+        batch = []
+        wait_deadline = None if wait is None else time.monotonic() + wait
+        while not batch:
+            try:
+                if wait_deadline is None:
+                    received_json = self.received_json_queue.get(block=True)
+                else:
+                    received_json = self.received_json_queue.get(
+                        block=True, timeout=max(0.0, wait_deadline - time.monotonic()))
+            except queue.Empty:
+                return batch
+            # Start messages are not raw sessions
+            if not isinstance(received_json, bool):
+                batch.append(received_json)
+        deadline = time.monotonic() + timeout
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    received_json = self.received_json_queue.get(block=True, timeout=remaining)
+                else:
+                    received_json = self.received_json_queue.get(block=False)
+            except queue.Empty:
+                break
+            if not isinstance(received_json, bool):
+                batch.append(received_json)
+        return batch
+
+    def add_metrics(self, name: str, provider) -> None:
+        """
+        Adds a group of metrics exported by the metrics endpoint.
+        :param name: Name of the group of metrics.
+        :param provider: Function that returns the dictionary of the metrics.
+        :return: None
+        """
+        self.metrics[name] = provider
+
+    def get_metrics(self) -> dict:
+        """
+        :return: dictionary with every group of metrics
+        """
+        return {name: provider() for name, provider in self.metrics.items()}
+
     # -------- SERVER HANDLER --------
 
-    def put_received_record(self, received_json) -> bool:
+    def put_received_record(self, received_json) -> int:
         """
-        Adds the received JSON payload to _received_json_queue.
+        Adds the received JSON payload to received_json_queue without waiting.
+        It is refused if the queue has reached the high-water mark.
         :param received_json: JSON payload received by the server.
-        :return: None
+        :return: 200 if the payload is enqueued, 429 if the queue is above the high-water mark.
         """
-        # If the queue is full the thread is blocked
         try:
-            self.received_json_queue.put(received_json, timeout=5)
+            if self.received_json_queue.qsize() >= self.high_water_mark:
+                raise queue.Full
+            self.received_json_queue.put_nowait(received_json)
         except queue.Full:
-            print("Full queue exception")
-            return False
-        return True
+            with self.intake_lock:
+                self.intake_metrics['rejected_overload'] += 1
+            return 429
+        depth = self.received_json_queue.qsize()
+        with self.intake_lock:
+            self.intake_metrics['enqueued'] += 1
+            self.intake_metrics['max_queue_depth'] = \
+                max(self.intake_metrics['max_queue_depth'], depth)
+        return 200
+
+    def get_intake_metrics(self) -> dict:
+        """
+        :return: dictionary with the depth of the intake queue,
+        the enqueued and rejected raw sessions
+        """
+        with self.intake_lock:
+            metrics = dict(self.intake_metrics)
+        metrics['queue_depth'] = self.received_json_queue.qsize()
+        metrics['queue_size'] = self.received_json_queue.maxsize
+        metrics['high_water_mark'] = self.high_water_mark
+        metrics['workers'] = self.configuration.intake_workers
+        return metrics
 
     def send_to_main(self):
         self.received_json_queue.put(True, block=True)
@@ -85,44 +254,30 @@ class JsonIO:
     # -------- CLIENT REQUEST --------
     def send(self, json_to_send: dict, dest_system: str) -> bool:
         """
-        Sends a JSON payload to a specified endpoint.
+        Sends a JSON payload to a specified endpoint in background.
         :param json_to_send: The JSON payload to send.
         :dest_system: destination system
-        :return: True if the payload is sent successfully, False otherwise.
+        :return: True if the payload is enqueued to be sent.
         """
-        try:
-            if dest_system == "production":
-                connection_string = \
-                    f'http://{self.configuration.production_system_ip}:{self.configuration.production_system_port}/preparedsession'
-            elif dest_system == "segregation":
-                connection_string = \
-                    f'http://{self.configuration.segregation_system_ip}:{self.configuration.segregation_system_port}/preparedsession'
-            response = post(connection_string, json=json_to_send, timeout=5)
-            if response.status_code != 200:
-                error_message = response.json()['error']
-                print(f'[-] Error: {error_message}')
-                return False
-            self.send_log(json_to_send['_id'])
-        except exceptions.RequestException as e:
-            print(f'[-] Connection Error (endpoint unreachable): {e}')
-            sys.exit(1)
-        return True
+        return self.send_batch([json_to_send], dest_system) == 1
+
+    def send_batch(self, prepared_sessions: list, dest_system: str) -> int:
+        """
+        Sends a batch of prepared sessions to a specified endpoint in background, in order.
+        The log of every prepared session is sent once it is delivered.
+        :param prepared_sessions: List of prepared sessions to send.
+        :dest_system: destination system
+        :return: Number of prepared sessions enqueued to be sent.
+        """
+        return self.forwarder.forward(dest_system, prepared_sessions)
 
     def send_log(self, uuid:str) -> None:
-        data = {
-            'uuid': uuid,
-            'system_source': 'preparation',
-            'timestamp': datetime.now().isoformat()
-        }
-        connection_string = f'http://{self.configuration.input_system_ip}:{self.configuration.input_system_port}/log'
-        print(f'[INFO] Send log: {data} to {connection_string}')
-        try:
-            response = post(url=connection_string, json=data, timeout=3)
-            if response.status_code != 200:
-                error_message = response.json()['error']
-                print(f'[ERROR] error: {error_message}')
-        except Exception as e:
-            print(f'[ERROR] log unreachable for {uuid} caused error: {e}')
+        """
+        Sends the log of a prepared session in background.
+        :param uuid: uuid of the prepared session.
+        :return: None
+        """
+        self.forwarder.log(uuid)
 
 app = JsonIO.get_instance().app
 log = logging.getLogger('werkzeug')
@@ -133,6 +288,8 @@ log.setLevel(logging.ERROR)
 def post_json():
     """
     The function is called when a post request is received on the json endpoint.
+    The time series of the raw session is a JSON list, or it is encoded
+    if the X-Time-Series-Encoding header is set.
     :return: Returns a JSON response with status code 200 if the request is successful,
             and with status code 500 if it's not.
     """
@@ -140,12 +297,30 @@ def post_json():
         return {'error': 'No JSON received'}, 500
 
     received_json = request.json
+    # The Ingestion System may send the time series encoded, as the header says
+    encoding = request.headers.get(ENCODING_HEADER)
+    if encoding is not None:
+        if encoding != ENCODING:
+            return {'error': f'Unsupported time series encoding {encoding}'}, 415
+        if not isinstance(received_json, dict):
+            return {'error': 'Malformed raw session'}, 400
+        try:
+            received_json['time_series'] = TimeSeriesCodec.decode(received_json.get('time_series'))
+        except ValueError as e:
+            return {'error': str(e)}, 400
 
-    new_thread = Thread(target=JsonIO.get_instance().put_received_record, args=(received_json,))
-    new_thread.start()
+    status = JsonIO.get_instance().put_received_record(received_json)
+    if status == 429:
+        return {'error': 'Intake queue full'}, 429, retry_after()
 
     return {}, 200
 
+def retry_after() -> dict:
+    """
+    :return: headers of the responses that refuse a raw session, with the seconds to wait
+    """
+    return {'Retry-After': str(JsonIO.get_instance().configuration.intake_retry_after)}
+
 @app.get('/start')
 def start_system():
     """
@@ -155,6 +330,13 @@ def start_system():
             and with status code 500 if it's not.
     """
     print("[INFO] Start msg received")
-    receive_thread = Thread(target=JsonIO.get_instance().send_to_main)
-    receive_thread.start()
+    JsonIO.get_instance().send_to_main()
     return {}, 200
+
+@app.get('/metrics')
+def get_metrics():
+    """
+    The function is called when a get request is received on the metrics endpoint.
+    :return: Returns a JSON response with the metrics of the system and status code 200.
+    """
+    return JsonIO.get_instance().get_metrics(), 200
@@ -0,0 +1,100 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from src.session_cleaning import SessionCleaning
+from src.features_extractor import FeaturesExtractor
+
+'''
+Module Name: PreparationPool
+Description: This class cleans the pressure time series and extracts their
+features on a pool of worker processes.
+'''
+
+# SessionCleaning and FeaturesExtractor instances of the worker process
+worker_cleaner = None
+worker_extractor = None
+
+
+def init_worker() -> None:
+    """
+    Initializes a worker process, loading the configuration once.
+    :return: None
+    """
+    global worker_cleaner, worker_extractor
+    worker_cleaner = SessionCleaning()
+    worker_extractor = FeaturesExtractor()
+
+
+def prepare_shard(name: str, shape: tuple, start: int, stop: int) -> tuple:
+    """
+    Cleans the rows [start, stop) of a batch of time series held in shared memory
+    and computes their features. It runs in a worker process.
+    :param name: Name of the shared memory block.
+    :param shape: Shape of the batch of time series.
+    :param start: First row of the shard.
+    :param stop: Row after the last one of the shard.
+    :return: recoverable rows, number of missing samples and features of the time series
+    of the shard
+    """
+    shared_memory = SharedMemory(name=name)
+    try:
+        matrix = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)[start:stop]
+        recoverable, missing = worker_cleaner.correct_batch_missing_samples(matrix)
+        worker_cleaner.correct_batch_outliers(matrix)
+        series_features = worker_extractor.compute_series_features(matrix)
+        del matrix
+    finally:
+        shared_memory.close()
+    return recoverable, missing, series_features
+
+
+class PreparationPool:
+    """
+    Class that shards a batch of pressure time series across a pool of worker processes.
+    The time series are handed over through shared memory, the results
+    are collected in the order of the shards.
+    """
+    def __init__(self, workers: int) -> None:
+        """
+        Initializes the pool of worker processes.
+        :param workers: Number of worker processes.
+        """
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+
+    def prepare(self, time_series: list) -> tuple:
+        """
+        Cleans a batch of time series of the same length and computes their features.
+        :param time_series: List of pressure time series, None marks a missing sample.
+        :return: boolean array of the recoverable time series and
+        2-D array of their features, one row per time series.
+        """
+        shape = (len(time_series), len(time_series[0]))
+        shared_memory = SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+        try:
+            matrix = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+            # None values are converted to NaN
+            for row, samples in enumerate(time_series):
+                matrix[row] = samples
+            del matrix
+            bounds = np.linspace(0, shape[0], min(self.workers, shape[0]) + 1, dtype=int).tolist()
+            futures = [self.executor.submit(prepare_shard, shared_memory.name, shape, start, stop)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            results = [future.result() for future in futures]
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+        # The workers return the missing samples, they are reported here on a single line
+        missing = sum(result[1] for result in results)
+        if missing:
+            print(f'[-] {missing} values are missing in the batch')
+        recoverable = np.concatenate([result[0] for result in results])
+        series_features = np.concatenate([result[2] for result in results])
+        return recoverable, series_features
+
+    def close(self) -> None:
+        """
+        Shuts down the worker processes.
+        :return: None
+        """
+        self.executor.shutdown()
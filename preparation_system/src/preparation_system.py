@@ -3,15 +3,22 @@ import time
 from datetime import datetime
 from threading import Thread
 import logging
-from jsonschema import ValidationError
+import numpy as np
+from jsonschema import ValidationError, validators
 from src.json_io import JsonIO
 from src.session_cleaning import SessionCleaning
 from src.features_extractor import FeaturesExtractor
+from src.preparation_pool import PreparationPool
+from src.feature_cache import FeatureCache
+from src.stage_timer import StageTimer
 from src.preparation_system_configuration import PreparationSystemConfiguration
 from utility.json_handler import JsonHandler
 
 CONFIG_PATH = './data/preparation_system_config.json'
 CONFIG_SCHEMA_PATH = './data/preparation_system_config_schema.json'
+RAW_SESSION_SCHEMA_PATH = './data/raw_session_schema.json'
+# Types of the samples of a valid time series, bool is not a number for the schema
+SAMPLE_TYPES = {int, float, type(None)}
 
 '''
 Module Name: PreparationSystem
@@ -38,19 +45,53 @@ class PreparationSystem:
         print(f'[+] The configuration is valid, {self.configuration.operative_mode} mode')
         self.raw_session = None
         self.prepared_session = None
+        schema = JsonHandler().load_json(RAW_SESSION_SCHEMA_PATH)
+        # The samples are checked by is_valid_time_series,
+        # validating them one by one through the schema is too slow
+        schema['properties']['time_series'].pop('items', None)
+        self.raw_session_validator = validators.validator_for(schema)(schema)
+        self.timer = StageTimer(self.configuration.stage_timing)
+        if self.configuration.stage_timing:
+            JsonIO.get_instance().add_metrics('stage_latency_us', self.timer.get_summary)
+            JsonIO.get_instance().forwarder.timer = self.timer
+        self.feature_cache = None
+        if self.configuration.feature_cache_max_bytes > 0:
+            self.feature_cache = FeatureCache(self.configuration.feature_cache_max_bytes)
+            JsonIO.get_instance().add_metrics('feature_cache', self.feature_cache.get_statistics)
+
+    @staticmethod
+    def is_valid_time_series(time_series: list) -> bool:
+        """
+        Checks that every sample of a time series is a number or None
+        :param time_series: list of samples
+        :return: True if the time series is valid. False otherwise.
+        """
+        return set(map(type, time_series)) <= SAMPLE_TYPES
+
+    def validate_raw_session(self, raw_session: dict) -> bool:
+        """
+        Validates a received raw session given its schema
+        :param raw_session: raw session to validate
+        :return: True if the raw session is valid. False otherwise.
+        """
+        if not self.raw_session_validator.is_valid(raw_session) or \
+                not self.is_valid_time_series(raw_session['time_series']):
+            logging.error('Raw session schema validation failed')
+            return False
+        return True
 
     def run(self) -> None:
         """
         Method that runs all the instructions needed for session preparation.
         It continuously listens for new raw sessions, processes them, extracts features,
         prepares the session and sends it to the corresponding endpoint based on 
-        the current operating mode.
+        the current operating mode. With batch_size 1 the raw sessions are prepared one by one.
         :return: None
         """
         # Create an instance of SessionCleaning
         cleaner = SessionCleaning()
-         # Create an instance of JsonHandler
-        json_handler = JsonHandler()
+        # Create the FeaturesExtractor once, it keeps its buffers between sessions
+        extractor = FeaturesExtractor()
 
         # Start the Flask app listener on the port specified
         listener_thread = Thread(target=JsonIO.get_instance().listener, \
@@ -59,42 +100,133 @@ class PreparationSystem:
         while JsonIO.get_instance().receive() is False:
             print('it is sleeping')
             time.sleep(3)
-        while True:
-            # Get received raw session
-            self.raw_session = JsonIO.get_instance().receive()
-            print('[+] Raw session received')
-            # Check raw session validity
-            if json_handler.validate_json_data_file(self.raw_session, \
-                                                    "./data/raw_session_schema.json"):
-                print('[+] Raw session is valid')
-            else:
+        self.run_batches(cleaner, extractor)
+
+    def run_batches(self, cleaner: SessionCleaning, extractor: FeaturesExtractor) -> None:
+        """
+        Method that runs the session preparation on micro-batches of raw sessions.
+        It collects up to batch_size raw sessions, waiting at most batch_timeout_ms
+        after the first one, prepares them together and sends them in order.
+        If workers is set, the time series are prepared on a pool of worker processes.
+        :param cleaner: SessionCleaning instance.
+        :param extractor: FeaturesExtractor instance.
+        :return: None
+        """
+        pool = None
+        if self.configuration.workers > 0:
+            pool = PreparationPool(self.configuration.workers)
+            print(f'[+] Preparation pool of {self.configuration.workers} workers started')
+        dest_system = 'segregation' \
+            if self.configuration.operative_mode == 'development' else 'production'
+        summary_interval = self.configuration.stage_timing_summary_interval
+        periodic_summary = self.timer.enabled and summary_interval > 0
+        last_summary = time.monotonic()
+        try:
+            while True:
+                # The wait for raw sessions ends at the next summary, so it is printed
+                # even when no raw session arrives
+                wait = max(0.0, last_summary + summary_interval - time.monotonic()) \
+                    if periodic_summary else None
+                raw_sessions = JsonIO.get_instance().receive_batch(
+                    self.configuration.batch_size, self.configuration.batch_timeout_ms / 1000, wait)
+                if periodic_summary and time.monotonic() - last_summary >= summary_interval:
+                    self.timer.print_summary()
+                    last_summary = time.monotonic()
+                if not raw_sessions:
+                    continue
+                print(f'[+] {len(raw_sessions)} raw sessions received')
+                prepared_sessions = self.prepare_batch(raw_sessions, cleaner, extractor, pool)
+                if not prepared_sessions:
+                    continue
+                start = self.timer.now()
+                enqueued = JsonIO.get_instance().send_batch(prepared_sessions, dest_system)
+                self.timer.record('send', start)
+                print(f'[+] {enqueued} prepared sessions queued to be sent at \
+                      {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+        finally:
+            if pool is not None:
+                pool.close()
+            if self.timer.enabled:
+                self.timer.print_summary()
+
+    def prepare_batch(self, raw_sessions: list, cleaner: SessionCleaning,
+                      extractor: FeaturesExtractor, pool: PreparationPool = None) -> list:
+        """
+        Prepares a batch of raw sessions. The time series of the same length are
+        stacked in a 2-D array, cleaned and reduced to features together.
+        :param raw_sessions: List of raw sessions.
+        :param cleaner: SessionCleaning instance.
+        :param extractor: FeaturesExtractor instance.
+        :param pool: PreparationPool instance, the batch is prepared in this process if not set.
+        :return: List of prepared sessions, in the same order of the valid raw sessions.
+        """
+        groups = {}
+        keys = {}
+        prepared_sessions = {}
+        for position, raw_session in enumerate(raw_sessions):
+            start = self.timer.now()
+            is_valid = self.validate_raw_session(raw_session)
+            self.timer.record('validation', start)
+            if not is_valid:
                 print('[-] Raw session is not valid')
                 continue
+            if not raw_session['time_series']:
+                print('[-] Empty pressure time series, raw session discarded')
+                continue
+            time_series = raw_session['time_series']
+            if self.feature_cache is not None:
+                start = self.timer.now()
+                # None values are converted to NaN
+                time_series = np.array(time_series, dtype=np.float64)
+                keys[position] = self.feature_cache.make_key(raw_session['uuid'], time_series)
+                cached = self.feature_cache.get(keys[position])
+                self.timer.record('feature_cache', start)
+                if cached is not None:
+                    print('[+] Raw session already prepared, features found in cache')
+                    if cached:
+                        prepared_sessions[position] = \
+                            extractor.prepare_batch_sessions([raw_session], np.array([cached]))[0]
+                    else:
+                        print('[-] Missing samples are unrecoverable, raw session discarded')
+                    continue
+            groups.setdefault(len(time_series), []).append((position, time_series))
 
-            # Correct missing samples
-            if cleaner.correct_missing_samples(self.raw_session['time_series']):
-                print('[+] Pressure time series ok')
+        for members in groups.values():
+            positions = [position for position, _ in members]
+            group = [raw_sessions[position] for position in positions]
+            if pool is not None:
+                # Cleaning and feature extraction run in the workers, they are measured together
+                start = self.timer.now()
+                recoverable, series_features = \
+                    pool.prepare([time_series for _, time_series in members])
+                self.timer.record('pool', start)
             else:
-                print('[-] Missing samples are unrecoverable, raw session discarded')
+                # None values are converted to NaN
+                matrix = np.array([time_series for _, time_series in members], dtype=np.float64)
+                start = self.timer.now()
+                recoverable, missing = cleaner.correct_batch_missing_samples(matrix)
+                self.timer.record('missing_samples', start)
+                if missing:
+                    print(f'[-] {missing} values are missing in the batch')
+                start = self.timer.now()
+                cleaner.correct_batch_outliers(matrix)
+                self.timer.record('outliers', start)
+                start = self.timer.now()
+                series_features = extractor.compute_series_features(matrix)
+                self.timer.record('features', start)
+            if self.feature_cache is not None:
+                for position, is_recoverable, values in \
+                        zip(positions, recoverable.tolist(), series_features.tolist()):
+                    self.feature_cache.put(keys[position], tuple(values) if is_recoverable else ())
+            discarded = np.count_nonzero(~recoverable)
+            if discarded != 0:
+                print(f'[-] Missing samples are unrecoverable, {discarded} raw sessions discarded')
+            kept = np.flatnonzero(recoverable).tolist()
+            if not kept:
                 continue
-            # Correct outliers
-            cleaner.correct_outliers(self.raw_session['time_series'])
-
-            # Extract features and prepare session
-            self.prepared_session = {}
-            FeaturesExtractor().extract_features \
-                (self.raw_session, self.prepared_session)
-            print('[+] Features extracted and session prepared')
-
-            # Send prepared session to the endpoint corresponding to the current operating mode
-            if self.configuration.operative_mode == 'development':
-                if JsonIO.get_instance().send(self.prepared_session,
-                                              "segregation"):
-                    print(f'[+] Prepared session sent at \
-                          {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
-
-            elif self.configuration.operative_mode == 'production':
-                if JsonIO.get_instance().send(self.prepared_session,
-                                              "production"):
-                    print(f'[+] Prepared session sent at \
-                          {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+            prepared = extractor.prepare_batch_sessions([group[i] for i in kept], \
+                                                        series_features[kept])
+            for i, prepared_session in zip(kept, prepared):
+                prepared_sessions[positions[i]] = prepared_session
+        print(f'[+] Features extracted and {len(prepared_sessions)} sessions prepared')
+        return [prepared_sessions[position] for position in sorted(prepared_sessions)]
@@ -36,4 +36,20 @@ class PreparationSystemConfiguration:
             self.operative_mode = os.getenv('OPERATIVE_MODE')
             self.max_value = int(json_conf['max_value'])
             self.min_value = int(json_conf['min_value'])
+            self.batch_size = json_conf['batch_size']
+            self.batch_timeout_ms = json_conf['batch_timeout_ms']
+            self.workers = json_conf['workers']
+            self.feature_cache_max_bytes = json_conf['feature_cache_max_bytes']
+            self.forward_queue_size = json_conf['forward_queue_size']
+            self.forward_batch_size = json_conf['forward_batch_size']
+            self.forward_backoff_ms = json_conf['forward_backoff_ms']
+            self.stage_timing = json_conf['stage_timing']
+            self.intake_workers = json_conf['intake_workers']
+            self.intake_queue_size = json_conf['intake_queue_size']
+            self.intake_high_water_mark = json_conf['intake_high_water_mark']
+            self.intake_retry_after = json_conf['intake_retry_after']
+            self.intake_max_pending = json_conf['intake_max_pending']
+            self.intake_keep_alive_timeout = json_conf['intake_keep_alive_timeout']
+            self.stage_timing_summary_interval = json_conf['stage_timing_summary_interval']
+            self.series_features = json_conf['series_features']
             self.features = json_conf['features'] #TODO aggiungi anche le altre features
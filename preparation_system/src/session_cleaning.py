@@ -1,9 +1,12 @@
 import sys
+import numpy as np
 from jsonschema import ValidationError
 from src.preparation_system_configuration import PreparationSystemConfiguration
 
 CONFIG_PATH = './data/preparation_system_config.json'
 CONFIG_SCHEMA_PATH = './data/preparation_system_config_schema.json'
+# Positions of the neighbours used to interpolate a missing sample, in order of use
+NEIGHBOUR_OFFSETS = np.array([-1, 1, -2, 2, -3, 3])
 
 '''
 Module Name: SessionCleaning
@@ -23,52 +26,75 @@ class SessionCleaning:
         self.min_value = self.configuration.min_value
         self.max_value = self.configuration.max_value
 
-    def correct_missing_samples(self, time_series: list) -> bool:
+    @staticmethod
+    def interpolate_batch(matrix: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
         """
-        Checks for missing samples in the list of pressure time series;
-        if they are recoverable, the missing samples are corrected.
-        :param time_series: List of time_series.
-        :return: True if there are no missing samples or the missing ones are recoverable.
+        Interpolates the missing samples of a batch of time series, one per row.
+        The samples that do not depend on another missing sample of the same row are
+        interpolated in a single vectorized pass, the others in order using the interpolated values.
+        :param matrix: 2-D array of samples, NaN marks a missing sample. It is corrected in place.
+        :param rows: rows of the missing samples
+        :param cols: positions of the missing samples, sorted by row and then by position
+        :return: boolean array, True for the rows whose missing samples are recoverable
         """
-        for i, value in enumerate(time_series):
-            # If a sample is missing the interpolation is computed
-            if value is None:
-                print(f'[-] Value nr. { + 1} is missing')
-                if 3 <= i <= 1232:
-                    self.interpolate_list(time_series, i)
-                else:
-                    return False
-        return True
+        recoverable = np.ones(matrix.shape[0], dtype=bool)
+        recoverable[rows[(cols < 3) | (cols > 1232)]] = False
+        keep = recoverable[rows]
+        rows = rows[keep]
+        cols = cols[keep]
+        if rows.size == 0:
+            return recoverable
 
-    @staticmethod
-    def interpolate_list(time_series, missing_value) -> None:
+        # A sample is independent when none of the three previous samples of its row is missing
+        independent = np.concatenate(([True], (rows[1:] != rows[:-1]) | (np.diff(cols) > 3)))
+        positions = cols[independent]
+        neighbours = positions[:, None] + NEIGHBOUR_OFFSETS
+        inside = neighbours < matrix.shape[1]
+        values = matrix[rows[independent][:, None], np.where(inside, neighbours, 0)]
+        usable = inside & ~np.isnan(values) & (values != 0)
+        total = np.zeros(positions.size)
+        for column in range(NEIGHBOUR_OFFSETS.size):
+            total += np.where(usable[:, column], values[:, column], 0)
+        counts = usable.sum(axis=1)
+        matrix[rows[independent], positions] = \
+            np.where(counts != 0, total / np.maximum(counts, 1), np.nan)
+
+        for row, position in zip(rows[~independent].tolist(), cols[~independent].tolist()):
+            total = 0
+            count = 0
+            neighbours = position + NEIGHBOUR_OFFSETS
+            for value in matrix[row, neighbours[neighbours < matrix.shape[1]]].tolist():
+                # NaN is the only value different from itself
+                if value == value and value != 0:
+                    total += value
+                    count += 1
+            if count != 0:
+                matrix[row, position] = total / count
+        return recoverable
+
+    def correct_batch_missing_samples(self, matrix: np.ndarray) -> tuple:
         """
-        Interpolates the specified value with the adjacent ones in the list.
-        :param time_series: List of time series.
-        :param missing_value: The value to interpolate.
-        :return: None
+        Corrects the missing samples of a batch of time series of the same length.
+        The whole matrix is scanned, so every missing sample is found even if the
+        Ingestion System did not mark it.
+        :param matrix: 2-D array of samples, one time series per row, NaN marks a missing sample.
+        It is corrected in place.
+        :return: boolean array, True for the rows that have no missing samples
+        or whose missing samples are recoverable, and number of missing samples.
+        The number is returned instead of printed, as the workers of the pool share the console.
         """
-        # List of adjacent value in the time_series
-        lists_to_use = [missing_value - 1, missing_value + 1, missing_value - 2, \
-                        missing_value + 2, missing_value - 3, missing_value + 3]
-
-        value = 0
-        list_number = 0
-        for i in lists_to_use:
-            if time_series[i]:
-                value += time_series[i]
-                list_number += 1
-        if list_number != 0:
-            time_series[missing_value] = value / list_number
+        rows, cols = np.nonzero(np.isnan(matrix))
+        if rows.size == 0:
+            return np.ones(matrix.shape[0], dtype=bool), 0
+        recoverable = self.interpolate_batch(matrix, rows, cols)
+        # Only the missing samples can still be NaN after the interpolation
+        recoverable[rows[np.isnan(matrix[rows, cols])]] = False
+        return recoverable, rows.size
 
-    def correct_outliers(self, time_series: list) -> None:
+    def correct_batch_outliers(self, matrix: np.ndarray) -> None:
         """
-        Corrects outliers in the data.
-        :param time_series: List of time series.
+        Corrects the outliers of a batch of time series, clipping them to min_value and max_value.
+        :param matrix: 2-D array of samples, one time series per row. It is corrected in place.
         :return: None
         """
-        for i, value in enumerate(time_series):
-            if value > self.max_value:
-                time_series[i] = self.max_value
-            elif value < self.min_value:
-                time_series[i] = self.min_value
+        np.clip(matrix, self.min_value, self.max_value, out=matrix)
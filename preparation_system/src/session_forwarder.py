@@ -0,0 +1,178 @@
+import time
+import queue
+import logging
+from datetime import datetime
+from threading import Thread
+from requests import Session, exceptions
+from requests.adapters import HTTPAdapter
+
+'''
+Module Name: SessionForwarder
+Description: This class forwards the prepared sessions and the logs in background.
+'''
+
+# Maximum delay between two attempts to send a batch of prepared sessions
+MAX_BACKOFF = 10
+
+
+class SessionForwarder:
+    """
+    Class that sends the prepared sessions without blocking the preparation loop.
+    Every destination has a keep-alive connection, a bounded queue and a sender thread
+    that posts the queued prepared sessions together, as a JSON array.
+    The logs are sent by another thread and dropped if the input system is unreachable.
+    """
+    def __init__(self, queue_size: int, batch_size: int, backoff_ms: int, log_url: str) -> None:
+        """
+        Initializes the forwarder and starts the log sender thread.
+        :param queue_size: Maximum number of prepared sessions waiting for every destination.
+        :param batch_size: Maximum number of prepared sessions posted together.
+        :param backoff_ms: Delay before the first retry, doubled at every retry.
+        :param log_url: url where the logs are posted.
+        """
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.backoff = backoff_ms / 1000
+        self.log_url = log_url
+        self.log_queue = queue.Queue(maxsize=queue_size)
+        self.destinations = {}
+        # StageTimer measuring the posts, if set
+        self.timer = None
+        Thread(target=self.run_log_sender, name='forwarder_log', daemon=True).start()
+
+    @staticmethod
+    def make_session() -> Session:
+        """
+        :return: requests Session keeping a single connection alive
+        """
+        session = Session()
+        session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        return session
+
+    def add_destination(self, name: str, url: str) -> None:
+        """
+        Registers a destination and starts its sender thread.
+        :param name: Name of the destination.
+        :param url: url where the prepared sessions are posted.
+        :return: None
+        """
+        destination = {
+            'name': name,
+            'url': url,
+            'session': self.make_session(),
+            'queue': queue.Queue(maxsize=self.queue_size)
+        }
+        self.destinations[name] = destination
+        Thread(target=self.run, args=(destination, ), name='forwarder_' + name, daemon=True).start()
+
+    def forward(self, name: str, prepared_sessions: list) -> int:
+        """
+        Enqueues prepared sessions for a destination, in order.
+        If the queue is full it waits for the sender, slowing down the preparation.
+        :param name: Name of the destination.
+        :param prepared_sessions: List of prepared sessions.
+        :return: Number of prepared sessions enqueued.
+        """
+        destination = self.destinations[name]
+        for prepared_session in prepared_sessions:
+            destination['queue'].put(prepared_session, block=True)
+        return len(prepared_sessions)
+
+    def log(self, uuid: str) -> None:
+        """
+        Enqueues the log of a prepared session sent, dropping it if the log queue is full.
+        :param uuid: uuid of the prepared session.
+        :return: None
+        """
+        data = {
+            'uuid': uuid,
+            'system_source': 'preparation',
+            'timestamp': datetime.now().isoformat()
+        }
+        try:
+            self.log_queue.put_nowait(data)
+        except queue.Full:
+            logging.error('Log queue full, log of %s dropped', uuid)
+
+    def post(self, destination: dict, batch: list) -> None:
+        """
+        Posts a batch of prepared sessions, retrying with exponential backoff
+        until the destination is reachable and accepts it.
+        A 429 Too Many Requests response is retried as well, not before its Retry-After.
+        :param destination: Destination of the batch.
+        :param batch: List of prepared sessions.
+        :return: None
+        """
+        delay = self.backoff
+        while True:
+            start = time.perf_counter_ns()
+            retry_after = 0
+            try:
+                response = destination['session'].post(url=destination['url'], json=batch, timeout=5)
+            except exceptions.RequestException as e:
+                print(f"[-] Connection Error ({destination['name']} unreachable): {e}")
+            else:
+                if response.status_code == 429:
+                    # The destination is overloaded, the batch is sent again later
+                    retry_after = self.get_retry_after(response)
+                    logging.error('%s busy, retry in %s s', destination['name'], \
+                                  max(delay, retry_after))
+                elif response.status_code < 500:
+                    if response.status_code != 200:
+                        # The batch is refused, sending it again would not help
+                        logging.error('%s error %s: %s', destination['name'], \
+                                      response.status_code, response.text)
+                        return
+                    if self.timer is not None:
+                        self.timer.record('post_' + destination['name'], start)
+                    print(f"[+] {len(batch)} prepared sessions sent to {destination['name']} at "
+                          f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                    for prepared_session in batch:
+                        self.log(prepared_session['_id'])
+                    return
+                else:
+                    logging.error('%s error %s', destination['name'], response.status_code)
+            time.sleep(max(delay, retry_after))
+            delay = min(delay * 2, MAX_BACKOFF)
+
+    @staticmethod
+    def get_retry_after(response) -> float:
+        """
+        :param response: response of the destination
+        :return: seconds to wait before retrying set by the Retry-After header, 0 if not set
+        """
+        try:
+            return float(response.headers.get('Retry-After', 0))
+        except ValueError:
+            return 0
+
+    def run(self, destination: dict) -> None:
+        """
+        Sender thread of a destination, it posts the prepared sessions queued
+        since the last post together, up to batch_size.
+        :param destination: Destination served by the thread.
+        :return: None
+        """
+        while True:
+            batch = [destination['queue'].get(block=True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(destination['queue'].get_nowait())
+                except queue.Empty:
+                    break
+            self.post(destination, batch)
+
+    def run_log_sender(self) -> None:
+        """
+        Log sender thread, the logs not delivered are dropped.
+        :return: None
+        """
+        session = self.make_session()
+        while True:
+            data = self.log_queue.get(block=True)
+            try:
+                response = session.post(url=self.log_url, json=data, timeout=3)
+                if response.status_code != 200:
+                    print(f'[ERROR] error: {response.text}')
+            except exceptions.RequestException as e:
+                print(f"[ERROR] log unreachable for {data['uuid']} caused error: {e}")
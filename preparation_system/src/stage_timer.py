@@ -0,0 +1,144 @@
+import math
+import time
+from threading import Lock
+
+'''
+Module Name: StageTimer
+Description: This class measures the latency of the stages of the preparation
+with HDR-style histograms.
+'''
+
+# Linear sub-buckets for every power of two, the relative error is below 2^-(SUB_BUCKET_BITS - 1)
+SUB_BUCKET_BITS = 7
+# Latencies above 2^MAX_VALUE_BITS microseconds (about 12 days) are recorded as the maximum
+MAX_VALUE_BITS = 40
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Histogram of latencies in microseconds with log-linear buckets,
+    as in an HDR histogram: the values are recorded in constant time
+    and memory, the percentiles have a bounded relative error.
+    """
+    def __init__(self) -> None:
+        self.counts = [0] * self.bucket_index((1 << MAX_VALUE_BITS) - 1) + [0]
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def bucket_index(value: int) -> int:
+        """
+        :param value: latency in microseconds
+        :return: index of the bucket of the value
+        """
+        exponent = max(value.bit_length() - SUB_BUCKET_BITS, 0)
+        return (exponent << (SUB_BUCKET_BITS - 1)) + (value >> exponent)
+
+    @staticmethod
+    def bucket_upper_bound(index: int) -> int:
+        """
+        :param index: index of a bucket
+        :return: highest latency recorded in the bucket
+        """
+        if index < 1 << SUB_BUCKET_BITS:
+            return index
+        exponent = (index >> (SUB_BUCKET_BITS - 1)) - 1
+        mantissa = index - (exponent << (SUB_BUCKET_BITS - 1))
+        return ((mantissa + 1) << exponent) - 1
+
+    def record(self, value: int) -> None:
+        """
+        Records a latency.
+        :param value: latency in microseconds
+        :return: None
+        """
+        value = min(value, (1 << MAX_VALUE_BITS) - 1)
+        with self.lock:
+            self.counts[self.bucket_index(value)] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+            self.min = value if self.min is None else min(self.min, value)
+
+    def get_summary(self) -> dict:
+        """
+        :return: dictionary with the number of latencies recorded, their minimum,
+        maximum, mean and percentiles
+        """
+        with self.lock:
+            summary = {
+                'count': self.count,
+                'min': self.min or 0,
+                'max': self.max,
+                'mean': self.total / self.count if self.count > 0 else 0.0
+            }
+            targets = [(percentile, math.ceil(percentile / 100 * self.count))
+                       for percentile in PERCENTILES]
+            cumulative = 0
+            for index, bucket_count in enumerate(self.counts):
+                if not targets:
+                    break
+                cumulative += bucket_count
+                while targets and cumulative >= targets[0][1] and bucket_count > 0:
+                    summary[f'p{targets[0][0]}'] = min(self.bucket_upper_bound(index), self.max)
+                    targets.pop(0)
+            for percentile, _ in targets:
+                summary[f'p{percentile}'] = 0
+        return summary
+
+
+class StageTimer:
+    """
+    Class that records the latency of every stage in its own histogram,
+    using a monotonic clock. When it is disabled measuring a stage costs two calls.
+    """
+    def __init__(self, enabled: bool) -> None:
+        """
+        :param enabled: True to record the latencies.
+        """
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = Lock()
+
+    def now(self) -> int:
+        """
+        :return: start time of a stage in nanoseconds, 0 if the timer is disabled
+        """
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def record(self, stage: str, start: int) -> None:
+        """
+        Records the latency of a stage started at start.
+        :param stage: name of the stage
+        :param start: start time returned by now
+        :return: None
+        """
+        if not self.enabled:
+            return
+        elapsed = (time.perf_counter_ns() - start) // 1000
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.record(elapsed)
+
+    def get_summary(self) -> dict:
+        """
+        :return: dictionary with the summary of the latencies of every stage, in microseconds
+        """
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {stage: histogram.get_summary() for stage, histogram in histograms.items()}
+
+    def print_summary(self) -> None:
+        """
+        Prints the percentiles of the latencies of every stage.
+        :return: None
+        """
+        for stage, summary in self.get_summary().items():
+            print(f"[INFO] {stage}: {summary['count']} measures, "
+                  f"p50 {summary['p50']} us, p99 {summary['p99']} us, max {summary['max']} us")
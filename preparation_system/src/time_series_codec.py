@@ -0,0 +1,63 @@
+import base64
+import binascii
+import numpy as np
+
+'''
+Module Name: TimeSeriesCodec
+Description: This class encodes the pressure time series of a raw session
+in a compact form, as an alternative to a JSON list of numbers.
+The Ingestion System and the Preparation System are built from separate folders,
+so each one keeps a copy of this module: the two copies must stay identical
+(tests/test_time_series_codec.py checks it).
+'''
+
+# Value of the header that marks a raw session with an encoded time series
+ENCODING = 'base64-float32-le'
+ENCODING_HEADER = 'X-Time-Series-Encoding'
+
+
+class TimeSeriesCodec:
+    """
+    Class that encodes a time series as base64 little-endian float32 samples
+    and a base64 validity bitmap, the bit of a missing sample is 0.
+    """
+    @staticmethod
+    def encode(time_series: list) -> dict:
+        """
+        Encodes a time series.
+        :param time_series: list of samples, None marks a missing sample
+        :return: dictionary with the encoded samples, the validity bitmap and the length
+        """
+        # None values are converted to NaN
+        samples = np.array(time_series, dtype=np.float64)
+        valid = ~np.isnan(samples)
+        return {
+            'length': samples.size,
+            'samples': base64.b64encode(
+                np.where(valid, samples, 0).astype('<f4').tobytes()).decode('ascii'),
+            'validity': base64.b64encode(
+                np.packbits(valid, bitorder='little').tobytes()).decode('ascii')
+        }
+
+    @staticmethod
+    def decode(encoded: dict) -> list:
+        """
+        Decodes a time series.
+        :param encoded: dictionary returned by encode
+        :return: list of samples, None marks a missing sample
+        :raise ValueError: if the encoded time series is malformed
+        """
+        try:
+            length = encoded['length']
+            samples = np.frombuffer(base64.b64decode(encoded['samples']), dtype='<f4')
+            validity = np.frombuffer(base64.b64decode(encoded['validity']), \
+                                     dtype=np.uint8)
+        except (KeyError, TypeError, binascii.Error) as e:
+            raise ValueError(f'Malformed time series: {e}') from e
+        if not isinstance(length, int) or samples.size != length or validity.size * 8 < length:
+            raise ValueError('Malformed time series: wrong length')
+        valid = np.unpackbits(validity, count=length, bitorder='little').astype(bool)
+        time_series = samples.astype(np.float64).tolist()
+        for position in np.flatnonzero(~valid).tolist():
+            time_series[position] = None
+        return time_series
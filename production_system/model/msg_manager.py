@@ -75,6 +75,11 @@ class MessageManager:
         self._queue.put(prepared_session, block=True)
         print('New prepared session received')
 
+    def send_prepared_sessions(self , received_prepared_sessions):
+        # the sessions of a batch are queued in the order they were sent
+        for received_prepared_session in received_prepared_sessions:
+            self.send_prepared_session(received_prepared_session)
+
     def send_post_request(self , dest, data):
         if dest == "EVALUATION":
             uri = "http://" + self._configuration.evaluation_system_ip + ":" + str(self._configuration.evaluation_system_port) + "/classifierLabels"
@@ -144,14 +149,16 @@ def receive_prepared_session():
     if request.json is None:
         return {'error': 'No Payload Received'}, 500
 
-    schema = PreparedSessionSchema()
+    # The Preparation System sends the prepared sessions in batches
+    many = isinstance(request.json, list)
+    schema = PreparedSessionSchema(many=many)
     errors = schema.validate(request.json)
 
     if errors:
         return errors, 400
 
-    received_json = request.json
+    received_json = request.json if many else [request.json]
     print("[DEBUG] received json : " , received_json)
-    receive_thread = Thread(target=MessageManager.get_instance().send_prepared_session , args = (received_json,))
-    receive_thread.start()
+    # Queued before answering: batches keep their arrival order and no thread is started per batch
+    MessageManager.get_instance().send_prepared_sessions(received_json)
     return {}, 200
@@ -8,7 +8,7 @@ class BalancingReportGenerator:
     def __init__(self):
         pass
 
-    def generate_chart(self, dataset, balancing_tolerance=10.0):
+    def generate_chart(self, class_counts, balancing_tolerance=10.0):
 
         items = ['Shopping', 'Sport', 'Cooking', 'Gaming']
         values = [0,0,0,0]
@@ -19,11 +19,11 @@ class BalancingReportGenerator:
             'gaming': 3
         }
 
-        # Count instances for each class
-        for prepared_session in dataset:
-            activity = prepared_session['calendar'].lower()
+        # Instances for each class, as counted by the storage at every store
+        for calendar, count in class_counts.items():
+            activity = calendar.lower()
             if activity in activity_mapping:
-                values[activity_mapping[activity]] += 1
+                values[activity_mapping[activity]] += count
 
         total_activities = sum(values)
 
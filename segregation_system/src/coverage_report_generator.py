@@ -6,42 +6,14 @@ import plotly.graph_objects as go
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 from jsonschema import validate, ValidationError
+from src.prepared_session_storage import FEATURES
 
 class CoverageReportGenerator:
 
     def __init__(self):
         pass
 
-    def generate_chart(self, dataset):
-
-        # Get data from the prepared sessions
-        maximum_pressure_ts = []
-        minimum_pressure_ts = []
-        median_pressure_ts = []
-        mean_absolute_deviation_pressure_ts = []
-        activity_and_small_scatter = []
-        environment_and_small_scatter = []
-
-        # prepare data to build the chart
-        for prepared_session in dataset:
-            maximum_pressure_ts.append(prepared_session['features']['maximum_pressure_ts'])
-            minimum_pressure_ts.append(prepared_session['features']['minimum_pressure_ts'])
-            median_pressure_ts.append(prepared_session['features']['median_pressure_ts'])
-            mean_absolute_deviation_pressure_ts.append(
-                prepared_session['features']['mean_absolute_deviation_pressure_ts'])
-            activity_and_small_scatter.append(
-                prepared_session['features']['activity_and_small_scatter'])
-            environment_and_small_scatter.append(
-                prepared_session['features']['environment_and_small_scatter'])
-
-        feature_lists = [
-            maximum_pressure_ts,
-            minimum_pressure_ts,
-            median_pressure_ts,
-            mean_absolute_deviation_pressure_ts,
-            activity_and_small_scatter,
-            environment_and_small_scatter
-        ]
+    def generate_chart(self, dataset, feature_summary):
 
         feature_names = [
             'Maximum Pressure TS',
@@ -52,9 +24,8 @@ class CoverageReportGenerator:
             'Environment & Small Scatter'
         ]
 
-        # Convert feature lists to array and transpose
-        X = np.array(feature_lists).T
-        X_original = X.copy()
+        # The dataset is columnar, so each feature is already an array
+        X = np.column_stack([dataset[feature] for feature in FEATURES])
 
         # Scale features to 0-1 range for better radar visualization
         scaler = MinMaxScaler()
@@ -85,18 +56,13 @@ class CoverageReportGenerator:
                 hovertemplate=f'<b>{feature_name}</b><br>Scaled Value: %{{r:.3f}}<extra></extra>'
             ))
 
-        # Calculate original min/max for each feature
+        # Original min/max for each feature, as kept by the storage at every store
         feature_info = []
-        coverage_stats = {}
-
-        for i, name in enumerate(feature_names):
-            original_values = X_original[:, i]
-            min_val = np.min(original_values)
-            max_val = np.max(original_values)
-            coverage = np.ptp(X_scaled[:, i])
 
-            feature_info.append(f"{name}: [{min_val:.2f}, {max_val:.2f}]")
-            coverage_stats[name] = coverage
+        for key, name in zip(FEATURES, feature_names):
+            statistics = feature_summary[key]
+            feature_info.append(f"{name}: [{statistics['minimum']:.2f}, {statistics['maximum']:.2f}] "
+                                f"mean {statistics['mean']:.2f} std {statistics['standard_deviation']:.2f}")
 
         # Create legend text with min/max ranges
         legend_text = '<br>'.join(feature_info)
@@ -141,12 +107,9 @@ class CoverageReportGenerator:
 
         # Get the info for the report
         info = dict()
-        info['maximum_pressure_ts'] = maximum_pressure_ts
-        info['minimum_pressure_ts'] = minimum_pressure_ts
-        info['median_pressure_ts'] = median_pressure_ts
-        info['mean_absolute_deviation_pressure_ts'] = mean_absolute_deviation_pressure_ts
-        info['activity_and_small_scatter'] = activity_and_small_scatter
-        info['environment_and_small_scatter'] = environment_and_small_scatter
+        for feature in FEATURES:
+            info[feature] = dataset[feature].tolist()
+        info['feature_summary'] = feature_summary
 
         return info
 
@@ -42,6 +42,23 @@ class JsonIO:
         # if the queue is empty the thread is blocked
         return self._received_json_queue.get(block=True)
 
+    def receive_batch(self, max_size):
+        # block for the first message, then take what is already in the queue
+        # a list of prepared sessions counts as one message
+        batch = []
+        received_json = self._received_json_queue.get(block=True)
+        while True:
+            if isinstance(received_json, list):
+                batch.extend(received_json)
+            else:
+                batch.append(received_json)
+            if len(batch) >= max_size:
+                return batch
+            try:
+                received_json = self._received_json_queue.get(block=False)
+            except queue.Empty:
+                return batch
+
     def put_json_into_queue(self, received_json):
         # save received message into queue
         self._received_json_queue.put(received_json)
@@ -65,6 +82,28 @@ class JsonIO:
         self.send_log('all', 'segregation')
         return True
 
+    def send_stream(self, ip, port, endpoint, stream, content_type):
+        # the body is sent in chunks while it is produced, the timeout only bounds
+        # the connection and the wait for the response
+        url = f'http://{ip}:{port}/' + endpoint
+        headers = {'Content-Type': content_type, 'Content-Encoding': 'gzip'}
+        response = None
+        try:
+            response = post(url, data=stream, headers=headers, timeout=(3.0, 10.0))
+        except exceptions.RequestException:
+            print("Endpoint system unreachable")
+            return False
+
+        if response.status_code != 200:
+            res = response.json()
+            error_message = 'unknown'
+            if 'error' in res:
+                error_message = res['error']
+            print(f'Sending Error: {error_message}')
+            return False
+        self.send_log('all', 'segregation')
+        return True
+
     def send_log(self, uuid:str, system_source: str) -> None:
         data = {
             'uuid': uuid,
@@ -98,5 +137,23 @@ def post_json():
         return {'error': 'No JSON received'}, 500
 
     received_json = request.json
+    # The Preparation System sends the prepared sessions in batches
+    if isinstance(received_json, list):
+        for prepared_session in received_json:
+            JsonIO.get_instance().put_json_into_queue(prepared_session)
+    else:
+        JsonIO.get_instance().put_json_into_queue(received_json)
+    return {}, 200
+
+@app.post('/preparedsessions')
+def post_json_batch():
+    if request.json is None:
+        return {'error': 'No JSON received'}, 500
+
+    received_json = request.json
+    if not isinstance(received_json, list):
+        return {'error': 'A list of prepared sessions is expected'}, 400
+
+    # The whole batch is queued at once and stored in a single transaction
     JsonIO.get_instance().put_json_into_queue(received_json)
     return {}, 200
@@ -1,5 +1,7 @@
-import math
-from sklearn.model_selection import train_test_split
+import json
+import zlib
+import numpy as np
+from src.prepared_session_storage import FEATURES
 
 class LearningSetsGenerator:
 
@@ -7,38 +9,66 @@ class LearningSetsGenerator:
         self.segregation_system_config = config
 
     def generate_learning_sets(self, dataset):
-        # Extract features from the prepared sessions in the dataset
-        data = []
-        for prepared_session in dataset:
-            ps = prepared_session['features']
-            ps['label'] = prepared_session['label']
-            data.append(ps)
-        #print(data)
 
-
-        # train_test_split function can split the dataset only in two part,
-        # so it's needed to execute it again to obtain three sets
+        # The sizes are the share of the dataset assigned to each set
         train_size = self.segregation_system_config['train_set_size']
         validation_size = self.segregation_system_config['validation_set_size']
         test_size = self.segregation_system_config['test_set_size']
+        total_size = train_size + validation_size + test_size
 
-        test_size = math.floor((test_size / (1 - train_size)) * 100) / 100
-        validation_size = (100 - test_size * 100) / 100
+        # The split works on the indexes of the columnar dataset, each label is split
+        # in the same proportions and the fixed seed makes it reproducible across runs
+        rng = np.random.default_rng(self.segregation_system_config['split_seed'])
+        labels, label_indexes = np.unique(dataset['label'], return_inverse=True)
+        label_counts = np.bincount(label_indexes, minlength=len(labels))
 
-        train, res = train_test_split(data, train_size=train_size)
+        # Shuffle, then group the sessions by label keeping the shuffled order
+        order = rng.permutation(len(dataset))
+        grouped = order[np.argsort(label_indexes[order], kind='stable')]
 
-        if test_size > validation_size:
-            test, validation = train_test_split(res, train_size=test_size)
-        else:
-            validation, test = train_test_split(res, train_size=validation_size)
+        # Position of each grouped session among the sessions of its label
+        label_starts = np.cumsum(label_counts) - label_counts
+        positions = np.arange(len(dataset)) - np.repeat(label_starts, label_counts)
+        train_ends = np.rint(label_counts * train_size / total_size).astype(np.int64)
+        validation_ends = np.rint(label_counts * (train_size + validation_size) / total_size).astype(np.int64)
 
-        print(f"train_size: {len(train)} validation_size: {len(validation)} test_size: {len(test)}")
+        # 0 train, 1 validation, 2 test
+        sets = np.empty(len(dataset), dtype=np.int8)
+        sets[grouped] = (positions >= np.repeat(train_ends, label_counts)).astype(np.int8) + \
+            (positions >= np.repeat(validation_ends, label_counts)).astype(np.int8)
+        order_sets = sets[order]
 
-        # return the final dataset composed by the splitted dataset
         learning_sets = dict()
-        learning_sets['train'] = dict(number_of_samples=len(train), features=train)
-        learning_sets['validation']= dict(number_of_samples=len(validation), features=validation)
-        learning_sets['test'] = dict(number_of_samples=len(test), features=test)
+        learning_sets['train'] = order[order_sets == 0]
+        learning_sets['validation'] = order[order_sets == 1]
+        learning_sets['test'] = order[order_sets == 2]
+
+        print(f"train_size: {len(learning_sets['train'])} "
+              f"validation_size: {len(learning_sets['validation'])} "
+              f"test_size: {len(learning_sets['test'])}")
 
         return learning_sets
-    
\ No newline at end of file
+
+    def encode_learning_sets(self, dataset, learning_sets):
+
+        # The learning sets are streamed as gzip-compressed NDJSON: a header with the number of
+        # samples of each set, then chunks of columns that the receiver validates as they arrive
+        chunk_size = self.segregation_system_config['learning_sets_chunk_size']
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+        # lines are compressed one at a time, an empty chunk would end the transfer
+        for line in self.learning_sets_lines(dataset, learning_sets, chunk_size):
+            data = compressor.compress(json.dumps(line).encode() + b'\n')
+            if data:
+                yield data
+        yield compressor.flush()
+
+    @staticmethod
+    def learning_sets_lines(dataset, learning_sets, chunk_size):
+        names = FEATURES + ['label']
+        yield dict(number_of_samples={name: len(indexes) for name, indexes in learning_sets.items()})
+        # Only the rows of the current chunk are gathered from the dataset
+        for name, indexes in learning_sets.items():
+            for start in range(0, len(indexes), chunk_size):
+                chunk = indexes[start:start + chunk_size]
+                yield dict(set=name, columns={column: dataset[column][chunk].tolist() for column in names})
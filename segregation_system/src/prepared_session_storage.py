@@ -2,7 +2,22 @@ import os
 import sys
 import json
 import sqlite3
-from jsonschema import validate, ValidationError
+from collections import Counter
+import numpy as np
+from jsonschema import Draft7Validator
+
+# Features of the prepared sessions, as columns of the prepared_sessions table
+FEATURES = ['maximum_pressure_ts', 'minimum_pressure_ts', 'median_pressure_ts',
+            'mean_absolute_deviation_pressure_ts', 'activity_and_small_scatter',
+            'environment_and_small_scatter']
+
+# Columns of the dataset, one field of the structured array returned by load_dataset
+DATASET_DTYPE = np.dtype([('_id', object), ('calendar', object), ('environment', object)] +
+                         [(feature, np.float64) for feature in FEATURES] +
+                         [('label', object)])
+
+# Maximum number of parameters of a single query
+MAX_QUERY_PARAMETERS = 500
 
 class PreparedSessionStorage:
 
@@ -10,6 +25,15 @@ class PreparedSessionStorage:
         self.segregation_system_config = config
         self.prepared_session_counter = 0
 
+        # The schema is compiled once and checked against every received session
+        schema_path = os.path.join(os.path.abspath('.'), 'schemas', 'prepared_session_schema.json')
+        try:
+            with open(schema_path) as file:
+                self.prepared_session_validator = Draft7Validator(json.load(file))
+        except FileNotFoundError:
+            print('Failure to open prepared_session_schema.json')
+            sys.exit(1)
+
         db_name = config['db_name']
         db_path = os.path.join(os.path.abspath('.'), 'data', db_name)
         if not os.path.exists(db_path):
@@ -20,124 +44,232 @@ class PreparedSessionStorage:
         except sqlite3.Error as e:
             print(f'[-] Sqlite Connection Error [{e}]')
             sys.exit(1)
+        self.create_tables()
+        self.create_summary()
 
-    def increment_session_counter(self):
-        self.prepared_session_counter = self.prepared_session_counter + 1
+    def create_tables(self):
 
-    def check_max_sessions(self):
+        # A single table clustered on _id holds the whole prepared session
+        columns = ', '.join(f'{feature} REAL' for feature in FEATURES)
+        prepared_sessions = f"CREATE TABLE IF NOT EXISTS prepared_sessions ( \
+            _id TEXT PRIMARY KEY, calendar TEXT, environment TEXT, {columns}, label TEXT) \
+                WITHOUT ROWID"
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(prepared_sessions)
 
-        # If the sessions number is big enough a learning session set is completed
-        max_sessions = int(os.getenv('MAX_SESSIONS'))
-        if self.prepared_session_counter >= max_sessions:
-            self.prepared_session_counter = 0
-            return True
-        else:
-            return False
+            # Sessions stored in the former info and features tables are moved to the new table
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' \
+                AND name IN ('info', 'features')")
+            if len(cursor.fetchall()) == 2:
+                cursor.execute(f"INSERT OR IGNORE INTO prepared_sessions \
+                    SELECT {', '.join(DATASET_DTYPE.names)} FROM info JOIN features USING (_id)")
+                cursor.execute("DROP TABLE info")
+                cursor.execute("DROP TABLE features")
+                print("Prepared sessions moved to the prepared_sessions table")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            print(f'[-] Sqlite Execution Error [{e}]')
+            sys.exit(1)
 
-    def validate_prepared_session(self, prepared_session):
-        schema_path = os.path.join(os.path.abspath('.'), 'schemas', 'prepared_session_schema.json')
-        try:
+    def create_summary(self):
 
-            with open(schema_path) as file:
-                prepared_session_schema = json.load(file)
+        # The class counts and the feature statistics are kept up to date at every store,
+        # so the balancing and coverage stages do not need to scan the dataset
+        class_summary = "CREATE TABLE IF NOT EXISTS class_summary ( \
+            calendar TEXT PRIMARY KEY, sessions INTEGER NOT NULL)"
+        feature_summary = "CREATE TABLE IF NOT EXISTS feature_summary ( \
+            feature TEXT PRIMARY KEY, sessions INTEGER NOT NULL, minimum REAL, maximum REAL, \
+                total REAL NOT NULL, total_of_squares REAL NOT NULL)"
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(class_summary)
+            cursor.execute(feature_summary)
+            self._conn.commit()
+            summarized = cursor.execute("SELECT COALESCE(SUM(sessions), 0) FROM class_summary").fetchone()[0]
+            stored = cursor.execute("SELECT COUNT(*) FROM prepared_sessions").fetchone()[0]
+        except sqlite3.Error as e:
+            print(f'[-] Sqlite Execution Error [{e}]')
+            sys.exit(1)
 
-            validate(prepared_session, prepared_session_schema)
+        # A database filled before the summary existed is summarized once
+        if summarized != stored and not self.rebuild_summary():
+            sys.exit(1)
 
-        except FileNotFoundError:
-            print('Failure to open prepared_session_schema.json')
-            return False
+    def rebuild_summary(self):
 
-        except ValidationError:
-            print('Prepared Session validation failed')
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute("DELETE FROM class_summary")
+            cursor.execute("DELETE FROM feature_summary")
+            cursor.execute("INSERT INTO class_summary (calendar, sessions) \
+                SELECT calendar, COUNT(*) FROM prepared_sessions GROUP BY calendar")
+            for feature in FEATURES:
+                cursor.execute(f"INSERT INTO feature_summary (feature, sessions, minimum, maximum, \
+                    total, total_of_squares) SELECT ?, COUNT({feature}), MIN({feature}), \
+                        MAX({feature}), COALESCE(SUM({feature}), 0), \
+                            COALESCE(SUM({feature} * {feature}), 0) FROM prepared_sessions",
+                               (feature, ))
+            self._conn.commit()
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            print(f'[-] Sqlite Execution Error [{e}]')
             return False
 
+        print("Summary of the prepared sessions rebuilt")
         return True
 
-    def load_dataset(self):
+    def load_class_counts(self):
 
-        # devo fetchare tutto il db
-        query = "SELECT * FROM info JOIN features USING (_id)"
         cursor = self._conn.cursor()
         try:
-            cursor.execute(query)
+            cursor.execute("SELECT calendar, sessions FROM class_summary")
         except sqlite3.Error as e:
             print(f'Sqlite Execution Error [{e}]')
             return None
+        return dict(cursor.fetchall())
+
+    def load_feature_summary(self):
 
-        response = cursor.fetchall()
-        if response is None:
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute("SELECT feature, sessions, minimum, maximum, total, total_of_squares \
+                FROM feature_summary")
+        except sqlite3.Error as e:
+            print(f'Sqlite Execution Error [{e}]')
             return None
 
-        # save the dataset as a list of prepared sessions
-        dataset = []
-
-        for prepared_session in response:
-            prepared_list = list(prepared_session)
-            session = {}
-            session['_id'] = prepared_list[0]
-            session['calendar'] = prepared_list[1]
-            session['environment'] = prepared_list[2]
-            session['label'] = prepared_list[9]
-            session['features'] = {
-                'maximum_pressure_ts' : prepared_list[3],
-                'minimum_pressure_ts' : prepared_list[4],
-                'median_pressure_ts' : prepared_list[5],
-                'mean_absolute_deviation_pressure_ts' : prepared_list[6],
-                'activity_and_small_scatter' : prepared_list[7],
-                'environment_and_small_scatter' : prepared_list[8]
+        summary = {}
+        for feature, sessions, minimum, maximum, total, total_of_squares in cursor.fetchall():
+            mean = total / sessions if sessions > 0 else 0.0
+            variance = max(total_of_squares / sessions - mean * mean, 0.0) if sessions > 0 else 0.0
+            summary[feature] = {
+                'sessions': sessions,
+                'minimum': minimum,
+                'maximum': maximum,
+                'mean': mean,
+                'standard_deviation': variance ** 0.5
             }
-            dataset.append(session)
-        return dataset
+        return summary
 
-    def store_prepared_session(self, prepared_session):
+    def increment_session_counter(self, sessions=1):
+        self.prepared_session_counter = self.prepared_session_counter + sessions
 
-        # Validate before storing session
-        if not self.validate_prepared_session(prepared_session):
-            print("Invalid data")
+    def check_max_sessions(self):
+
+        # If the sessions number is big enough a learning session set is completed
+        max_sessions = int(os.getenv('MAX_SESSIONS'))
+        if self.prepared_session_counter >= max_sessions:
+            self.prepared_session_counter = 0
+            return True
+        else:
             return False
 
-        # Store the prepared session data between info e features table
-        info = "INSERT INTO info (_id, calendar, environment) \
-            VALUES(?, ?, ?)"
+    def validate_prepared_session(self, prepared_session):
+        return self.prepared_session_validator.is_valid(prepared_session)
 
-        features = "INSERT INTO features (_id, maximum_pressure_ts, minimum_pressure_ts, \
-            median_pressure_ts, mean_absolute_deviation_pressure_ts, activity_and_small_scatter, \
-                environment_and_small_scatter, label) \
-                    VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+    def load_dataset(self):
+
+        # The rows are read straight from the cursor into a structured array,
+        # so each column is available as an array without a dict per session
+        columns = ', '.join(DATASET_DTYPE.names)
+        query = f"SELECT {columns} FROM prepared_sessions"
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(query)
+            dataset = np.fromiter(cursor, dtype=DATASET_DTYPE)
+        except sqlite3.Error as e:
+            print(f'Sqlite Execution Error [{e}]')
+            return None
+
+        return dataset
+
+    def store_prepared_sessions(self, prepared_sessions):
+
+        # Validate before storing, a session received twice is stored once
+        records = {}
+        discarded = 0
+        for prepared_session in prepared_sessions:
+            # An element that is not an object has no _id, it is discarded as well
+            if not isinstance(prepared_session, dict):
+                discarded += 1
+                print("Invalid prepared session discarded (not an object)")
+                continue
+            if not self.validate_prepared_session(prepared_session):
+                discarded += 1
+                print(f"Invalid prepared session discarded (_id: {prepared_session.get('_id')})")
+                continue
+            records[prepared_session['_id']] = (
+                prepared_session['_id'],
+                prepared_session['calendar'],
+                prepared_session['environment'],
+                *(prepared_session['features'][feature] for feature in FEATURES),
+                prepared_session['label'])
+        if discarded:
+            print(f"{discarded} invalid prepared sessions discarded from the batch")
+        if not records:
+            return 0
+
+        columns = ', '.join(DATASET_DTYPE.names)
+        parameters = ', '.join('?' * len(DATASET_DTYPE.names))
+        insert = f"INSERT INTO prepared_sessions ({columns}) VALUES ({parameters})"
 
         cursor = self._conn.cursor()
 
         try:
-            cursor.execute(info, (prepared_session['_id'],
-                                   prepared_session['calendar'],
-                                   prepared_session['environment']))
-
-            cursor.execute(features, (prepared_session['_id'],
-                           prepared_session['features']['maximum_pressure_ts'],
-                           prepared_session['features']['minimum_pressure_ts'],
-                           prepared_session['features']['median_pressure_ts'],
-                           prepared_session['features']['mean_absolute_deviation_pressure_ts'],
-                           prepared_session['features']['activity_and_small_scatter'],
-                           prepared_session['features']['environment_and_small_scatter'],
-                           prepared_session['label']))
+            # Sessions already in the database are skipped
+            ids = list(records)
+            for start in range(0, len(ids), MAX_QUERY_PARAMETERS):
+                chunk = ids[start:start + MAX_QUERY_PARAMETERS]
+                cursor.execute(f"SELECT _id FROM prepared_sessions WHERE _id IN \
+                    ({', '.join('?' * len(chunk))})", chunk)
+                for (stored_id, ) in cursor.fetchall():
+                    print(f"Prepared session already stored (_id: {stored_id})")
+                    del records[stored_id]
+            records = list(records.values())
 
+            # The whole batch and its summary are stored in a single transaction
+            cursor.executemany(insert, records)
+            self.update_summary(cursor, records)
             self._conn.commit()
         except sqlite3.Error as e:
+            self._conn.rollback()
             print(f"[-] Sqlite Execution Error [{e}]")
-            return False
+            return 0
 
-        print(f"Stored new prepared session (_id: {prepared_session['_id']} calendar: {prepared_session['calendar']})")
-        return True
+        print(f"Stored {len(records)} new prepared sessions")
+        return len(records)
+
+    def update_summary(self, cursor, records):
+        if not records:
+            return
+
+        class_counts = Counter(record[1] for record in records)
+        cursor.executemany("INSERT INTO class_summary (calendar, sessions) VALUES (?, ?) \
+            ON CONFLICT (calendar) DO UPDATE SET sessions = sessions + excluded.sessions",
+                           class_counts.items())
+
+        values = np.array([record[3:3 + len(FEATURES)] for record in records], dtype=np.float64)
+        cursor.executemany("INSERT INTO feature_summary (feature, sessions, minimum, maximum, \
+            total, total_of_squares) VALUES (?, ?, ?, ?, ?, ?) \
+                ON CONFLICT (feature) DO UPDATE SET sessions = sessions + excluded.sessions, \
+                    minimum = MIN(COALESCE(minimum, excluded.minimum), excluded.minimum), \
+                    maximum = MAX(COALESCE(maximum, excluded.maximum), excluded.maximum), \
+                    total = total + excluded.total, \
+                    total_of_squares = total_of_squares + excluded.total_of_squares",
+                           [(feature, len(records), float(column.min()), float(column.max()),
+                             float(column.sum()), float(column @ column))
+                            for feature, column in zip(FEATURES, values.T)])
 
     def empty_db(self):
 
-        info = "DELETE FROM info"
-        features = "DELETE FROM features"
         cursor = self._conn.cursor()
 
         try:
-            cursor.execute(info)
-            cursor.execute(features)
+            cursor.execute("DELETE FROM prepared_sessions")
+            cursor.execute("DELETE FROM class_summary")
+            cursor.execute("DELETE FROM feature_summary")
             self._conn.commit()
         except sqlite3.Error as e:
             print(f"[-] Sqlite Execution Error [{e}]")
@@ -80,15 +80,17 @@ class SegregationSystem:
 
             if stage == 'store':
 
-                received_json = JsonIO.get_instance().receive()
+                # Store every prepared session already received in a single transaction
+                store_batch_size = self.segregation_system_config['store_batch_size']
+                prepared_sessions = JsonIO.get_instance().receive_batch(store_batch_size)
 
-                print(f"Received Json: {received_json}")
+                print(f"Received {len(prepared_sessions)} prepared sessions")
 
-                if collector.store_prepared_session(received_json):
-                    collector.increment_session_counter()
-                else:
-                    print(f"Failed to store prepared session: {received_json['_id']}")
+                stored_sessions = collector.store_prepared_sessions(prepared_sessions)
+                if stored_sessions == 0:
+                    print("Failed to store the prepared sessions")
                     continue
+                collector.increment_session_counter(stored_sessions)
 
                 if not collector.check_max_sessions():
                     continue
@@ -101,14 +103,14 @@ class SegregationSystem:
 
             elif stage == 'balancing':
 
-                dataset = collector.load_dataset()
-                if dataset is None:
+                class_counts = collector.load_class_counts()
+                if class_counts is None:
                     print("Unable to load the database")
                     continue
 
                 # Generate balancing chart and report
                 balancing = BalancingReportGenerator()
-                balancing_info = balancing.generate_chart(dataset)
+                balancing_info = balancing.generate_chart(class_counts)
                 balancing.generate_report(balancing_info)
 
                 # Evaluate balancing report
@@ -167,13 +169,14 @@ class SegregationSystem:
             elif stage == 'coverage':
 
                 dataset = collector.load_dataset()
-                if dataset is None:
+                feature_summary = collector.load_feature_summary()
+                if dataset is None or feature_summary is None:
                     print("Unable to load the database")
                     continue
 
                 # Generate coverage chart and report
                 coverage = CoverageReportGenerator()
-                coverage_info = coverage.generate_chart(dataset)
+                coverage_info = coverage.generate_chart(dataset, feature_summary)
 
                 # Evaluate coverage report
                 coverage.generate_report(coverage_info)
@@ -240,8 +243,10 @@ class SegregationSystem:
                 development_system_port = self.segregation_system_config['development_system_port']
                 endpoint = 'senddata'
 
-                if JsonIO.get_instance().send(
-                    development_system_ip, development_system_port, endpoint, learning_sets):
+                stream = learning.encode_learning_sets(dataset, learning_sets)
+                if JsonIO.get_instance().send_stream(
+                    development_system_ip, development_system_port, endpoint, stream,
+                        'application/x-ndjson'):
                     print("Learning sets successfully sent")
 
                     # The db is emptied in order to handle a new dataset
@@ -0,0 +1,46 @@
+import contextlib
+import importlib
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Top-level packages that every system has with the same name
+SYSTEM_PACKAGES = ('src', 'utility')
+
+
+def is_system_module(name):
+    return name.split('.')[0] in SYSTEM_PACKAGES
+
+
+@contextlib.contextmanager
+def system_context(system):
+    """
+    Runs from the folder of a system, as its Docker image does, importing its
+    src and utility packages instead of the ones of the other systems.
+    """
+    path = os.path.join(ROOT, system)
+    saved = {name: module for name, module in sys.modules.items() if is_system_module(name)}
+    for name in saved:
+        del sys.modules[name]
+    cwd = os.getcwd()
+    sys.path.insert(0, path)
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(path)
+        for name in [name for name in sys.modules if is_system_module(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved)
+
+
+@pytest.fixture(scope='module')
+def system(request):
+    """
+    Imports the modules of the system named by the SYSTEM variable of the test module.
+    """
+    os.environ.setdefault('OPERATIVE_MODE', 'development')
+    with system_context(request.module.SYSTEM):
+        yield importlib.import_module
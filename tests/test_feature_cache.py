@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+SYSTEM = 'preparation_system'
+NUM_SAMPLES = 1236
+SERIES_FEATURES = ('maximum_pressure_ts', 'minimum_pressure_ts', 'median_pressure_ts',
+                   'mean_absolute_deviation_pressure_ts')
+
+
+@pytest.fixture(scope='module')
+def modules(system):
+    return {
+        'cache': system('src.feature_cache'),
+        'system': system('src.preparation_system'),
+        'cleaning': system('src.session_cleaning'),
+        'extractor': system('src.features_extractor')
+    }
+
+
+@pytest.fixture
+def preparation(modules):
+    preparation_system = modules['system'].PreparationSystem()
+    preparation_system.feature_cache = modules['cache'].FeatureCache(max_bytes=1 << 20)
+    cleaner = modules['cleaning'].SessionCleaning()
+    extractor = modules['extractor'].FeaturesExtractor()
+
+    def prepare(raw_sessions):
+        return preparation_system.prepare_batch(raw_sessions, cleaner, extractor)
+
+    return preparation_system, prepare
+
+
+def make_raw_session(uuid, seed, missing=()):
+    time_series = np.random.default_rng(seed).uniform(0.5, 3.0, NUM_SAMPLES).round(3).tolist()
+    for position in missing:
+        time_series[position] = None
+    return {'uuid': uuid, 'calendar': 'sport', 'environment': 'plain',
+            'pressure_detected': 'Regular', 'time_series': time_series}
+
+
+def series_features(prepared_session):
+    return [prepared_session['features'][feature] for feature in SERIES_FEATURES]
+
+
+def test_duplicate_session_hits_the_cache(preparation):
+    preparation_system, prepare = preparation
+    first = prepare([make_raw_session('a', seed=1)])
+    again = prepare([make_raw_session('a', seed=1)])
+    statistics = preparation_system.feature_cache.get_statistics()
+    assert statistics['hits'] == 1
+    assert statistics['misses'] == 1
+    assert series_features(again[0]) == series_features(first[0])
+
+
+def test_changed_time_series_is_not_a_hit(preparation):
+    preparation_system, prepare = preparation
+    prepare([make_raw_session('a', seed=1)])
+    prepare([make_raw_session('a', seed=2)])
+    statistics = preparation_system.feature_cache.get_statistics()
+    assert statistics['hits'] == 0
+    assert statistics['entries'] == 2
+
+
+def test_cached_session_is_not_discarded(preparation):
+    preparation_system, prepare = preparation
+    # A recoverable missing sample is interpolated the first time, the cache returns the result
+    raw_session = make_raw_session('a', seed=1, missing=(100, ))
+    first = prepare([raw_session])
+    again = prepare([make_raw_session('a', seed=1, missing=(100, ))])
+    assert preparation_system.feature_cache.get_statistics()['hits'] == 1
+    assert len(first) == len(again) == 1
+    assert series_features(again[0]) == series_features(first[0])
+
+
+def test_unrecoverable_session_stays_discarded(preparation):
+    preparation_system, prepare = preparation
+    assert prepare([make_raw_session('a', seed=1, missing=(0, ))]) == []
+    assert prepare([make_raw_session('a', seed=1, missing=(0, ))]) == []
+    assert preparation_system.feature_cache.get_statistics()['hits'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(modules):
+    feature_cache = modules['cache']
+    keys = [feature_cache.FeatureCache.make_key(str(i), np.full(NUM_SAMPLES, float(i)))
+            for i in range(3)]
+    value = (3.0, 0.5, 1.5, 0.25)
+    size = feature_cache.FeatureCache.entry_size(keys[0], value)
+    cache = feature_cache.FeatureCache(max_bytes=2 * size)
+    cache.put(keys[0], value)
+    cache.put(keys[1], value)
+    # The first entry becomes the most recently used, the second one is evicted
+    assert cache.get(keys[0]) == value
+    cache.put(keys[2], value)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == value
+    assert cache.get(keys[2]) == value
+    statistics = cache.get_statistics()
+    assert statistics['evictions'] == 1
+    assert statistics['entries'] == 2
+    assert statistics['used_bytes'] <= statistics['max_bytes']
+
+
+def test_entry_larger_than_the_cache_is_not_stored(modules):
+    feature_cache = modules['cache']
+    key = feature_cache.FeatureCache.make_key('a', np.zeros(NUM_SAMPLES))
+    value = (3.0, 0.5, 1.5, 0.25)
+    cache = feature_cache.FeatureCache(max_bytes=feature_cache.FeatureCache.entry_size(key, value) - 1)
+    cache.put(key, value)
+    assert cache.get(key) is None
+    assert cache.get_statistics()['used_bytes'] == 0
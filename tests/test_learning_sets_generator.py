@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+SYSTEM = 'segregation_system'
+CONFIG = {'train_set_size': 0.7, 'validation_set_size': 0.2, 'test_set_size': 0.1, 'split_seed': 42}
+LABEL_COUNTS = {'Regular': 503, 'Anomalous': 131, 'None': 7}
+
+
+@pytest.fixture(scope='module')
+def modules(system):
+    return {
+        'generator': system('src.learning_sets_generator'),
+        'storage': system('src.prepared_session_storage')
+    }
+
+
+@pytest.fixture(scope='module')
+def dataset(modules):
+    labels = [label for label, count in LABEL_COUNTS.items() for _ in range(count)]
+    np.random.default_rng(0).shuffle(labels)
+    dataset = np.zeros(len(labels), dtype=modules['storage'].DATASET_DTYPE)
+    dataset['_id'] = [f'session-{i}' for i in range(len(labels))]
+    dataset['label'] = labels
+    return dataset
+
+
+def split(modules, dataset, **config):
+    generator = modules['generator'].LearningSetsGenerator(dict(CONFIG, **config))
+    return generator.generate_learning_sets(dataset)
+
+
+def test_same_seed_gives_the_same_split(modules, dataset):
+    first = split(modules, dataset)
+    second = split(modules, dataset)
+    for name in ('train', 'validation', 'test'):
+        assert np.array_equal(first[name], second[name])
+    other = split(modules, dataset, split_seed=7)
+    assert not np.array_equal(first['train'], other['train'])
+
+
+def test_sets_do_not_overlap_and_cover_the_dataset(modules, dataset):
+    learning_sets = split(modules, dataset)
+    indexes = np.concatenate([learning_sets[name] for name in ('train', 'validation', 'test')])
+    assert len(indexes) == len(dataset)
+    assert np.array_equal(np.sort(indexes), np.arange(len(dataset)))
+
+
+def test_every_label_is_split_with_the_configured_ratios(modules, dataset):
+    learning_sets = split(modules, dataset)
+    for label, count in LABEL_COUNTS.items():
+        train = np.count_nonzero(dataset['label'][learning_sets['train']] == label)
+        validation = np.count_nonzero(dataset['label'][learning_sets['validation']] == label)
+        test = np.count_nonzero(dataset['label'][learning_sets['test']] == label)
+        assert train + validation + test == count
+        # The boundaries of each label are rounded to the nearest session
+        assert train == round(count * 0.7)
+        assert train + validation == round(count * 0.9)
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+
+SYSTEM = 'ingestion_system'
+
+
+@pytest.fixture(scope='module')
+def outbound_dispatcher(system):
+    return system('src.outbound_dispatcher')
+
+
+class Destination(ThreadingHTTPServer):
+    """
+    Destination that records the messages it accepts, or answers 503 while it is down
+    """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), DestinationHandler)
+        self.down = False
+        self.received = []
+        self.url = f'http://127.0.0.1:{self.server_address[1]}/'
+
+
+class DestinationHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.down:
+            self.send_response(503)
+        else:
+            self.server.received.append(json.loads(body))
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def destination():
+    server = Destination()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(outbound_dispatcher, spill_dir):
+    return outbound_dispatcher.OutboundDispatcher(queue_size=10, max_retries=1, backoff_ms=1,
+                                                  spill_dir=str(spill_dir))
+
+
+def make_destination(dispatcher, url):
+    """
+    Destination registered without its sender thread, so the test drives the replay
+    """
+    return {'name': 'preparation', 'url': url, 'durable': True,
+            'session': requests.Session(), 'encoder': None, 'encoder_headers': None,
+            'spill_path': os.path.join(dispatcher.spill_dir, 'preparation.ndjson'),
+            'spill_lock': threading.Lock()}
+
+
+def write_spill(path, messages):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='UTF-8') as f:
+        f.writelines(json.dumps(message) + '\n' for message in messages)
+
+
+def spilled_messages(path):
+    messages = []
+    for suffix in ('.replaying', ''):
+        if os.path.exists(path + suffix):
+            with open(path + suffix, 'r', encoding='UTF-8') as f:
+                messages += [json.loads(line) for line in f if line.strip()]
+    return messages
+
+
+def test_spill_file_is_deleted_only_after_the_replay_succeeds(outbound_dispatcher, destination,
+                                                             tmp_path):
+    dispatcher = make_dispatcher(outbound_dispatcher, tmp_path / 'spill')
+    target = make_destination(dispatcher, destination.url)
+    messages = [{'uuid': str(i)} for i in range(3)]
+    write_spill(target['spill_path'], messages)
+
+    destination.down = True
+    assert not dispatcher.replay(target)
+    # Nothing was delivered, every message is still on disk
+    assert spilled_messages(target['spill_path']) == messages
+
+    destination.down = False
+    assert dispatcher.replay(target)
+    assert destination.received == messages
+    assert not os.path.exists(target['spill_path'])
+    assert not os.path.exists(target['spill_path'] + '.replaying')
+
+
+def test_interrupted_replay_keeps_only_the_messages_not_delivered(outbound_dispatcher, destination,
+                                                                  tmp_path):
+    dispatcher = make_dispatcher(outbound_dispatcher, tmp_path / 'spill')
+    target = make_destination(dispatcher, destination.url)
+    messages = [{'uuid': str(i)} for i in range(4)]
+    write_spill(target['spill_path'], messages)
+
+    # The destination goes down after the second message
+    original = dispatcher.post
+
+    def post(destination_, data):
+        destination.down = len(destination.received) == 2
+        return original(destination_, data)
+
+    dispatcher.post = post
+    assert not dispatcher.replay(target)
+    assert spilled_messages(target['spill_path']) == messages[2:]
+
+    dispatcher.post = original
+    destination.down = False
+    assert dispatcher.replay(target)
+    assert destination.received == messages
+    assert spilled_messages(target['spill_path']) == []
+
+
+def test_spilled_messages_are_sent_before_the_new_ones(outbound_dispatcher, destination, tmp_path):
+    dispatcher = make_dispatcher(outbound_dispatcher, tmp_path / 'spill')
+    spilled = [{'uuid': 'spilled-0'}, {'uuid': 'spilled-1'}]
+    write_spill(os.path.join(dispatcher.spill_dir, 'preparation.ndjson'), spilled)
+
+    # The destination is down at the restart, so the first replay fails
+    destination.down = True
+    dispatcher.add_destination('preparation', destination.url)
+    time.sleep(0.2)
+    # It is back before the next periodic replay, when new messages arrive
+    destination.down = False
+    new = [{'uuid': 'new-0'}, {'uuid': 'new-1'}]
+    for message in new:
+        assert dispatcher.dispatch('preparation', message)
+
+    deadline = time.monotonic() + 5
+    while len(destination.received) < 4 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert destination.received == spilled + new
@@ -0,0 +1,108 @@
+import os
+import time
+import pytest
+
+SYSTEM = 'ingestion_system'
+NUM_SAMPLES = 1236
+
+
+@pytest.fixture(scope='module')
+def modules(system):
+    os.environ.setdefault('EVALUATION', '0')
+    return {
+        'system': system('src.ingestion_system'),
+        'journal': system('src.raw_sessions_journal')
+    }
+
+
+def make_ingestion_system(modules):
+    class TestIngestionSystem(modules['system'].IngestionSystem):
+        def __init__(self):
+            super().__init__()
+            self.sent = {}
+
+        def send(self, data, dest_system):
+            if dest_system == 'preparation':
+                self.sent[data['uuid']] = data
+            return True
+
+    return TestIngestionSystem()
+
+
+def wait_until_committed(journal, timeout=5):
+    """
+    Waits for the writer thread to commit every enqueued operation
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if journal.store is not None and journal.operations.empty() and \
+                journal.store.pending_writes == 0:
+            return
+        time.sleep(0.01)
+    raise TimeoutError('journal not committed')
+
+
+def test_sessions_are_recovered_after_a_crash(modules, tmp_path):
+    db_path = str(tmp_path / 'journal.db')
+    short_time_series = [0.5 * (i % 7) for i in range(100)]
+    short_time_series[40] = None
+    full_time_series = [1.5] * NUM_SAMPLES
+
+    crashed = make_ingestion_system(modules)
+    crashed.start_assembly(db_path=db_path)
+    for record in [{'uuid': 'short', 'calendar': 'sport'},
+                   {'uuid': 'short', 'time_series': short_time_series},
+                   {'uuid': 'full', 'environment': 'plain'},
+                   {'uuid': 'full', 'time_series': full_time_series},
+                   {'uuid': 'header', 'calendar': 'cooking'},
+                   {'uuid': 'header', 'environment': 'house'},
+                   {'uuid': 'header', 'pressure_detected': 'Anomalous'},
+                   {'uuid': 'sent', 'calendar': 'gaming'},
+                   {'uuid': 'sent', 'environment': 'slope'},
+                   {'uuid': 'sent', 'pressure_detected': 'Regular'},
+                   {'uuid': 'sent', 'time_series': full_time_series}]:
+        crashed.handle_record(record)
+    assert list(crashed.sent) == ['sent']
+    wait_until_committed(crashed.session_assembler.journal)
+
+    # The process dies without closing the journal, a new one recovers its sessions
+    recovered = modules['journal'].RawSessionsJournal.recover(horizon=300, db_path=db_path)
+    sessions = {session['uuid']: session for session in recovered}
+    assert sorted(sessions) == ['full', 'header', 'short']
+    assert sessions['short']['calendar'] == 'sport'
+    assert sessions['short']['environment'] is None
+    # The time series keeps its received length and its missing sample
+    assert sessions['short']['time_series'] == short_time_series
+    assert sessions['full']['time_series'] == full_time_series
+    assert sessions['header']['time_series'] is None
+
+    restarted = make_ingestion_system(modules)
+    restarted.start_assembly(db_path=db_path)
+    assert sorted(restarted.session_assembler.sessions) == ['full', 'header', 'short']
+    for record in [{'uuid': 'short', 'environment': 'track'},
+                   {'uuid': 'short', 'pressure_detected': 'Regular'},
+                   {'uuid': 'full', 'calendar': 'sport'},
+                   {'uuid': 'full', 'pressure_detected': 'Anomalous'},
+                   {'uuid': 'header', 'time_series': full_time_series}]:
+        restarted.handle_record(record)
+    assert sorted(restarted.sent) == ['full', 'header', 'short']
+    assert restarted.sent['short']['time_series'] == short_time_series
+    assert restarted.sent['short']['missing_samples'] == [40]
+    assert restarted.sent['full']['time_series'] == full_time_series
+    assert restarted.sent['header']['calendar'] == 'cooking'
+
+    # The sessions sent are deleted from the journal
+    wait_until_committed(restarted.session_assembler.journal)
+    assert modules['journal'].RawSessionsJournal.recover(horizon=300, db_path=db_path) == []
+    crashed.session_assembler.journal.close()
+    restarted.session_assembler.journal.close()
+
+
+def test_sessions_older_than_the_horizon_are_not_recovered(modules, tmp_path):
+    db_path = str(tmp_path / 'journal.db')
+    journal = modules['journal'].RawSessionsJournal(db_path=db_path)
+    journal.append_record({'uuid': 'old', 'calendar': 'sport'}, 'calendar')
+    wait_until_committed(journal)
+    journal.close()
+    time.sleep(0.05)
+    assert modules['journal'].RawSessionsJournal.recover(horizon=0.01, db_path=db_path) == []
@@ -0,0 +1,99 @@
+import random
+import pytest
+
+SYSTEM = 'ingestion_system'
+NUM_SAMPLES = 1236
+
+
+@pytest.fixture(scope='module')
+def session_assembler(system):
+    return system('src.session_assembler')
+
+
+def make_records(uuid, pressure_detected='Regular'):
+    return [
+        {'uuid': uuid, 'calendar': 'sport'},
+        {'uuid': uuid, 'environment': 'plain'},
+        {'uuid': uuid, 'pressure_detected': pressure_detected},
+        {'uuid': uuid, 'time_series': [1.0] * NUM_SAMPLES}
+    ]
+
+
+def feed(assembler, records):
+    """
+    Adds the records in order and returns the uuids of the sessions completed by each record
+    """
+    completed = []
+    for record in records:
+        assert assembler.add_record(record)
+        if assembler.is_session_complete(record['uuid'], last_missing_sample=False, evaluation=False):
+            completed.append(record['uuid'])
+            assembler.pop_raw_session(record['uuid'])
+    return completed
+
+
+@pytest.mark.parametrize('order', [[0, 1, 2, 3], [3, 2, 1, 0], [2, 0, 3, 1], [1, 3, 0, 2]])
+def test_session_is_complete_only_with_every_record(session_assembler, order):
+    assembler = session_assembler.SessionAssembler(operative_mode='development')
+    records = [make_records('a')[i] for i in order]
+    for record in records[:-1]:
+        assembler.add_record(record)
+        assert not assembler.is_session_complete('a', last_missing_sample=False, evaluation=False)
+    assembler.add_record(records[-1])
+    assert assembler.is_session_complete('a', last_missing_sample=False, evaluation=False)
+    raw_session = assembler.pop_raw_session('a')
+    assert raw_session['calendar'] == 'sport'
+    assert raw_session['environment'] == 'plain'
+    assert raw_session['pressure_detected'] == 'Regular'
+    assert raw_session['time_series'] == [1.0] * NUM_SAMPLES
+    assert not assembler.session_exists('a')
+
+
+def test_interleaved_sessions_are_assembled_independently(session_assembler):
+    assembler = session_assembler.SessionAssembler(operative_mode='development')
+    sessions = {f'session-{i}': make_records(f'session-{i}') for i in range(20)}
+    records = [record for session in sessions.values() for record in session]
+    random.Random(7).shuffle(records)
+    completed = feed(assembler, records)
+    assert sorted(completed) == sorted(sessions)
+    # Every session completes on its last record, not before
+    last_records = {}
+    for position, record in enumerate(records):
+        last_records[record['uuid']] = position
+    assert completed == sorted(last_records, key=last_records.get)
+    assert not assembler.sessions
+
+
+def test_duplicated_record_does_not_complete_a_session(session_assembler):
+    assembler = session_assembler.SessionAssembler(operative_mode='development')
+    calendar, environment, _, time_series = make_records('a')
+    assert feed(assembler, [calendar, environment, calendar, time_series, environment]) == []
+    assert assembler.session_exists('a')
+
+
+def test_label_is_required_only_in_development_or_evaluation(session_assembler):
+    records = [record for record in make_records('a') if 'pressure_detected' not in record]
+    production = session_assembler.SessionAssembler(operative_mode='production')
+    development = session_assembler.SessionAssembler(operative_mode='development')
+    for record in records:
+        production.add_record(record)
+        development.add_record(record)
+    assert production.is_session_complete('a', last_missing_sample=False, evaluation=False)
+    assert not production.is_session_complete('a', last_missing_sample=False, evaluation=True)
+    assert not development.is_session_complete('a', last_missing_sample=False, evaluation=False)
+
+
+def test_time_series_is_not_required_after_the_last_missing_sample(session_assembler):
+    assembler = session_assembler.SessionAssembler(operative_mode='development')
+    for record in make_records('a')[:3]:
+        assembler.add_record(record)
+    assert not assembler.is_session_complete('a', last_missing_sample=False, evaluation=False)
+    assert assembler.is_session_complete('a', last_missing_sample=True, evaluation=False)
+
+
+def test_invalid_record_is_discarded(session_assembler):
+    assembler = session_assembler.SessionAssembler(operative_mode='development')
+    assert not assembler.add_record({'uuid': 'a', 'calendar': 'unknown'})
+    assert not assembler.add_record({'uuid': 'a', 'time_series': [1.0, 'x']})
+    assert not assembler.add_record(['a'])
+    assert not assembler.session_exists('a')
@@ -0,0 +1,102 @@
+import os
+import pytest
+
+SYSTEM = 'ingestion_system'
+NUM_SAMPLES = 1236
+
+
+@pytest.fixture(scope='module')
+def session_tracker(system):
+    return system('src.session_tracker')
+
+
+@pytest.fixture(scope='module')
+def ingestion_system(system):
+    os.environ.setdefault('EVALUATION', '0')
+    return system('src.ingestion_system')
+
+
+def test_session_expires_after_the_timeout(session_tracker):
+    tracker = session_tracker.SessionTracker(session_timeout=5)
+    tracker.touch('a', now=100)
+    assert tracker.pop_expired(now=104.9) == []
+    assert tracker.time_to_next_deadline(now=104) == pytest.approx(1)
+    assert tracker.pop_expired(now=105) == ['a']
+    assert len(tracker) == 0
+    assert tracker.time_to_next_deadline(now=105) is None
+
+
+def test_touch_moves_the_deadline_forward(session_tracker):
+    tracker = session_tracker.SessionTracker(session_timeout=5)
+    tracker.touch('a', now=100)
+    tracker.touch('b', now=101)
+    tracker.touch('a', now=103)
+    # The outdated deadline of a is skipped
+    assert tracker.pop_expired(now=106) == ['b']
+    assert tracker.time_to_next_deadline(now=106) == pytest.approx(2)
+    assert tracker.pop_expired(now=108) == ['a']
+
+
+def test_sessions_expire_oldest_first(session_tracker):
+    tracker = session_tracker.SessionTracker(session_timeout=5)
+    for i, uuid in enumerate(['c', 'a', 'd', 'b']):
+        tracker.touch(uuid, now=100 + i)
+    assert tracker.pop_expired(now=200) == ['c', 'a', 'd', 'b']
+
+
+def test_removed_session_does_not_expire(session_tracker):
+    tracker = session_tracker.SessionTracker(session_timeout=5)
+    tracker.touch('a', now=100)
+    tracker.touch('b', now=100)
+    tracker.remove('a')
+    assert len(tracker) == 1
+    assert tracker.pop_expired(now=200) == ['b']
+
+
+def test_outdated_entries_are_compacted(session_tracker):
+    tracker = session_tracker.SessionTracker(session_timeout=5)
+    for now in range(1000):
+        tracker.touch('a', now=now)
+    assert len(tracker.heap) <= 2 * len(tracker) + 64
+    assert tracker.pop_expired(now=1003) == []
+    assert tracker.pop_expired(now=1004) == ['a']
+
+
+def test_expired_sessions_are_closed_by_the_ingestion_loop(ingestion_system, tmp_path):
+    class TestIngestionSystem(ingestion_system.IngestionSystem):
+        def __init__(self):
+            super().__init__()
+            self.sent = []
+
+        def send(self, data, dest_system):
+            if dest_system == 'preparation':
+                self.sent.append(data['uuid'])
+            return True
+
+    system = TestIngestionSystem()
+    system.start_assembly(db_path=str(tmp_path / 'journal.db'))
+    timeout = system.configuration.session_timeout
+    records = {
+        # Every record but the time series: complete once no more records are expected
+        'without-time-series': [{'uuid': 'without-time-series', 'calendar': 'sport'},
+                                {'uuid': 'without-time-series', 'environment': 'plain'},
+                                {'uuid': 'without-time-series', 'pressure_detected': 'Regular'}],
+        # The environment is lost: the session is discarded
+        'without-environment': [{'uuid': 'without-environment', 'calendar': 'sport'},
+                                {'uuid': 'without-environment', 'pressure_detected': 'Regular'},
+                                {'uuid': 'without-environment',
+                                 'time_series': [1.0] * NUM_SAMPLES}]
+    }
+    for session in zip(*records.values()):
+        for record in session:
+            system.handle_record(record)
+    start = min(system.session_tracker.deadlines.values()) - timeout
+    system.expire_sessions(now=start + timeout / 2)
+    assert system.sent == []
+    assert len(system.session_tracker) == 2
+
+    system.expire_sessions(now=start + 2 * timeout)
+    assert len(system.session_tracker) == 0
+    assert not system.session_assembler.sessions
+    assert system.sent == ['without-time-series']
+    system.session_assembler.journal.close()
@@ -0,0 +1,56 @@
+import importlib.util
+import math
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODEC_PATHS = {
+    'ingestion': os.path.join(ROOT, 'ingestion_system', 'src', 'time_series_codec.py'),
+    'preparation': os.path.join(ROOT, 'preparation_system', 'src', 'time_series_codec.py')
+}
+
+
+def load_codec(system):
+    spec = importlib.util.spec_from_file_location(f'{system}_time_series_codec', CODEC_PATHS[system])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='module')
+def codecs():
+    return {system: load_codec(system) for system in CODEC_PATHS}
+
+
+def test_copies_are_identical():
+    with open(CODEC_PATHS['ingestion'], 'rb') as ingestion, \
+            open(CODEC_PATHS['preparation'], 'rb') as preparation:
+        assert ingestion.read() == preparation.read()
+
+
+def test_wire_format_constants_match(codecs):
+    assert codecs['ingestion'].ENCODING == codecs['preparation'].ENCODING
+    assert codecs['ingestion'].ENCODING_HEADER == codecs['preparation'].ENCODING_HEADER
+
+
+@pytest.mark.parametrize('time_series', [
+    [],
+    [None],
+    [1.5, None, -0.25, 0.0, None, 3.0, 2.75, 1.0, None],
+    [float(i) / 8 for i in range(1236)]
+])
+def test_ingestion_encoding_is_decoded_by_preparation(codecs, time_series):
+    encoded = codecs['ingestion'].TimeSeriesCodec.encode(time_series)
+    assert encoded == codecs['preparation'].TimeSeriesCodec.encode(time_series)
+    decoded = codecs['preparation'].TimeSeriesCodec.decode(encoded)
+    assert len(decoded) == len(time_series)
+    for sample, expected in zip(decoded, time_series):
+        if expected is None:
+            assert sample is None
+        else:
+            assert math.isclose(sample, expected, rel_tol=1e-6)
+
+
+def test_malformed_payload_is_refused(codecs):
+    with pytest.raises(ValueError):
+        codecs['preparation'].TimeSeriesCodec.decode({'length': 3, 'samples': 'AAAA', 'validity': 'AA=='})